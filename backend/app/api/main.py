@@ -6,21 +6,58 @@ from datetime import UTC, datetime
 from typing import Optional
 
 from beanie import PydanticObjectId
-from celery.result import AsyncResult
+from celery.states import READY_STATES
 from dotenv import load_dotenv
-from fastapi import (FastAPI, HTTPException, Request, WebSocket,
-                     WebSocketDisconnect)
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-
-from app.api.utils import (extract_conversation_summary, format_chat_history,
-                           get_user_settings)
-from app.models.chat_models import Conversation, Message, User
-from app.models.status_models import SyncStatusBeanie
-from app.services.celery import sync_folder
+from redis import RedisError
+
+from app.api.utils import (
+    CHAT_HISTORY_PAGE_SIZE,
+    CHAT_HISTORY_SUMMARY_LIMIT,
+    CHAT_MESSAGES_PAGE_SIZE,
+    PIPELINE_EXECUTOR,
+    SUMMARY_EXECUTOR,
+    AnswerStreamer,
+    answer_question,
+    encode_cursor,
+    extract_conversation_summary,
+    get_current_pipeline,
+    get_user_settings,
+    keyset_before,
+    load_conversation_memories,
+    next_summary_event,
+    schedule_conversation_summary,
+    schedule_memory_summary,
+    subscribe_summaries,
+    unsubscribe_summaries,
+)
+from app.models.chat_models import (
+    Conversation,
+    ConversationListItem,
+    Message,
+    MessageText,
+    User,
+)
+from app.models.status_models import FileManifestBeanie, SyncStatusBeanie
+from app.services.answer_cache import ANSWER_CACHE, bump_corpus_version
+from app.services.celery_app import SYNC_FOLDER_TASK, WATCH_FOLDER_TASK
+from app.services.celery_app import app as celery_app
 from app.services.database import init_mongodb_beanie, init_qdrant
-from app.services.document_stores import QDRANT_DOCUMENT_STORE
-from app.services.pipelines import build_rag_pipeline_in_qdrant
+from app.services.document_stores import (
+    delete_documents_of_folder,
+    reset_qdrant_document_store,
+)
+from app.services.settings_cache import SETTINGS_CACHE, bump_settings_version
+from app.services.watcher import is_watch_alive, touch_watch_heartbeat
 
 if os.getenv("APP_ENV", "development").lower() == "development":
     print(f'main: Loading dotenv for {os.getenv("APP_ENV", "development")} APP_ENV.')
@@ -31,10 +68,6 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 
-# global RAG_PIPELINE
-RAG_PIPELINE = 0
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("FastAPI app is starting up.")
@@ -45,8 +78,22 @@ async def lifespan(app: FastAPI):
     init_qdrant()
     print("Qdrant initiated.")
 
+    # build and warm the pipelines of the current settings before the first question,
+    # Haystack and the pipeline modules are first imported here rather than with the API
+    from app.services.pipelines import get_summary_pipeline
+
+    try:
+        await get_current_pipeline()
+        await get_current_pipeline(get_summary_pipeline)
+        print("Pipelines warmed up.")
+    except Exception as e:
+        # e.g. no API token set yet, pipelines are built once settings are complete
+        logger.warning(f"Cannot warm up pipelines: {e}")
+
     yield
     print("FastAPI app will shut down.")
+    PIPELINE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    SUMMARY_EXECUTOR.shutdown(wait=False, cancel_futures=True)
 
 
 app = FastAPI(lifespan=lifespan)
@@ -63,7 +110,13 @@ app.add_middleware(
 
 @app.get("/health")
 def health_check(request: Request):
-    return {"health": "ok"}
+    from app.services.embedding_cache import QUERY_EMBEDDING_CACHE
+
+    return {
+        "health": "ok",
+        "query_embedding_cache": QUERY_EMBEDDING_CACHE.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+    }
 
 
 @app.websocket("/ws/sync_status/{task_id}")
@@ -71,8 +124,30 @@ async def sync_status_ws(websocket: WebSocket, task_id: str):
     await websocket.accept()
     try:
         while True:
-            result = AsyncResult(task_id)
-            if result.state == "IN_PROGRESS":
+            result = celery_app.AsyncResult(task_id)
+            if (
+                result.state == "SUCCESS"
+                and (result.info or {}).get("status") == "sharded"
+            ):
+                # folder was fanned out into sub-tasks, progress is merged into the sync status record
+                sync_status = await SyncStatusBeanie.find_one(
+                    SyncStatusBeanie.task_id == task_id
+                )
+                if sync_status is None or sync_status.status == "FAILED":
+                    await websocket.send_json(
+                        {"status": "error", "detail": "Folder sync failed."}
+                    )
+                    break
+                progress = {
+                    "current": sync_status.processed_files + sync_status.skipped_files,
+                    "total": sync_status.total_files,
+                    "folder_path": sync_status.folder_path,
+                }
+                if sync_status.status == "COMPLETE":
+                    await websocket.send_json({"status": "complete", **progress})
+                    break
+                await websocket.send_json({"status": "in_progress", **progress})
+            elif result.state == "IN_PROGRESS":
                 await websocket.send_json(
                     {
                         "status": "in_progress",
@@ -110,6 +185,7 @@ async def create_user(request: CreateUserRequest):
         )
     user = User(username=request.username, timezone=request.timezone)
     await user.insert()
+    await bump_settings_version()
     return user
 
 
@@ -129,16 +205,7 @@ async def get_app_ready_status(request: Request):
             )
             return {"settings_ready": False}
 
-    global RAG_PIPELINE
-    if not RAG_PIPELINE:
-        RAG_PIPELINE = build_rag_pipeline_in_qdrant(
-            llm_provider=user_setting.llm_provider,
-            llm_model=user_setting.llm_model,
-            llm_api_token=user_setting.llm_api_token,
-        )
-        logger.info(
-            f"Initiated RAG_PIPELINE with {user_setting.llm_provider}/{user_setting.llm_model}/{user_setting.llm_api_token}"
-        )
+    await get_current_pipeline()
 
     return {"settings_ready": True}
 
@@ -149,7 +216,10 @@ class SyncedFolderRecord(BaseModel):
     total_files: int
     processed_files: int
     skipped_files: int = 0
+    unchanged_files: int = 0
+    deleted_files: int = 0
     status: str
+    watch_task_id: str | None = None
 
 
 class SyncedFoldersResponse(BaseModel):
@@ -195,44 +265,67 @@ async def delete_folder(payload: DeleteFolderPayload):
     Remove files previously upload from this folder.
     """
     if payload.directory == "all":
+        # stop watchers first so they don't re-index files while the store is reset
+        for rec in await SyncStatusBeanie.find(
+            SyncStatusBeanie.watch_task_id != None
+        ).to_list():
+            celery_app.AsyncResult(rec.watch_task_id).revoke(terminate=True)
         # remove all synced folders and files
-        all_docs = QDRANT_DOCUMENT_STORE.filter_documents()
-        doc_ids = [doc.id for doc in all_docs]
-        QDRANT_DOCUMENT_STORE.delete_documents(doc_ids)
-        logger.info(f"Deleted all {len(doc_ids)} documents.")
-        # also delete all sync records
+        await asyncio.to_thread(reset_qdrant_document_store)
+        await asyncio.to_thread(bump_corpus_version)
+        logger.info("Deleted all documents.")
+        # also delete all sync records and file manifests
         await SyncStatusBeanie.find().delete()
+        await FileManifestBeanie.find().delete()
         return
 
     sync_records = await SyncStatusBeanie.find(
         SyncStatusBeanie.folder_path == payload.directory,
         SyncStatusBeanie.home_dir == payload.home_dir,
     ).to_list()
-    source_files = []
+    source_files = set()
     for rec in sync_records:
-        source_files.extend(rec.source_files)
-
-    # delete documents
-    doc_filters = {
-        "operator": "AND",
-        "conditions": [
-            {"field": "meta.source_file", "operator": "in", "value": source_files}
-        ],
-    }
-    docs = QDRANT_DOCUMENT_STORE.filter_documents(filters=doc_filters)
-    doc_ids = [doc.id for doc in docs]
-    if len(doc_ids) > 0:
-        QDRANT_DOCUMENT_STORE.delete_documents(document_ids=doc_ids)
-        logger.info(
-            f"Deleted {len(doc_ids)} documents from {len(source_files)} source files"
+        source_files.update(rec.source_files)
+        if rec.watch_task_id:
+            celery_app.AsyncResult(rec.watch_task_id).revoke(terminate=True)
+
+    # files whose chunks were indexed before they carried the folder key
+    manifest = await FileManifestBeanie.find(
+        FileManifestBeanie.folder_path == payload.directory,
+        FileManifestBeanie.home_dir == payload.home_dir,
+    ).to_list()
+    legacy_files = list(
+        source_files - {entry.source_file for entry in manifest if entry.folder_indexed}
+    )
+    # delete documents inside Qdrant by payload filter, other synced folders keep their chunks
+    await asyncio.to_thread(delete_documents_of_folder, payload.directory, legacy_files)
+    stale_folders = {payload.directory}
+    if legacy_files:
+        # legacy chunks were shared by every synced folder of the file,
+        # forget them in the other manifests so their next sync re-indexes the files
+        other_entries = FileManifestBeanie.find(
+            {
+                "source_file": {"$in": legacy_files},
+                "folder_path": {"$ne": payload.directory},
+            }
         )
-    else:
-        logger.info(f"No documents found from {len(source_files)} source files.")
+        stale_folders.update(
+            entry.folder_path for entry in await other_entries.to_list()
+        )
+        await other_entries.delete()
+    await asyncio.to_thread(bump_corpus_version, list(stale_folders))
+    logger.info(
+        f"Deleted documents of {payload.directory}, {len(legacy_files)} files by source file."
+    )
 
     await SyncStatusBeanie.find(
         SyncStatusBeanie.folder_path == payload.directory,
         SyncStatusBeanie.home_dir == payload.home_dir,
     ).delete()
+    await FileManifestBeanie.find(
+        FileManifestBeanie.folder_path == payload.directory,
+        FileManifestBeanie.home_dir == payload.home_dir,
+    ).delete()
 
     return
 
@@ -240,6 +333,7 @@ async def delete_folder(payload: DeleteFolderPayload):
 class InsertDocumentsRequest(BaseModel):
     directory: str  # example: "~/Desktop"
     home_dir: str = "/Users"
+    shard_size: int | None = None  # files per sub-task for large folders, 0 disables
 
 
 @app.post("/insert_documents")
@@ -253,10 +347,18 @@ async def insert_documents_into_store(request: InsertDocumentsRequest):
         status="PENDING",
         task_id=None,
     ).insert()
-    task = sync_folder.delay(
-        folder_path=request.directory,
-        actual_home_dir=request.home_dir,
-        sync_status_id=str(sync_status.id),
+    task_kwargs = {}
+    if request.shard_size is not None:
+        task_kwargs["shard_size"] = request.shard_size
+    # sent by name, so the API doesn't import the ingestion code of the workers
+    task = celery_app.send_task(
+        SYNC_FOLDER_TASK,
+        kwargs=dict(
+            folder_path=request.directory,
+            actual_home_dir=request.home_dir,
+            sync_status_id=str(sync_status.id),
+            **task_kwargs,
+        ),
     )
     # then store the task ID back in Mongo
     await sync_status.set({"task_id": task.id, "status": "IN_PROGRESS"})
@@ -268,10 +370,90 @@ async def insert_documents_into_store(request: InsertDocumentsRequest):
     }
 
 
+class WatchFolderRequest(BaseModel):
+    directory: str
+    home_dir: str = "/Users"
+
+
+async def _latest_sync_record(request: WatchFolderRequest) -> SyncStatusBeanie:
+    sync_status = (
+        await SyncStatusBeanie.find(
+            SyncStatusBeanie.folder_path == request.directory,
+            SyncStatusBeanie.home_dir == request.home_dir,
+            SyncStatusBeanie.status == "COMPLETE",
+        )
+        .sort(-SyncStatusBeanie.last_synced_at)
+        .first_or_none()
+    )
+    if sync_status is None:
+        raise HTTPException(
+            status_code=404, detail=f"Folder {request.directory} is not synced yet."
+        )
+    return sync_status
+
+
+def _is_watch_task_alive(task_id: str) -> bool:
+    # a lost task stays PENDING, only its heartbeat tells it's still running
+    return celery_app.AsyncResult(task_id).state not in READY_STATES and is_watch_alive(
+        task_id
+    )
+
+
+@app.post("/watch_folder")
+async def watch_synced_folder(request: WatchFolderRequest):
+    """
+    Keep the index of a synced folder fresh: changed files are re-indexed within seconds,
+    without re-syncing the whole folder.
+    """
+    watched = await SyncStatusBeanie.find_one(
+        SyncStatusBeanie.folder_path == request.directory,
+        SyncStatusBeanie.home_dir == request.home_dir,
+        SyncStatusBeanie.watch_task_id != None,
+    )
+    if watched:
+        if await asyncio.to_thread(_is_watch_task_alive, watched.watch_task_id):
+            return {
+                "directory": request.directory,
+                "watch_task_id": watched.watch_task_id,
+            }
+        # the task ended, or its worker went away without ending it
+        logger.warning(
+            f"Watch task {watched.watch_task_id} of {request.directory} is gone, starting a new one."
+        )
+        await watched.set({"watch_task_id": None})
+    sync_status = await _latest_sync_record(request)
+    task = celery_app.send_task(
+        WATCH_FOLDER_TASK,
+        kwargs=dict(
+            folder_path=request.directory,
+            actual_home_dir=request.home_dir,
+            sync_status_id=str(sync_status.id),
+        ),
+    )
+    # alive until the task takes over its heartbeat, it may wait in the queue for a bit
+    await asyncio.to_thread(touch_watch_heartbeat, task.id)
+    await sync_status.set({"watch_task_id": task.id})
+    return {"directory": request.directory, "watch_task_id": task.id}
+
+
+@app.post("/unwatch_folder")
+async def unwatch_synced_folder(request: WatchFolderRequest):
+    watched_records = await SyncStatusBeanie.find(
+        SyncStatusBeanie.folder_path == request.directory,
+        SyncStatusBeanie.home_dir == request.home_dir,
+        SyncStatusBeanie.watch_task_id != None,
+    ).to_list()
+    for sync_status in watched_records:
+        celery_app.AsyncResult(sync_status.watch_task_id).revoke(terminate=True)
+        await sync_status.set({"watch_task_id": None})
+    return {"directory": request.directory, "watch_task_id": None}
+
+
 class SearchRequest(BaseModel):
     question: str
     # user_id: str | None = "67e83a39a5c04b8d46acd180"
     conversation_id: str | None = None
+    folder: str | None = None  # only search documents of this synced folder
 
 
 # Endpoint to accept search requests
@@ -283,34 +465,20 @@ async def search_documents(request: SearchRequest):
     """
     # user = await User.get(request.user_id)
     conversation = None
-    prev_messages = []
+    memories = []
     utcnow = datetime.now(tz=UTC)
     if getattr(request, "conversation_id", None):
         conversation = await Conversation.get(request.conversation_id)
-        prev_messages = await Message.find(
-            Message.conversation.id == PydanticObjectId(conversation.id)
-        ).to_list()
+        memories = await load_conversation_memories(conversation)
     else:
         conversation = Conversation(created_at=utcnow)
         await conversation.insert()
 
-    memories = format_chat_history(prev_messages)
     question = request.question
 
-    user_setting = await get_user_settings()
-    RAG_PIPELINE = build_rag_pipeline_in_qdrant(
-        llm_provider=user_setting.llm_provider,
-        llm_model=user_setting.llm_model,
-        llm_api_token=user_setting.llm_api_token,
-    )
     try:
-        answer_raw = RAG_PIPELINE.run(
-            data={
-                "text_embedder": {"text": question},
-                "prompt_builder": {"query": question, "memories": memories},
-                "answer_builder": {"query": question},
-            }
-        )
+        rag_pipeline = await get_current_pipeline()
+        answer = await answer_question(rag_pipeline, question, request.folder, memories)
     except Exception as e:
         logger.exception(e)
         return {
@@ -320,39 +488,29 @@ async def search_documents(request: SearchRequest):
         }
 
     answer_utcnow = datetime.now(tz=UTC)
-    # logger.debug(f"user_id={str(user.id)}, conversation_id={str(conversation.id)}, {answer_raw=}")
-
-    top_answer = answer_raw["answer_builder"]["answers"][0]
-    # extract relevant documents
-    documents = [
-        (
-            lambda d: {
-                "id": d.id,
-                "score": d.score,
-                "file_path": d.meta["file_path"],
-                "source_id": d.meta["source_id"],
-            }
-        )(d)
-        for d in top_answer.documents
-    ]
+    # logger.debug(f"user_id={str(user.id)}, conversation_id={str(conversation.id)}, {answer=}")
+
     new_message = Message(
         conversation=conversation,
         #   user=user,
         query=question,
         query_created_at=utcnow,
-        response=top_answer.data,
-        model=top_answer.meta.get("model"),
-        finish_reason=top_answer.meta.get("finish_reason"),
-        documents=documents,
+        response=answer["answer"],
+        model=answer["model"],
+        finish_reason=answer["finish_reason"],
+        documents=answer["documents"],
         response_created_at=answer_utcnow,
     )
 
     await new_message.insert()
+    schedule_memory_summary(str(conversation.id))
+    if not conversation.summary:
+        schedule_conversation_summary(str(conversation.id))
 
     return {
         # "user_id": str(user.id) if user else None,
         "conversation_id": str(conversation.id),
-        "answer": top_answer.data,
+        "answer": answer["answer"],
     }
 
 
@@ -363,55 +521,51 @@ async def websocket_chat(websocket: WebSocket):
     """
     await websocket.accept()
     try:
-        global RAG_PIPELINE
-        if not RAG_PIPELINE:
-            user_setting = await get_user_settings()
-            RAG_PIPELINE = build_rag_pipeline_in_qdrant(
-                llm_provider=user_setting.llm_provider,
-                llm_model=user_setting.llm_model,
-                llm_api_token=user_setting.llm_api_token,
-            )
-            logger.info(
-                f"Initiated RAG_PIPELINE with {user_setting.llm_provider}/{user_setting.llm_model}/{user_setting.llm_api_token}"
-            )
-
         while True:
             data = await websocket.receive_json()
             question = data["question"]
             conversation_id = data.get("conversation_id")
             history_limit = data.get("history_limit", 10)  # default to 10 turns
+            folder = data.get("folder")  # optional synced folder to search in
 
             # Send "thinking" status immediately
             await websocket.send_json({"status": "thinking", "question": question})
 
             utcnow = datetime.now(tz=UTC)
             conversation = None
-            prev_messages = []
+            memories = []
 
             if conversation_id:
                 conversation = await Conversation.get(conversation_id)
-                prev_messages = (
-                    await Message.find(
-                        Message.conversation.id == PydanticObjectId(conversation.id)
-                    )
-                    .sort("-query_created_at")
-                    .limit(history_limit * 2)
-                    .to_list()
+                # rolling summary of older turns plus the recent turns
+                memories = await load_conversation_memories(
+                    conversation, max_turns=history_limit
                 )
             else:
                 conversation = Conversation(created_at=utcnow)
                 await conversation.insert()
 
-            memories = format_chat_history(prev_messages)
-            try:
-                answer_raw = RAG_PIPELINE.run(
-                    data={
-                        "text_embedder": {"text": question},
-                        "prompt_builder": {"query": question, "memories": memories},
-                        "answer_builder": {"query": question},
+            # send answer tokens as the generator produces them
+            async def send_token(token: str):
+                await websocket.send_json(
+                    {
+                        "status": "streaming",
+                        "conversation_id": str(conversation.id),
+                        "token": token,
                     }
                 )
+
+            streamer = AnswerStreamer(asyncio.get_running_loop())
+            sender = asyncio.create_task(streamer.stream_to(send_token))
+            try:
+                # cached per LLM settings, so settings changes apply to open connections too
+                rag_pipeline = await get_current_pipeline()
+                answer = await answer_question(
+                    rag_pipeline, question, folder, memories, streamer=streamer
+                )
             except Exception as e:
+                streamer.close()
+                await sender
                 await websocket.send_json(
                     {
                         "status": "error",
@@ -420,38 +574,31 @@ async def websocket_chat(websocket: WebSocket):
                     }
                 )
                 continue
-
-            top_answer = answer_raw["answer_builder"]["answers"][0]
-            documents = [
-                (
-                    lambda d: {
-                        "id": d.id,
-                        "score": d.score,
-                        "file_path": d.meta["file_path"],
-                        "source_id": d.meta["source_id"],
-                    }
-                )(d)
-                for d in top_answer.documents
-            ]
+            streamer.close()
+            await sender
 
             new_message = Message(
                 conversation=conversation,
                 query=question,
                 query_created_at=utcnow,
-                response=top_answer.data,
-                model=top_answer.meta.get("model"),
-                finish_reason=top_answer.meta.get("finish_reason"),
-                documents=documents,
+                response=answer["answer"],
+                model=answer["model"],
+                finish_reason=answer["finish_reason"],
+                documents=answer["documents"],
                 response_created_at=datetime.now(tz=UTC),
             )
             await new_message.insert()
+            schedule_memory_summary(str(conversation.id))
+            if not conversation.summary:
+                # title of the conversation for the history, pushed over /ws/chat_history
+                schedule_conversation_summary(str(conversation.id))
 
             await websocket.send_json(
                 {
                     "status": "complete",
                     "conversation_id": str(conversation.id),
-                    "answer": top_answer.data,
-                    "documents": documents,
+                    "answer": answer["answer"],
+                    "documents": answer["documents"],
                 }
             )
 
@@ -462,44 +609,108 @@ async def websocket_chat(websocket: WebSocket):
 class ChatHistoryResponse(BaseModel):
     conversation_id: str
     summary: str | None = None
+    # summary is being generated, pushed over /ws/chat_history when ready
+    summary_pending: bool = False
     created_at: int
 
 
-@app.get("/chat_history", response_model=list[ChatHistoryResponse])
-async def get_chat_history():
+class ChatHistoryPage(BaseModel):
+    results: list[ChatHistoryResponse]
+    # cursor of the next (older) page, None on the last page
+    next_cursor: str | None = None
+
+
+def _keyset_before(field: str, cursor: str) -> dict:
+    try:
+        return keyset_before(field, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e)})
+
+
+@app.get("/chat_history", response_model=ChatHistoryPage)
+async def get_chat_history(
+    cursor: str | None = None,
+    limit: int = Query(CHAT_HISTORY_PAGE_SIZE, ge=1, le=100),
+):
     """
-    Return all conversations stored. (won't differentiate user since atm not supporting multi user).
+    Return a page of conversations, newest first. (won't differentiate user since atm not supporting multi user).
+    Pass the returned next_cursor to get the next page.
+    Missing summaries are generated in the background instead of holding the response.
     """
-    # todo: pagination
-    # currently support past 10 conversations
-    all_conversations = (
-        await Conversation.find().sort("-created_at").limit(10).to_list()
+    query = Conversation.find()
+    if cursor:
+        query = query.find(_keyset_before("created_at", cursor))
+    # one more than the page to know if there is a next page
+    conversations = (
+        await query.sort("-created_at", "-_id")
+        .limit(limit + 1)
+        .project(ConversationListItem)
+        .to_list()
     )
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_cursor = encode_cursor(conversations[-1].created_at, conversations[-1].id)
+
     results = []
-    for convo in all_conversations:
-        convo_summary = ""
-        if convo.summary:
-            convo_summary = convo.summary
-        else:
-            extracted = await extract_conversation_summary(
-                conversation_id=str(convo.id)
-            )
-            if extracted.get("error"):
-                logger.info(
-                    f'Skipping conversation ({str(convo.id)}): {extracted.get("error")}'
-                )
-            else:
-                convo_summary = extracted.get("summary", "")
+    # summaries queued by this call, the others are left to later calls (e.g. the next page)
+    summaries_left = CHAT_HISTORY_SUMMARY_LIMIT
+    for convo in conversations:
+        summary_pending = not convo.summary and summaries_left > 0
+        if summary_pending:
+            schedule_conversation_summary(str(convo.id))
+            summaries_left -= 1
         results.append(
             {
                 "conversation_id": str(convo.id),
-                "summary": convo_summary,
+                "summary": convo.summary or "",
+                "summary_pending": summary_pending,
                 "created_at": int(
                     convo.created_at.timestamp() * 1000
                 ),  # miliseconds, for FE
             }
         )
-    return results
+    return {"results": results, "next_cursor": next_cursor}
+
+
+@app.websocket("/ws/chat_history")
+async def chat_history_ws(websocket: WebSocket):
+    """
+    Push conversation summaries as they are generated in the background, by any API replica,
+    to fill in the placeholders of `/chat_history`; or an error event to clear the placeholder.
+    """
+    await websocket.accept()
+    try:
+        subscription = await subscribe_summaries()
+    except RedisError as e:
+        logger.warning(f"Cannot subscribe to summaries: {e}")
+        await websocket.close(code=1011)
+        return
+    # clients send nothing, a receive returns when they go away
+    receive = asyncio.create_task(websocket.receive())
+    event = asyncio.create_task(next_summary_event(subscription))
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {receive, event}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if receive in done:
+                if receive.result()["type"] == "websocket.disconnect":
+                    logger.info("Client disconnected from /ws/chat_history")
+                    break
+                receive = asyncio.create_task(websocket.receive())
+            if event in done:
+                await websocket.send_json(event.result())
+                event = asyncio.create_task(next_summary_event(subscription))
+    except WebSocketDisconnect:
+        logger.info("Client disconnected from /ws/chat_history")
+    except RedisError as e:
+        logger.warning(f"Summary subscription lost: {e}")
+        await websocket.close(code=1011)
+    finally:
+        receive.cancel()
+        event.cancel()
+        await unsubscribe_summaries(subscription)
 
 
 @app.delete("/chat_history/{conversation_id}", status_code=201)
@@ -522,29 +733,52 @@ class GetChatHistoryByIdResponse(BaseModel):
     summary: Optional[str] = None
     created_at: datetime
     messages: list[MessageRecord]
+    # cursor of the previous (older) messages, None if these are the first ones
+    next_cursor: str | None = None
 
 
 @app.get("/chat_history/{conversation_id}")
-async def get_chat_history_by_id(conversation_id: str):
+async def get_chat_history_by_id(
+    conversation_id: str,
+    cursor: str | None = None,
+    limit: int = Query(CHAT_MESSAGES_PAGE_SIZE, ge=1, le=500),
+):
+    """
+    Return the latest messages of the conversation in time order, or the ones before the cursor.
+    Pass the returned next_cursor to get the older messages.
+    """
     conversation = await Conversation.get(conversation_id)
     if not conversation:
         raise HTTPException(
             status_code=400, detail={"error": "Cannot find the conversation."}
         )
 
+    query = Message.find(Message.conversation.id == PydanticObjectId(conversation.id))
+    if cursor:
+        query = query.find(_keyset_before("query_created_at", cursor))
+    # newest first to page backwards, one more than the page to know if there are older messages
     prev_messages = (
-        await Message.find(Message.conversation.id == PydanticObjectId(conversation.id))
-        .sort("query_created_at")
+        await query.sort("-query_created_at", "-_id")
+        .limit(limit + 1)
+        .project(MessageText)
         .to_list()
     )
+    next_cursor = None
+    if len(prev_messages) > limit:
+        prev_messages = prev_messages[:limit]
+        next_cursor = encode_cursor(
+            prev_messages[-1].query_created_at, prev_messages[-1].id
+        )
+
     message_list = []
-    for msg in prev_messages:
+    for msg in reversed(prev_messages):
         message_list.append({"query": msg.query, "response": msg.response})
     return {
         "conversation_id": conversation_id,
         "summary": conversation.summary,
         "created_at": conversation.created_at,
         "messages": message_list,
+        "next_cursor": next_cursor,
     }
 
 
@@ -581,6 +815,11 @@ class PatchSettingsPayload(BaseModel):
 async def patch_settings(user_id: str, payload: PatchSettingsPayload):
     curr_user = await User.get(user_id)
     assert curr_user is not None, "No users left!"
+    prev_llm_settings = (
+        curr_user.llm_provider,
+        curr_user.llm_model,
+        curr_user.llm_api_token,
+    )
 
     if getattr(payload, "locale", None) is not None:
         curr_user.locale = payload.locale
@@ -593,16 +832,24 @@ async def patch_settings(user_id: str, payload: PatchSettingsPayload):
     if getattr(payload, "llm_model", None) is not None:
         curr_user.llm_model = payload.llm_model
     await curr_user.save()
+    await SETTINGS_CACHE.update(curr_user)
 
-    # update RAG pipeline based on settings
-    global RAG_PIPELINE
-    RAG_PIPELINE = build_rag_pipeline_in_qdrant(
-        llm_provider=curr_user.llm_provider,
-        llm_model=curr_user.llm_model,
-        llm_api_token=curr_user.llm_api_token,
-    )
-    logger.info(
-        f"Updated RAG_PIPELINE with {curr_user.llm_provider}/{curr_user.llm_model}/{curr_user.llm_api_token}"
+    # rebuild pipelines only when LLM settings actually changed
+    llm_settings = (
+        curr_user.llm_provider,
+        curr_user.llm_model,
+        curr_user.llm_api_token,
     )
+    if llm_settings != prev_llm_settings:
+        from app.services.pipelines import prune_pipelines
+
+        prune_pipelines(*llm_settings)
+        try:
+            await get_current_pipeline()
+            logger.info(
+                f"Updated RAG pipeline to {curr_user.llm_provider}/{curr_user.llm_model}"
+            )
+        except Exception as e:
+            logger.warning(f"Cannot build RAG pipeline for the new settings: {e}")
 
     return curr_user
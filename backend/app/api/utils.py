@@ -1,20 +1,165 @@
+import asyncio
+import base64
+import json
 import logging
+import mimetypes
 import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import UTC, datetime
+from fnmatch import fnmatch
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
 
+import redis
+import redis.asyncio
 from beanie import PydanticObjectId
-from haystack.dataclasses import ChatMessage
 
 from app.models.chat_models import Conversation, Message, User
-from app.services.pipelines import build_summary_pipeline
+from app.services.answer_cache import ANSWER_CACHE, get_corpus_version
+from app.services.document_stores import HYBRID_RETRIEVAL
+from app.services.settings_cache import SETTINGS_CACHE
+
+# Haystack and the pipelines are imported on first use, so importing the API doesn't load them
+if TYPE_CHECKING:
+    from haystack import Pipeline
+    from haystack.dataclasses import ChatMessage, StreamingChunk
 
 logger = logging.getLogger(__name__)
 
 
-def format_chat_history(chat_history: list[Message]) -> list[ChatMessage]:
+# file types the preprocessing pipeline has a converter for, others are routed to "unclassified"
+SUPPORTED_MIME_TYPES = ["text/plain", "application/pdf", "text/markdown"]
+# file and directory names (glob patterns) never synced
+SYNC_IGNORE_PATTERNS = [
+    pattern.strip()
+    for pattern in os.getenv(
+        "SYNC_IGNORE_PATTERNS",
+        ".git,.hg,.svn,node_modules,__pycache__,.cache,.venv,venv,.tox,.Trash,"
+        ".DS_Store,*.egg-info,.mypy_cache,.pytest_cache",
+    ).split(",")
+    if pattern.strip()
+]
+SYNC_MAX_FILE_SIZE = int(os.getenv("SYNC_MAX_FILE_SIZE", 50 * 1024 * 1024))  # bytes
+
+
+# max number of RAG pipelines running at the same time, more requests wait for a free slot
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", 4))
+PIPELINE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=PIPELINE_CONCURRENCY, thread_name_prefix="pipeline"
+)
+# background summary (title) and memory updates run in their own smaller pool, never taking a slot of the answers
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 1))
+SUMMARY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=SUMMARY_CONCURRENCY, thread_name_prefix="summary"
+)
+
+# turns of a conversation sent to the LLM as they are, older ones are folded into a rolling summary
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", 3))
+# min older turns to fold into the summary at once, so the summary isn't rewritten after every turn
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", 2))
+
+# conversations per page of /chat_history, and messages per page of /chat_history/{conversation_id}
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", 20))
+CHAT_MESSAGES_PAGE_SIZE = int(os.getenv("CHAT_MESSAGES_PAGE_SIZE", 50))
+# max missing summaries one /chat_history call queues, the others are generated by later calls
+CHAT_HISTORY_SUMMARY_LIMIT = int(os.getenv("CHAT_HISTORY_SUMMARY_LIMIT", 3))
+
+
+def encode_cursor(sort_value: datetime, doc_id) -> str:
+    """
+    Opaque keyset cursor of the last document of a page: its sort time, in milliseconds like MongoDB dates,
+    and its id to break ties.
+    """
+    if sort_value.tzinfo is None:
+        # dates are read back from MongoDB as naive UTC
+        sort_value = sort_value.replace(tzinfo=UTC)
+    millis = int(sort_value.timestamp() * 1000)
+    return base64.urlsafe_b64encode(f"{millis}:{doc_id}".encode()).decode()
+
+
+def keyset_before(field: str, cursor: str) -> dict:
+    """
+    Filter of the documents after the cursor in descending (field, _id) order.
+    Raise ValueError if the cursor is not one of encode_cursor.
+    """
+    try:
+        millis, doc_id = base64.urlsafe_b64decode(cursor).decode().split(":")
+        millis = int(millis)
+        doc_id = PydanticObjectId(doc_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+    sort_value = datetime.fromtimestamp(millis // 1000, tz=UTC).replace(
+        microsecond=millis % 1000 * 1000
+    )
+    return {
+        "$or": [
+            {field: {"$lt": sort_value}},
+            {field: sort_value, "_id": {"$lt": doc_id}},
+        ]
+    }
+
+
+async def run_pipeline(
+    pipeline: "Pipeline", data: dict, executor: Executor = PIPELINE_EXECUTOR, **kwargs
+) -> dict:
+    """
+    Run a Haystack pipeline in the pipeline executor (or the given one), so the blocking embedding and LLM calls
+    don't freeze the event loop (and every other request) while they wait.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, partial(pipeline.run, data=data, **kwargs)
+    )
+
+
+class AnswerStreamer:
+    """
+    Streaming callback of the generator: forwards answer chunks, produced in the pipeline executor thread,
+    to a queue drained by the websocket handler in the event loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue: asyncio.Queue[str | None] = asyncio.Queue()
+        self.last_meta: dict = {}
+
+    def __call__(self, chunk: "StreamingChunk"):
+        self.last_meta = chunk.meta or {}
+        if chunk.content:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, chunk.content)
+
+    def __deepcopy__(self, memo):
+        # pipelines deep copy their inputs, the callback must stay bound to this queue
+        return self
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    async def stream_to(self, send):
+        """Await `send(token)` for each chunk until `close` is called."""
+        while (token := await self._queue.get()) is not None:
+            await send(token)
+
+    def reply_meta(self) -> dict:
+        """
+        Model and finish reason from the last chunk, as streamed Gemini replies keep them nested in
+        the chunk meta instead of on the reply like a non-streamed reply.
+        """
+        candidates = self.last_meta.get("candidates") or [{}]
+        return {
+            "model": self.last_meta.get("model"),
+            "finish_reason": self.last_meta.get("finish_reason")
+            or candidates[0].get("finish_reason"),
+        }
+
+
+def format_chat_history(chat_history: list[Message]) -> list["ChatMessage"]:
     """
     This is equivalent of memory retriever in https://haystack.deepset.ai/cookbook/conversational_rag_using_memory
     """
+    from haystack.dataclasses import ChatMessage
+
     memories = []
     for chat_message in chat_history:
         if chat_message.query:
@@ -38,7 +183,19 @@ def format_chat_history(chat_history: list[Message]) -> list[ChatMessage]:
     return memories
 
 
-async def extract_conversation_summary(conversation_id: str) -> dict:
+def build_retriever_filters(folder: str | None) -> dict | None:
+    """
+    Return retriever filters that scope the search to a synced folder (as in `SyncStatus.folder_path`),
+    pushed down to Qdrant as a payload filter. None searches all documents.
+    """
+    if not folder:
+        return None
+    return {"field": "meta.folder", "operator": "==", "value": folder}
+
+
+async def extract_conversation_summary(
+    conversation_id: str, executor: Executor = PIPELINE_EXECUTOR
+) -> dict:
     """
     Get or create summary for the conversation, save to database if created.
     """
@@ -59,17 +216,16 @@ async def extract_conversation_summary(conversation_id: str) -> dict:
         return {"error": "No message found in conversation."}
 
     memories = format_chat_history(prev_messages)
-    user_setting = await get_user_settings()
-    SUMMARY_PIPELINE = build_summary_pipeline(
-        llm_provider=user_setting.llm_provider,
-        llm_model=user_setting.llm_model,
-        llm_api_token=user_setting.llm_api_token,
-    )
-    answer_raw = SUMMARY_PIPELINE.run(
+    from app.services.pipelines import get_summary_pipeline
+
+    summary_pipeline = await get_current_pipeline(get_summary_pipeline)
+    answer_raw = await run_pipeline(
+        summary_pipeline,
         data={
             "prompt_builder": {"memories": memories},
             "answer_builder": {"query": "Summarize this conversation"},  # dummy query
-        }
+        },
+        executor=executor,
     )
     top_answer = answer_raw["answer_builder"]["answers"][0]
 
@@ -79,7 +235,293 @@ async def extract_conversation_summary(conversation_id: str) -> dict:
     return {"summary": conversation.summary, "conversation_id": conversation_id}
 
 
+async def load_conversation_memories(
+    conversation: Conversation, max_turns: int | None = None
+) -> list["ChatMessage"]:
+    """
+    Return the memories of the next turn: the rolling summary of older turns, then the turns not folded into it yet
+    (the last CHAT_RECENT_TURNS, a few more while the background update catches up), oldest first.
+    """
+    query = Message.find(Message.conversation.id == PydanticObjectId(conversation.id))
+    if conversation.memory_summary_until:
+        query = query.find(Message.query_created_at > conversation.memory_summary_until)
+    limit = CHAT_RECENT_TURNS + CHAT_SUMMARY_BATCH_TURNS
+    if max_turns is not None:
+        limit = min(limit, max_turns)
+    if limit <= 0:
+        return []
+    messages = await query.sort("-query_created_at").limit(limit).to_list()
+    messages.reverse()
+
+    memories = format_chat_history(messages)
+    if conversation.memory_summary:
+        from haystack.dataclasses import ChatMessage
+
+        memories.insert(
+            0,
+            ChatMessage.from_system(
+                text=f"Summary of the earlier conversation: {conversation.memory_summary}",
+                meta={"timestamp": conversation.memory_summary_until},
+            ),
+        )
+    return memories
+
+
+async def update_memory_summary(conversation_id: str):
+    """
+    Fold the turns older than the last CHAT_RECENT_TURNS into the rolling summary of the conversation,
+    once there are at least CHAT_SUMMARY_BATCH_TURNS of them.
+    """
+    conversation = await Conversation.get(conversation_id)
+    if not conversation:
+        return
+    query = Message.find(Message.conversation.id == PydanticObjectId(conversation.id))
+    if conversation.memory_summary_until:
+        query = query.find(Message.query_created_at > conversation.memory_summary_until)
+    messages = await query.sort("query_created_at").to_list()
+    to_fold = messages[: max(len(messages) - CHAT_RECENT_TURNS, 0)]
+    if len(to_fold) < CHAT_SUMMARY_BATCH_TURNS:
+        return
+
+    from app.services.pipelines import get_memory_pipeline
+
+    memory_pipeline = await get_current_pipeline(get_memory_pipeline)
+    answer_raw = await run_pipeline(
+        memory_pipeline,
+        data={
+            "prompt_builder": {
+                "summary": conversation.memory_summary or "",
+                "memories": format_chat_history(to_fold),
+            },
+            "answer_builder": {
+                "query": "Update the conversation summary"
+            },  # dummy query
+        },
+        executor=SUMMARY_EXECUTOR,
+    )
+    await conversation.set(
+        {
+            "memory_summary": answer_raw["answer_builder"]["answers"][0].data,
+            "memory_summary_until": to_fold[-1].query_created_at,
+        }
+    )
+    logger.info(f"Folded {len(to_fold)} turns into memory of {conversation_id}")
+
+
+# keys of background updates running (one per conversation and kind), and their tasks
+# (referenced so they aren't garbage collected)
+_BACKGROUND_KEYS: set[tuple[str, str]] = set()
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+
+def _schedule_once(kind: str, conversation_id: str, update):
+    """Run the update coroutine function of the conversation in the background, unless one is already running."""
+    key = (kind, conversation_id)
+    if key in _BACKGROUND_KEYS:
+        return
+    _BACKGROUND_KEYS.add(key)
+
+    async def run():
+        try:
+            await update(conversation_id)
+        except Exception as e:
+            logger.error(f"Error updating {kind} of {conversation_id}: {e}")
+        finally:
+            _BACKGROUND_KEYS.discard(key)
+
+    task = asyncio.create_task(run())
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
+def schedule_memory_summary(conversation_id: str):
+    """Update the memory summary in the background after a turn, at most one update per conversation at a time."""
+    _schedule_once("memory", conversation_id, update_memory_summary)
+
+
+# Redis channel of the generated conversation summaries, so every API replica pushes them to its /ws/chat_history clients
+SUMMARY_CHANNEL = "conversation_summaries"
+SUMMARY_REDIS_URL = os.getenv("REDIS_URL")
+
+_SUMMARY_REDIS = None
+
+
+def _summary_redis() -> redis.asyncio.Redis:
+    global _SUMMARY_REDIS
+    if _SUMMARY_REDIS is None:
+        _SUMMARY_REDIS = redis.asyncio.Redis.from_url(SUMMARY_REDIS_URL)
+    return _SUMMARY_REDIS
+
+
+async def subscribe_summaries() -> redis.asyncio.client.PubSub:
+    subscription = _summary_redis().pubsub()
+    await subscription.subscribe(SUMMARY_CHANNEL)
+    return subscription
+
+
+async def next_summary_event(subscription: redis.asyncio.client.PubSub) -> dict:
+    """Wait for the next summary event: a generated summary, or an error clearing the placeholder."""
+    while True:
+        message = await subscription.get_message(
+            ignore_subscribe_messages=True, timeout=None
+        )
+        if message is not None:
+            return json.loads(message["data"])
+
+
+async def unsubscribe_summaries(subscription: redis.asyncio.client.PubSub):
+    try:
+        await subscription.unsubscribe(SUMMARY_CHANNEL)
+        await subscription.aclose()
+    except redis.RedisError as e:
+        logger.warning(f"Cannot close summary subscription: {e}")
+
+
+async def _publish_summary_event(event: dict):
+    try:
+        await _summary_redis().publish(SUMMARY_CHANNEL, json.dumps(event))
+    except redis.RedisError as e:
+        # clients still get the summary with the next /chat_history
+        logger.warning(f"Cannot publish summary of {event['conversation_id']}: {e}")
+
+
+async def _generate_conversation_summary(conversation_id: str):
+    try:
+        result = await extract_conversation_summary(conversation_id, SUMMARY_EXECUTOR)
+    except Exception as e:
+        result = {"error": f"Summary generation failed: {e}"}
+    if result.get("error"):
+        logger.info(f"No summary for {conversation_id}: {result['error']}")
+        # the placeholder is cleared, the summary is generated again with the next /chat_history
+        await _publish_summary_event(
+            {
+                "status": "summary_error",
+                "conversation_id": conversation_id,
+                "error": result["error"],
+            }
+        )
+        return
+    await _publish_summary_event({"status": "summary", **result})
+
+
+def schedule_conversation_summary(conversation_id: str):
+    """
+    Generate the summary (title) of the conversation in the background, e.g. after its first answer,
+    and publish it to the /ws/chat_history subscribers of every API replica.
+    """
+    _schedule_once("summary", conversation_id, _generate_conversation_summary)
+
+
+async def get_current_pipeline(get_pipeline=None) -> "Pipeline":
+    """
+    Return the cached pipeline (`get_rag_pipeline` by default, or `get_summary_pipeline`) of the current LLM settings.
+    Runs in a thread as the first call for new settings builds and warms the pipeline.
+    """
+    if get_pipeline is None:
+        from app.services.pipelines import get_rag_pipeline
+
+        get_pipeline = get_rag_pipeline
+    user_setting = await get_user_settings()
+    return await asyncio.to_thread(
+        get_pipeline,
+        llm_provider=user_setting.llm_provider,
+        llm_model=user_setting.llm_model,
+        llm_api_token=user_setting.llm_api_token,
+    )
+
+
+async def _answer_cache_key(
+    rag_pipeline: "Pipeline", question: str, folder: str | None
+) -> tuple | None:
+    """Return (scope, corpus version, question embedding) for the answer cache, None if it can't be used."""
+    user_setting = await get_user_settings()
+    scope = (user_setting.llm_provider, user_setting.llm_model, folder or None)
+
+    def embed_question():
+        corpus_version = get_corpus_version(folder)
+        if corpus_version is None:
+            return None
+        # goes through the query embedding cache, so the pipeline run doesn't embed the question again
+        text_embedder = rag_pipeline.get_component("text_embedder")
+        embedding = text_embedder.run(text=question)["embedding"]
+        return scope, corpus_version, embedding
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(PIPELINE_EXECUTOR, embed_question)
+
+
+async def answer_question(
+    rag_pipeline: "Pipeline",
+    question: str,
+    folder: str | None,
+    memories: list["ChatMessage"],
+    streamer: AnswerStreamer | None = None,
+) -> dict:
+    """
+    Return the answer, its documents, model and finish reason.
+    Reuses the answer of a near-identical past question when the answer cache is enabled,
+    else runs the RAG pipeline (streaming the answer to the streamer if given).
+    """
+    cache_key = None
+    # follow-up questions depend on the conversation, only standalone questions are cached
+    if ANSWER_CACHE.enabled and not memories:
+        cache_key = await _answer_cache_key(rag_pipeline, question, folder)
+        cached = ANSWER_CACHE.lookup(*cache_key) if cache_key else None
+        if cached:
+            return {**cached, "cached": True}
+
+    data = {
+        "text_embedder": {"text": question},
+        "retriever": {"filters": build_retriever_filters(folder)},
+        "context_packer": {"memories": memories},
+        "prompt_builder": {"query": question},
+        "answer_builder": {"query": question},
+    }
+    if HYBRID_RETRIEVAL:
+        data["sparse_text_embedder"] = {"text": question}
+    from app.services.reranker import RERANKER_MODEL
+
+    if RERANKER_MODEL:
+        data["ranker"] = {"query": question}
+    if streamer:
+        data["generator"] = {"streaming_callback": streamer}
+    answer_raw = await run_pipeline(rag_pipeline, data=data)
+
+    top_answer = answer_raw["answer_builder"]["answers"][0]
+    streamed_meta = streamer.reply_meta() if streamer else {}
+    # extract relevant documents
+    documents = [
+        (
+            lambda d: {
+                "id": d.id,
+                "score": d.score,
+                "file_path": d.meta["file_path"],
+                "source_id": d.meta["source_id"],
+            }
+        )(d)
+        for d in top_answer.documents
+    ]
+    answer = {
+        "answer": top_answer.data,
+        "documents": documents,
+        "model": top_answer.meta.get("model") or streamed_meta.get("model"),
+        "finish_reason": top_answer.meta.get("finish_reason")
+        or streamed_meta.get("finish_reason"),
+    }
+    if cache_key:
+        ANSWER_CACHE.store(*cache_key, answer)
+    return {**answer, "cached": False}
+
+
 async def get_user_settings() -> User:
+    """
+    Return the settings of the (only) user, from the settings cache unless they changed since cached.
+    Creates the default user, or resets its settings, if missing.
+    """
+    cached, version = await SETTINGS_CACHE.get()
+    if cached is not None:
+        return cached
+
     users = await User.find().sort("created_at").limit(10).to_list()
     # as safeguard, only keep 1 user
     if len(users) == 0:
@@ -108,10 +550,11 @@ async def get_user_settings() -> User:
         curr_user.llm_api_token = None
         curr_user.llm_model = "gemini-2.0-flash"
         await curr_user.save()
+    SETTINGS_CACHE.store(curr_user, version)
     return curr_user
 
 
-def get_files_from_folder(folder_path: str, actual_home_dir: str) -> list[any]:
+def resolve_folder_path(folder_path: str, actual_home_dir: str) -> Path:
     output_dir = Path(folder_path).expanduser()
 
     host_home_dir = os.getenv("HOST_HOME_DIR")  # Mapped volume
@@ -122,6 +565,102 @@ def get_files_from_folder(folder_path: str, actual_home_dir: str) -> list[any]:
     if str(output_dir_str).startswith(host_home_actual):
         relative = output_dir.relative_to(host_home_actual)
         output_dir = Path(host_home_dir) / relative
-    files = [f for f in output_dir.glob("**/*") if f.is_file()]
     logger.info(f"{output_dir=} for {os.name=} and {folder_path=}.")
-    return files
+    return output_dir
+
+
+def _get_mime_type(file_name: str) -> str | None:
+    # same lookup as the pipeline's FileTypeRouter, so filtered files are exactly the ones it would route
+    from haystack.components.routers.file_type_router import CUSTOM_MIMETYPES
+
+    extension = os.path.splitext(file_name)[1].lower()
+    return CUSTOM_MIMETYPES.get(extension, mimetypes.guess_type(file_name)[0])
+
+
+def iter_files_from_folder(
+    folder_path: str,
+    actual_home_dir: str,
+    mime_types: list[str] | None = SUPPORTED_MIME_TYPES,
+    ignore_patterns: list[str] = SYNC_IGNORE_PATTERNS,
+    max_file_size: int = SYNC_MAX_FILE_SIZE,
+    unscanned: set[str] | None = None,
+) -> Iterator[Path]:
+    """
+    Yield files of the folder to sync, walking it with os.scandir.
+    Directories and files matching the ignore patterns are not entered, and files of unsupported types
+    or above the size limit (0 for no limit) are dropped before they reach the pipeline.
+    Directories and files that can't be read (e.g. permission denied) are added to `unscanned` if given,
+    so callers don't take the files under them for deleted.
+    """
+    return iter_files_under(
+        resolve_folder_path(folder_path, actual_home_dir),
+        mime_types=mime_types,
+        ignore_patterns=ignore_patterns,
+        max_file_size=max_file_size,
+        unscanned=unscanned,
+    )
+
+
+def iter_files_under(
+    directory: Path,
+    mime_types: list[str] | None = SUPPORTED_MIME_TYPES,
+    ignore_patterns: list[str] = SYNC_IGNORE_PATTERNS,
+    max_file_size: int = SYNC_MAX_FILE_SIZE,
+    unscanned: set[str] | None = None,
+) -> Iterator[Path]:
+    """Same as `iter_files_from_folder`, for an already resolved directory."""
+    stack = [directory]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if any(fnmatch(entry.name, pattern) for pattern in ignore_patterns):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        if mime_types and _get_mime_type(entry.name) not in mime_types:
+                            continue
+                        size = entry.stat().st_size if max_file_size else 0
+                    except FileNotFoundError:
+                        # removed while scanning
+                        continue
+                    except OSError as e:
+                        logger.warning(f"Cannot scan {entry.path}: {e}")
+                        if unscanned is not None:
+                            unscanned.add(entry.path)
+                        continue
+                    if max_file_size and size > max_file_size:
+                        logger.info(
+                            f"Skipped {entry.path} larger than {max_file_size=}"
+                        )
+                        continue
+                    yield Path(entry.path)
+        except OSError as e:
+            # unreadable, or gone (e.g. an unmounted volume), its files may still be there
+            logger.warning(f"Cannot scan {directory}: {e}")
+            if unscanned is not None:
+                unscanned.add(str(directory))
+
+
+def is_syncable_file(
+    file_path: Path,
+    mime_types: list[str] | None = SUPPORTED_MIME_TYPES,
+    max_file_size: int = SYNC_MAX_FILE_SIZE,
+) -> bool:
+    """Same type and size checks as `iter_files_from_folder`, for a single file."""
+    if not file_path.is_file():
+        return False
+    if mime_types and _get_mime_type(file_path.name) not in mime_types:
+        return False
+    return not max_file_size or file_path.stat().st_size <= max_file_size
+
+
+def get_files_from_folder(
+    folder_path: str, actual_home_dir: str, **kwargs
+) -> list[Path]:
+    return list(iter_files_from_folder(folder_path, actual_home_dir, **kwargs))
@@ -5,7 +5,9 @@ Define schema for the MongoDB collection that holds user chat histories.
 from datetime import UTC, datetime
 from typing import Optional
 
-from beanie import Document, Link
+from beanie import Document, Link, PydanticObjectId
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 
 class User(Document):
@@ -42,9 +44,15 @@ class Conversation(Document):
     user: Optional[Link[User]] | None = None
     created_at: datetime = datetime.now(tz=UTC)
     summary: Optional[str] | None = None
+    # rolling summary of the turns older than the recent ones sent to the LLM as they are
+    memory_summary: Optional[str] = None
+    # query time of the last turn folded into the memory summary
+    memory_summary_until: Optional[datetime] = None
 
     class Settings:
         name = "conversations"
+        # recent conversations list, paged by (created_at, _id)
+        indexes = [IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)])]
 
     class Config:
         arbitrary_types_allowed = True
@@ -67,6 +75,34 @@ class Message(Document):
 
     class Settings:
         name = "messages"
+        # turns of a conversation in time order, paged by (query_created_at, _id) both ways;
+        # links are stored as DBRefs, queried by their $id
+        indexes = [
+            IndexModel(
+                [
+                    ("conversation.$id", ASCENDING),
+                    ("query_created_at", ASCENDING),
+                    ("_id", ASCENDING),
+                ]
+            )
+        ]
 
     class Config:
         arbitrary_types_allowed = True
+
+
+class ConversationListItem(BaseModel):
+    """Projection of a conversation in the conversations list."""
+
+    id: PydanticObjectId = Field(alias="_id")
+    summary: Optional[str] = None
+    created_at: datetime
+
+
+class MessageText(BaseModel):
+    """Projection of a message to its query and response, without the retrieved documents."""
+
+    id: PydanticObjectId = Field(alias="_id")
+    query: str | None = None
+    response: str | None = None
+    query_created_at: datetime | None = None
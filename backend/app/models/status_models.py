@@ -1,6 +1,6 @@
 """
-Define schema for the MongoDB collection that holds folder syncing logs.
-Defined two models for SyncStatus, beanie (async) and bunnet (sync)
+Define schema for the MongoDB collections that hold folder syncing logs and the per-file sync manifest.
+Defined two models for SyncStatus and FileManifest, beanie (async) and bunnet (sync)
 to be used in FastAPI (mostly to read) and Celery (to write) correspondingly.
 """
 
@@ -9,6 +9,30 @@ from typing import Optional
 
 from beanie import Document as BeanieDocument
 from bunnet import Document as BunnetDocument
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# latest sync of a folder, and latest completed syncs of all folders (synced folders list)
+SYNC_STATUS_INDEXES = [
+    IndexModel(
+        [
+            ("folder_path", ASCENDING),
+            ("home_dir", ASCENDING),
+            ("status", ASCENDING),
+            ("last_synced_at", DESCENDING),
+        ]
+    ),
+    IndexModel([("status", ASCENDING), ("last_synced_at", DESCENDING)]),
+]
+# manifest entries of a synced folder, or of some of its files
+FILE_MANIFEST_INDEXES = [
+    IndexModel(
+        [
+            ("folder_path", ASCENDING),
+            ("home_dir", ASCENDING),
+            ("source_file", ASCENDING),
+        ]
+    ),
+]
 
 
 class SyncStatusBeanie(BeanieDocument):
@@ -19,14 +43,21 @@ class SyncStatusBeanie(BeanieDocument):
     total_files: int
     processed_files: int
     skipped_files: int = 0
+    unchanged_files: int = 0  # subset of processed_files that were not re-indexed
+    deleted_files: int = 0  # files removed from the folder since the last sync
     progress_percent: int
     status: str  # "PENDING", "IN_PROGRESS", "COMPLETE"
     last_synced_at: Optional[datetime] = None
     task_id: Optional[str] = None
     source_files: list[str] = []
+    shard_count: int = 0  # number of sub-tasks when the sync is fanned out, 0 if not
+    completed_shards: int = 0
+    # task keeping the folder index fresh in watch mode, None if not watched
+    watch_task_id: Optional[str] = None
 
     class Settings:
         name = "sync_status"
+        indexes = SYNC_STATUS_INDEXES
 
     class Config:
         arbitrary_types_allowed = True
@@ -40,14 +71,65 @@ class SyncStatusBunnet(BunnetDocument):
     total_files: int
     processed_files: int
     skipped_files: int = 0
+    unchanged_files: int = 0  # subset of processed_files that were not re-indexed
+    deleted_files: int = 0  # files removed from the folder since the last sync
     progress_percent: int
     status: str  # "PENDING", "IN_PROGRESS", "COMPLETE"
     last_synced_at: Optional[datetime] = None
     task_id: Optional[str] = None
     source_files: list[str] = []
+    shard_count: int = 0  # number of sub-tasks when the sync is fanned out, 0 if not
+    completed_shards: int = 0
+    # task keeping the folder index fresh in watch mode, None if not watched
+    watch_task_id: Optional[str] = None
 
     class Settings:
         name = "sync_status"
+        indexes = SYNC_STATUS_INDEXES
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class FileManifestBeanie(BeanieDocument):
+    """Async"""
+
+    folder_path: str
+    home_dir: str
+    source_file: str
+    size: int
+    mtime: float
+    content_hash: str
+    chunk_ids: list[str] = []
+    last_synced_at: Optional[datetime] = None
+    # chunks carry the folder key, indexed since it exists or backfilled once
+    folder_indexed: bool = False
+
+    class Settings:
+        name = "file_manifest"
+        indexes = FILE_MANIFEST_INDEXES
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class FileManifestBunnet(BunnetDocument):
+    """Sync"""
+
+    folder_path: str
+    home_dir: str
+    source_file: str
+    size: int
+    mtime: float
+    content_hash: str
+    chunk_ids: list[str] = []
+    last_synced_at: Optional[datetime] = None
+    # chunks carry the folder key, indexed since it exists or backfilled once
+    folder_indexed: bool = False
+
+    class Settings:
+        name = "file_manifest"
+        indexes = FILE_MANIFEST_INDEXES
 
     class Config:
         arbitrary_types_allowed = True
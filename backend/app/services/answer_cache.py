@@ -0,0 +1,163 @@
+"""
+Semantic answer cache: a new question reuses the answer of a past question with a near-identical embedding,
+asked in the same search scope, as long as the documents of that scope did not change since.
+Corpus versions live in Redis so Celery workers can invalidate answers cached by the API process.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import redis
+
+# numpy is imported on first lookup, importing the API doesn't load it
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# max number of cached answers in the API process; 0 disables the cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 0))
+# min cosine similarity between the question embeddings for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+CORPUS_VERSION_REDIS_URL = os.getenv("REDIS_URL")
+
+# hash of version counters in Redis: one per folder, one bumped on any change (for answers searched
+# across all folders) and an epoch bumped when all documents are deleted
+CORPUS_VERSION_KEY = "corpus_version"
+ALL_FOLDERS = "*"
+EPOCH = "epoch"
+
+_REDIS = None
+
+
+def _redis() -> redis.Redis:
+    global _REDIS
+    if _REDIS is None:
+        _REDIS = redis.Redis.from_url(CORPUS_VERSION_REDIS_URL)
+    return _REDIS
+
+
+def get_corpus_version(folder: str | None = None) -> str | None:
+    """
+    Return the version of the documents searched with the folder filter (all folders if None),
+    or None if it's unknown, in which case answers are not cached.
+    """
+    try:
+        epoch, version = _redis().hmget(
+            CORPUS_VERSION_KEY, EPOCH, folder or ALL_FOLDERS
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Corpus version unavailable: {e}")
+        return None
+    return f"{int(epoch or 0)}:{int(version or 0)}"
+
+
+def bump_corpus_version(folders: list[str] | None = None):
+    """
+    Invalidate cached answers grounded on documents of the folders, and answers searched across all folders.
+    Without folders, invalidate every cached answer (e.g. all documents were deleted).
+    """
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for key in folders if folders is not None else [EPOCH]:
+            pipe.hincrby(CORPUS_VERSION_KEY, key, 1)
+        pipe.hincrby(CORPUS_VERSION_KEY, ALL_FOLDERS, 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Cannot bump corpus version of {folders}: {e}")
+
+
+class AnswerCache:
+    """
+    Bounded LRU of answers, keyed by search scope (LLM settings and folder filter).
+    Lookups compare the question embedding with the ones of cached answers of the scope.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        # id -> (scope, corpus version, normalized question embedding, answer)
+        self._entries: OrderedDict[int, tuple] = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(
+        self, scope: tuple, corpus_version: str, embedding: list[float]
+    ) -> dict | None:
+        """Return the cached answer of the most similar past question above the threshold, if any."""
+        import numpy as np
+
+        query = _normalize(embedding)
+        best_id, best_similarity = None, self.similarity
+        with self._lock:
+            for entry_id, (entry_scope, version, vector, _) in self._entries.items():
+                if entry_scope != scope or version != corpus_version:
+                    continue
+                similarity = float(np.dot(query, vector))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            logger.info(f"Answer cache hit with similarity {best_similarity:.3f}")
+            return self._entries[best_id][3]
+
+    def store(
+        self,
+        scope: tuple,
+        corpus_version: str,
+        embedding: list[float],
+        answer: dict,
+    ):
+        with self._lock:
+            # drop answers of older corpus versions of the scope, they can't be hit anymore
+            for entry_id in [
+                entry_id
+                for entry_id, (entry_scope, version, _, _) in self._entries.items()
+                if entry_scope == scope and version != corpus_version
+            ]:
+                del self._entries[entry_id]
+            self._entries[self._next_id] = (
+                scope,
+                corpus_version,
+                _normalize(embedding),
+                answer,
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _normalize(embedding: list[float]) -> "np.ndarray":
+    import numpy as np
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+ANSWER_CACHE = AnswerCache()
@@ -2,22 +2,38 @@
 Process the given local folders, add embedding and save them into the document store.
 """
 
+import gc
+import itertools
 import logging
 import os
 from datetime import UTC, datetime
+from pathlib import Path
 
 from bunnet import PydanticObjectId
-from celery import Celery
-from celery.signals import worker_process_init
+from celery import chord
+from celery.signals import worker_init, worker_process_init
 from dotenv import load_dotenv
+from haystack.components.embedders import SentenceTransformersDocumentEmbedder
+from pymongo import ReturnDocument
 
-from app.api.utils import get_files_from_folder
+from app.api.utils import (is_syncable_file, iter_files_from_folder,
+                           iter_files_under, resolve_folder_path)
 from app.models.status_models import SyncStatusBunnet
+from app.services.answer_cache import bump_corpus_version
+from app.services.celery_app import app
 from app.services.database import init_mongodb_bunnet, init_qdrant
-from app.services.pipelines import (QDRANT_DOCUMENT_STORE,
-                                    SentenceTransformersDocumentEmbedder,
-                                    build_preprocessing_pipeline,
-                                    embedder_model)
+from app.services.document_stores import get_qdrant_document_store
+from app.services.embedding_cache import (EMBEDDING_CACHE_SIZE,
+                                          CachedDocumentEmbedder,
+                                          EmbeddingCache)
+from app.services.ingest import SYNC_INGEST_MODE, FolderIndexer
+from app.services.manifest import (load_folder_manifest, remove_deleted_files,
+                                   remove_source_files)
+from app.services.parsing import SYNC_PARSE_WORKERS, build_parse_executor
+from app.services.pipelines import (build_preprocessing_pipeline,
+                                    embedder_model, resolve_embedder_model)
+from app.services.watcher import (FolderChanges, keep_watch_alive,
+                                  watch_folder_changes)
 
 if os.getenv("APP_ENV", "development").lower() == "development":
     print(f'celery: Loading dotenv for {os.getenv("APP_ENV", "development")} APP_ENV.')
@@ -28,11 +44,35 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 
-app = Celery("sync_app", broker=os.getenv("REDIS_URL"), backend=os.getenv("REDIS_URL"))
+# folders with more files than this are split into sub-tasks across workers; 0 disables
+SYNC_SHARD_SIZE = int(os.getenv("SYNC_SHARD_SIZE", 0))
 
 
-# Pipeline needs to init after loading environment variables so do it after worker init
-SHARED_PREPROCESSING_PIPELINE = None
+# load the embedding model in the parent worker process before the pool is forked,
+# so pool processes share its weights copy-on-write instead of each loading a copy
+CELERY_PRELOAD_MODEL = os.getenv("CELERY_PRELOAD_MODEL", "false").lower() == "true"
+
+
+# Pipeline and embedder need to init after loading environment variables so do it after worker init
+SHARED_CONVERSION_PIPELINE = None
+SHARED_DOCUMENT_EMBEDDER = None
+SHARED_PARSE_EXECUTOR = None
+
+
+@worker_init.connect
+def preload_embedder_model(**kwargs):
+    """
+    Load the embedding model once in the parent worker process (prefork pool).
+    Pool processes then get the same model from Haystack's embedding backend cache on warm up.
+    No database clients are created here, they are not fork safe.
+    """
+    if not CELERY_PRELOAD_MODEL:
+        return
+    SentenceTransformersDocumentEmbedder(model=resolve_embedder_model()).warm_up()
+    # keep the loaded objects out of garbage collection, so collections in pool processes don't touch
+    # (and copy) their memory pages
+    gc.freeze()
+    logger.info(f"Preloaded {embedder_model} before forking the worker pool.")
 
 
 @worker_process_init.connect
@@ -43,88 +83,135 @@ def init_celery(**kwargs):
     init_qdrant()
     logger.info("Qdrant initiated.")
 
-    global SHARED_PREPROCESSING_PIPELINE
-    SHARED_PREPROCESSING_PIPELINE = build_preprocessing_pipeline(
-        document_store=QDRANT_DOCUMENT_STORE,
-        document_embedder=SentenceTransformersDocumentEmbedder(model=embedder_model),
+    # convert, clean and split only; chunks are embedded and written in batches by FolderIndexer
+    global SHARED_CONVERSION_PIPELINE, SHARED_DOCUMENT_EMBEDDER, SHARED_PARSE_EXECUTOR
+    SHARED_CONVERSION_PIPELINE = build_preprocessing_pipeline(
+        document_store=None,
         add_metadata=True,
     )
-    logger.info("SHARED_PREPROCESSING_PIPELINE initiated.")
+    SHARED_DOCUMENT_EMBEDDER = SentenceTransformersDocumentEmbedder(
+        model=resolve_embedder_model()
+    )
+    if EMBEDDING_CACHE_SIZE > 0:
+        # duplicate chunks across files, folders and workers are embedded once
+        SHARED_DOCUMENT_EMBEDDER = CachedDocumentEmbedder(
+            document_embedder=SHARED_DOCUMENT_EMBEDDER,
+            cache=EmbeddingCache(model=embedder_model),
+        )
+    SHARED_DOCUMENT_EMBEDDER.warm_up()
+    # parser processes feed chunks to the single embedder of this worker process
+    SHARED_PARSE_EXECUTOR = build_parse_executor()
+    logger.info(
+        f"SHARED_CONVERSION_PIPELINE initiated, {SYNC_INGEST_MODE=}, {SYNC_PARSE_WORKERS=}, {EMBEDDING_CACHE_SIZE=}."
+    )
+
+
+def _build_folder_indexer(
+    folder_path: str, actual_home_dir: str, manifest: dict | None = None
+) -> FolderIndexer:
+    if not SHARED_CONVERSION_PIPELINE or not SHARED_DOCUMENT_EMBEDDER:
+        raise RuntimeError("SHARED_CONVERSION_PIPELINE not initialized!")
+    return FolderIndexer(
+        folder_path=folder_path,
+        home_dir=actual_home_dir,
+        conversion_pipeline=SHARED_CONVERSION_PIPELINE,
+        document_embedder=SHARED_DOCUMENT_EMBEDDER,
+        document_store=get_qdrant_document_store(),
+        manifest=manifest,
+        parse_executor=SHARED_PARSE_EXECUTOR,
+    )
 
 
 @app.task(bind=True)
-def sync_folder(self, folder_path: str, actual_home_dir: str, sync_status_id: str):
-    """Sync documents in the given folder"""
+def sync_folder(
+    self,
+    folder_path: str,
+    actual_home_dir: str,
+    sync_status_id: str,
+    shard_size: int = SYNC_SHARD_SIZE,
+):
+    """
+    Sync documents in the given folder.
+    Folders with more than `shard_size` files are fanned out into `sync_folder_shard` sub-tasks.
+    """
 
     logger.info(f"sync_folder task ID is: {self.request.id}, {sync_status_id=}")
 
-    global SHARED_PREPROCESSING_PIPELINE
-    if not SHARED_PREPROCESSING_PIPELINE:
-        raise RuntimeError("SHARED_PREPROCESSING_PIPELINE not initialized!")
-
-    files = get_files_from_folder(
-        folder_path=folder_path, actual_home_dir=actual_home_dir
+    # the folder is walked once: files are streamed into the indexer, or buffered
+    # up to shard_size + 1 to tell if the folder is fanned out (which needs the full list anyway)
+    # paths the walk couldn't read, their files are not taken for deleted
+    unscanned = set()
+    files = iter_files_from_folder(
+        folder_path=folder_path, actual_home_dir=actual_home_dir, unscanned=unscanned
     )
+    file_count = None
+    if shard_size:
+        head = list(itertools.islice(files, shard_size + 1))
+        if len(head) > shard_size:
+            return _fan_out_sync(
+                self,
+                folder_path,
+                actual_home_dir,
+                sync_status_id,
+                head + list(files),
+                shard_size,
+                unscanned,
+            )
+        files = head
+        file_count = len(head)
 
-    file_count = len(files)
-    processed_count = 0
-    skipped_count = 0
-    source_files = []
     PROGRESS_INTERVAL = 10  # store every 10%
     milestone = 0
-    for index, file_path in enumerate(files):
-        try:
-            source_file = str(file_path.resolve())
-            output = SHARED_PREPROCESSING_PIPELINE.run(
-                {
-                    "file_type_router": {
-                        "sources": [file_path],
-                    },
-                    "add_source_meta": {"source_file": source_file},
-                }
-            )
-            # Check if any docs came out of the last component
-            # output for a processed file: {'document_writer': {'documents_written': 90}}
-            # output for a skipped file: {'file_type_router': {'unclassified': [PosixPath('/host/home/Desktop/Screenshot.png')]}}
-            last_component = (
-                "document_writer"  # or "document_embedder" if you skip writer
-            )
-            final_docs = output.get(last_component, {}).get("documents_written", [])
-            if final_docs:
-                processed_count += 1
-                source_files.append(source_file)
-            else:
-                skipped_count += 1
-        except Exception as e:
-            logger.error(f"Error processing {file_path}: {e}")
-            skipped_count += 1
-
+    current = 0
+    indexer = _build_folder_indexer(folder_path, actual_home_dir)
+    # streamed files are not counted up front, progress is estimated against the files of the last sync
+    expected_count = file_count or len(indexer.manifest)
+    for file_path in indexer.index_files(files):
         logger.info(f"Completed processsing {file_path}")
 
         # save progress
-        current = index + 1
-        percent = int((current / file_count) * 100)
+        current += 1
+        # new files push the count past the estimate, 100% is only stored once complete
+        expected_count = max(expected_count, current)
+        percent = min(int((current / expected_count) * 100), 99)
         self.update_state(
             state="IN_PROGRESS",
-            meta={"current": current, "total": file_count, "file": str(file_path)},
+            meta={"current": current, "total": expected_count, "file": str(file_path)},
         )
         # Only update DB at every 10% milestone
-        if percent >= milestone + PROGRESS_INTERVAL or percent == 100:
+        if percent >= milestone + PROGRESS_INTERVAL:
             milestone = percent
             sync_status = SyncStatusBunnet.find_one(
                 SyncStatusBunnet.id == PydanticObjectId(sync_status_id)
             ).run()
             sync_status.set(
                 {
-                    "total_files": file_count,
-                    "processed_files": processed_count,
-                    "skipped_files": skipped_count,
-                    "source_files": source_files,
+                    "total_files": expected_count,
+                    "processed_files": indexer.processed_files,
+                    "skipped_files": indexer.skipped_files,
+                    "unchanged_files": indexer.unchanged_files,
+                    "source_files": indexer.source_files,
                     "progress_percent": percent,
                     "status": "IN_PROGRESS",
                     "last_synced_at": datetime.now(tz=UTC),
                 }
             )
+    file_count = current
+    indexer.finish()
+
+    # drop chunks of files removed from the folder since the last sync
+    deleted_count = len(
+        remove_deleted_files(
+            indexer.manifest,
+            indexer.seen_files,
+            get_qdrant_document_store(),
+            unscanned=unscanned,
+        )
+    )
+
+    if indexer.processed_files > indexer.unchanged_files or deleted_count:
+        # cached answers grounded on this folder may be stale now
+        bump_corpus_version([folder_path])
 
     # Final update on complete
     SyncStatusBunnet.find_one(
@@ -133,9 +220,11 @@ def sync_folder(self, folder_path: str, actual_home_dir: str, sync_status_id: st
         {
             "$set": {
                 "total_files": file_count,
-                "processed_files": processed_count,
-                "skipped_files": skipped_count,
-                "source_files": source_files,
+                "processed_files": indexer.processed_files,
+                "skipped_files": indexer.skipped_files,
+                "unchanged_files": indexer.unchanged_files,
+                "deleted_files": deleted_count,
+                "source_files": indexer.source_files,
                 "progress_percent": 100,
                 "status": "COMPLETE",
                 "last_synced_at": datetime.now(tz=UTC),
@@ -150,9 +239,292 @@ def sync_folder(self, folder_path: str, actual_home_dir: str, sync_status_id: st
     summary = {
         "current": file_count,
         "total": file_count,
+        "unchanged": indexer.unchanged_files,
+        "deleted": deleted_count,
         "folder_path": folder_path,
         "task_id": self.request.id,
         "status": "complete",
     }
     logger.info(summary)
     return summary
+
+
+def _fan_out_sync(
+    task,
+    folder_path,
+    actual_home_dir,
+    sync_status_id,
+    files,
+    shard_size,
+    unscanned=frozenset(),
+) -> dict:
+    """
+    Split the file list into shards processed by `sync_folder_shard` on any worker,
+    and merge their results into the same sync status record with `finalize_folder_sync`.
+    """
+    # deleted files can only be detected with the full file list, so handle them here
+    manifest = load_folder_manifest(folder_path, actual_home_dir)
+    seen_files = {str(file_path.resolve()) for file_path in files}
+    deleted_count = len(
+        remove_deleted_files(
+            manifest, seen_files, get_qdrant_document_store(), unscanned=unscanned
+        )
+    )
+
+    file_count = len(files)
+    shards = [
+        [str(file_path) for file_path in files[i : i + shard_size]]
+        for i in range(0, file_count, shard_size)
+    ]
+    SyncStatusBunnet.find_one(
+        SyncStatusBunnet.id == PydanticObjectId(sync_status_id)
+    ).update(
+        {
+            "$set": {
+                "total_files": file_count,
+                "processed_files": 0,
+                "skipped_files": 0,
+                "unchanged_files": 0,
+                "deleted_files": deleted_count,
+                "source_files": [],
+                "shard_count": len(shards),
+                "completed_shards": 0,
+                "progress_percent": 0,
+                "status": "IN_PROGRESS",
+                "last_synced_at": datetime.now(tz=UTC),
+            }
+        }
+    ).run()
+
+    chord(
+        sync_folder_shard.s(folder_path, actual_home_dir, sync_status_id, shard)
+        for shard in shards
+    )(
+        finalize_folder_sync.s(folder_path, sync_status_id).on_error(
+            fail_folder_sync.s(sync_status_id)
+        )
+    )
+
+    summary = {
+        "current": 0,
+        "total": file_count,
+        "shards": len(shards),
+        "deleted": deleted_count,
+        "folder_path": folder_path,
+        "task_id": task.request.id,
+        "status": "sharded",
+    }
+    logger.info(summary)
+    return summary
+
+
+def _merge_shard_counts(sync_status_id: str, counts: dict, source_files: list[str]):
+    """Atomically add shard counters to the sync status record and refresh its progress."""
+    collection = SyncStatusBunnet.get_motor_collection()
+    sync_status = collection.find_one_and_update(
+        {"_id": PydanticObjectId(sync_status_id)},
+        {
+            "$inc": counts,
+            "$push": {"source_files": {"$each": source_files}},
+            "$set": {"last_synced_at": datetime.now(tz=UTC)},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    done = sync_status["processed_files"] + sync_status["skipped_files"]
+    percent = int(done / max(sync_status["total_files"], 1) * 100)
+    # shards finish out of order, only ever move progress forward
+    collection.update_one(
+        {"_id": PydanticObjectId(sync_status_id)},
+        {"$max": {"progress_percent": min(percent, 99)}},
+    )
+
+
+@app.task(bind=True)
+def sync_folder_shard(
+    self,
+    folder_path: str,
+    actual_home_dir: str,
+    sync_status_id: str,
+    file_paths: list[str],
+):
+    """Sync one shard of a fanned out folder sync."""
+
+    logger.info(
+        f"sync_folder_shard task ID is: {self.request.id}, {sync_status_id=}, {len(file_paths)} files"
+    )
+
+    files = [Path(file_path) for file_path in file_paths]
+    manifest = load_folder_manifest(
+        folder_path,
+        actual_home_dir,
+        source_files=[str(file_path.resolve()) for file_path in files],
+    )
+    indexer = _build_folder_indexer(folder_path, actual_home_dir, manifest=manifest)
+
+    PROGRESS_INTERVAL = 10  # merge into sync status every 10% of the shard
+    milestone = 0
+    merged = {"processed_files": 0, "skipped_files": 0, "unchanged_files": 0}
+    merged_source_files = 0
+
+    def merge_progress():
+        nonlocal merged_source_files
+        counts = {
+            "processed_files": indexer.processed_files,
+            "skipped_files": indexer.skipped_files,
+            "unchanged_files": indexer.unchanged_files,
+        }
+        delta = {key: counts[key] - merged[key] for key in counts}
+        _merge_shard_counts(
+            sync_status_id, delta, indexer.source_files[merged_source_files:]
+        )
+        merged.update(counts)
+        merged_source_files = len(indexer.source_files)
+
+    for index, file_path in enumerate(indexer.index_files(files)):
+        percent = int(((index + 1) / len(files)) * 100)
+        if percent >= milestone + PROGRESS_INTERVAL:
+            milestone = percent
+            merge_progress()
+    indexer.finish()
+    merge_progress()
+
+    SyncStatusBunnet.find_one(
+        SyncStatusBunnet.id == PydanticObjectId(sync_status_id)
+    ).update({"$inc": {"completed_shards": 1}}).run()
+
+    return {
+        "processed_files": indexer.processed_files,
+        "skipped_files": indexer.skipped_files,
+        "unchanged_files": indexer.unchanged_files,
+    }
+
+
+@app.task
+def finalize_folder_sync(
+    shard_results: list[dict], folder_path: str, sync_status_id: str
+):
+    """Chord callback: mark the fanned out sync complete once all shards are done."""
+    bump_corpus_version([folder_path])
+    SyncStatusBunnet.find_one(
+        SyncStatusBunnet.id == PydanticObjectId(sync_status_id)
+    ).update(
+        {
+            "$set": {
+                "progress_percent": 100,
+                "status": "COMPLETE",
+                "last_synced_at": datetime.now(tz=UTC),
+            }
+        }
+    ).run()
+
+    summary = {
+        "total": sum(
+            result["processed_files"] + result["skipped_files"]
+            for result in shard_results
+        ),
+        "processed": sum(result["processed_files"] for result in shard_results),
+        "skipped": sum(result["skipped_files"] for result in shard_results),
+        "shards": len(shard_results),
+        "folder_path": folder_path,
+        "status": "complete",
+    }
+    logger.info(summary)
+    return summary
+
+
+@app.task
+def fail_folder_sync(request, exc, traceback, sync_status_id: str):
+    """Chord error callback: a shard failed so the fanned out sync will never complete."""
+    logger.error(f"Sharded sync {sync_status_id=} failed: {exc}")
+    SyncStatusBunnet.find_one(
+        SyncStatusBunnet.id == PydanticObjectId(sync_status_id)
+    ).update({"$set": {"status": "FAILED"}}).run()
+
+
+@app.task(bind=True)
+def watch_folder(self, folder_path: str, actual_home_dir: str, sync_status_id: str):
+    """
+    Long running task that keeps the index of a synced folder fresh:
+    touched files are re-indexed and deleted or renamed ones removed, a few seconds after they change.
+    Occupies one worker process of the watch queue until revoked, and refreshes a heartbeat meanwhile.
+    """
+
+    logger.info(f"watch_folder task ID is: {self.request.id}, {sync_status_id=}")
+
+    root = resolve_folder_path(folder_path, actual_home_dir).resolve()
+    heartbeat = keep_watch_alive(self.request.id)
+    try:
+        for changes in watch_folder_changes(root, folder_path, actual_home_dir):
+            try:
+                _apply_folder_changes(
+                    folder_path, actual_home_dir, sync_status_id, changes
+                )
+            except Exception as e:
+                logger.error(f"Error applying changes under {folder_path}: {e}")
+    finally:
+        heartbeat.set()
+
+
+def _apply_folder_changes(
+    folder_path: str, actual_home_dir: str, sync_status_id: str, changes: FolderChanges
+):
+    """Re-index changed files and remove deleted ones, then update the sync record."""
+    if changes.rescan:
+        # events were lost, compare the whole folder against the manifest
+        unscanned = set()
+        files = list(
+            iter_files_from_folder(folder_path, actual_home_dir, unscanned=unscanned)
+        )
+        indexer = _build_folder_indexer(folder_path, actual_home_dir)
+    else:
+        files = []
+        for path in changes.changed:
+            if path.is_dir():
+                # unreadable paths are not deleted ones, only deleted paths are removed below
+                files.extend(iter_files_under(path))
+            elif is_syncable_file(path):
+                files.append(path)
+        manifest = load_folder_manifest(
+            folder_path,
+            actual_home_dir,
+            source_files=[str(file_path.resolve()) for file_path in files],
+        )
+        indexer = _build_folder_indexer(folder_path, actual_home_dir, manifest=manifest)
+
+    for _ in indexer.index_files(files):
+        pass
+    indexer.finish()
+
+    if changes.rescan:
+        removed_files = remove_deleted_files(
+            indexer.manifest,
+            indexer.seen_files,
+            get_qdrant_document_store(),
+            unscanned=unscanned,
+        )
+    else:
+        removed_files = remove_source_files(
+            folder_path,
+            actual_home_dir,
+            [str(path) for path in changes.deleted],
+            get_qdrant_document_store(),
+        )
+
+    if indexer.processed_files > indexer.unchanged_files or removed_files:
+        bump_corpus_version([folder_path])
+
+    sync_status = SyncStatusBunnet.find_one(
+        SyncStatusBunnet.id == PydanticObjectId(sync_status_id)
+    )
+    sync_status.update(
+        {
+            "$addToSet": {"source_files": {"$each": indexer.source_files}},
+            "$set": {"last_synced_at": datetime.now(tz=UTC)},
+        }
+    ).run()
+    if removed_files:
+        sync_status.update({"$pull": {"source_files": {"$in": removed_files}}}).run()
+    logger.info(
+        f"Watch {folder_path}: {indexer.processed_files - indexer.unchanged_files} indexed, "
+        f"{indexer.skipped_files} skipped, {len(removed_files)} removed"
+    )
@@ -0,0 +1,27 @@
+"""
+Celery app of the sync tasks, without the tasks: the API sends tasks by name through it,
+so it doesn't import the ingestion code of the workers.
+"""
+
+import os
+
+from celery import Celery
+from dotenv import load_dotenv
+
+if os.getenv("APP_ENV", "development").lower() == "development":
+    print(
+        f'celery_app: Loading dotenv for {os.getenv("APP_ENV", "development")} APP_ENV.'
+    )
+    load_dotenv()
+
+
+app = Celery("sync_app", broker=os.getenv("REDIS_URL"), backend=os.getenv("REDIS_URL"))
+
+# task names, the tasks are defined in app.services.celery
+SYNC_FOLDER_TASK = "app.services.celery.sync_folder"
+WATCH_FOLDER_TASK = "app.services.celery.watch_folder"
+
+# long running watch tasks go to their own queue, consumed by a worker of their own (see docker-compose),
+# so they don't hold the worker processes of folder syncs
+CELERY_WATCH_QUEUE = os.getenv("CELERY_WATCH_QUEUE", "watch")
+app.conf.task_routes = {WATCH_FOLDER_TASK: {"queue": CELERY_WATCH_QUEUE}}
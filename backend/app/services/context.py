@@ -0,0 +1,154 @@
+"""
+Context assembly of the RAG prompt: retrieved chunks of the same file that overlap or touch are merged
+without their repeated text, and chunks and conversation memories are packed within the token budget of the model.
+"""
+
+import logging
+import math
+import os
+
+from haystack import component
+from haystack.dataclasses import ChatMessage, ChatRole, Document
+
+logger = logging.getLogger(__name__)
+
+
+# prompt context tokens (documents and memories) when the model has no budget of its own
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+# per model budgets, e.g. "gemini-2.0-flash=8000,llama3.2=2000"
+CONTEXT_TOKEN_BUDGETS = {
+    model.strip(): int(budget)
+    for model, _, budget in (
+        item.partition("=")
+        for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",")
+        if item.strip()
+    )
+}
+# max share of the budget taken by conversation memories, the rest (and what memories don't use) is for documents
+CONTEXT_MEMORY_SHARE = float(os.getenv("CONTEXT_MEMORY_SHARE", 0.3))
+# rough token count of English text, no tokenizer of every provider's model is at hand
+CHARS_PER_TOKEN = 4
+
+
+def context_token_budget(llm_model: str) -> int:
+    return CONTEXT_TOKEN_BUDGETS.get(llm_model, CONTEXT_TOKEN_BUDGET)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _span(doc: Document) -> tuple[int, int] | None:
+    start = doc.meta.get("split_idx_start")
+    if start is None:
+        return None
+    return start, start + len(doc.content or "")
+
+
+def merge_adjacent_chunks(documents: list[Document]) -> list[Document]:
+    """
+    Merge chunks split from the same file that overlap or touch into one document, dropping the overlapping text.
+    Merged documents are ordered by their most relevant chunk, given the documents in relevance order.
+    """
+    groups: dict[str, list[tuple[int, Document]]] = {}
+    for rank, doc in enumerate(documents):
+        source = doc.meta.get("source_id") or doc.meta.get("source_file") or doc.id
+        groups.setdefault(source, []).append((rank, doc))
+
+    merged: list[tuple[int, Document]] = []
+    for chunks in groups.values():
+        # chunks without split offsets can't be merged, e.g. indexed by another splitter
+        spans = sorted(
+            (chunk for chunk in chunks if _span(chunk[1])),
+            key=lambda chunk: _span(chunk[1]),
+        )
+        merged.extend(chunk for chunk in chunks if not _span(chunk[1]))
+
+        current_rank, current, current_end = None, None, None
+        for rank, doc in spans:
+            start, end = _span(doc)
+            if current is not None and start <= current_end:
+                if end > current_end:
+                    current.content += doc.content[current_end - start :]
+                    current_end = end
+                current_rank = min(current_rank, rank)
+                current.score = max(current.score or 0, doc.score or 0)
+                continue
+            if current is not None:
+                merged.append((current_rank, current))
+            current_rank, current_end = rank, end
+            current = Document(
+                content=doc.content, meta=dict(doc.meta), score=doc.score
+            )
+        if current is not None:
+            merged.append((current_rank, current))
+
+    return [doc for _, doc in sorted(merged, key=lambda item: item[0])]
+
+
+@component
+class ContextPacker:
+    """
+    Assemble the prompt context: keep the summary of older turns (system memories) and the most recent memories
+    within their share of the token budget, then merge adjacent chunks and add them by relevance until the budget is spent.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        memory_share: float = CONTEXT_MEMORY_SHARE,
+    ):
+        self.token_budget = token_budget
+        self.memory_share = memory_share
+
+    @component.output_types(documents=list[Document], memories=list[ChatMessage])
+    def run(self, documents: list[Document], memories: list[ChatMessage]):
+        memory_budget = int(self.token_budget * self.memory_share)
+        # the summary goes first, it stands for all the turns the recent ones don't cover
+        summaries = [
+            message for message in memories if message.is_from(ChatRole.SYSTEM)
+        ]
+        packed_summaries = []
+        memory_tokens = 0
+        for message in summaries:
+            text = message.text or ""
+            tokens = estimate_tokens(text)
+            if memory_tokens + tokens > memory_budget:
+                # over its share, keep its beginning
+                text = text[: (memory_budget - memory_tokens) * CHARS_PER_TOKEN]
+                message = ChatMessage.from_system(text, meta=message.meta)
+                tokens = estimate_tokens(text)
+            packed_summaries.append(message)
+            memory_tokens += tokens
+
+        packed_turns = []
+        for message in reversed(memories):
+            if message.is_from(ChatRole.SYSTEM):
+                continue
+            tokens = estimate_tokens(message.text or "")
+            if memory_tokens + tokens > memory_budget:
+                break
+            packed_turns.insert(0, message)
+            memory_tokens += tokens
+        packed_memories = packed_summaries + packed_turns
+
+        document_budget = self.token_budget - memory_tokens
+        packed_documents = []
+        document_tokens = 0
+        for doc in merge_adjacent_chunks(documents):
+            tokens = estimate_tokens(doc.content or "")
+            if document_tokens + tokens > document_budget:
+                if not packed_documents:
+                    # the most relevant document alone is over budget, keep its beginning
+                    doc.content = doc.content[: document_budget * CHARS_PER_TOKEN]
+                    packed_documents.append(doc)
+                    document_tokens = document_budget
+                break
+            packed_documents.append(doc)
+            document_tokens += tokens
+
+        logger.info(
+            f"Packed {len(packed_documents)} documents ({document_tokens} tokens) from {len(documents)} chunks, "
+            f"{len(packed_memories)}/{len(memories)} memories ({memory_tokens} tokens)"
+        )
+        return {"documents": packed_documents, "memories": packed_memories}
@@ -5,19 +5,62 @@ MongoDB and Qdrant
 import os
 
 from beanie import init_beanie
+from bson import ObjectId
 from bunnet import init_bunnet
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 
 from app.models.chat_models import Conversation, Message, User
-from app.models.status_models import SyncStatusBeanie, SyncStatusBunnet
+from app.models.status_models import (FileManifestBeanie, FileManifestBunnet,
+                                      SyncStatusBeanie, SyncStatusBunnet)
+from app.services.document_stores import (PAYLOAD_INDEX_FIELDS,
+                                          QDRANT_QUANTIZATION, QDRANT_URI_HOST,
+                                          QDRANT_URI_PORT,
+                                          QDRANT_VECTORS_ON_DISK,
+                                          RETRIEVAL_MODE,
+                                          apply_vector_storage_config,
+                                          create_payload_indexes,
+                                          get_qdrant_client,
+                                          get_qdrant_document_store,
+                                          reset_qdrant_document_store)
 
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB_NAME", "chat_db")
-QDRANT_URI = os.getenv("QDRANT_URI")
-QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "documents")
+# explain the hot queries at startup and refuse to start if one of them scans its whole collection or sorts in memory
+MONGO_INDEX_CHECK = os.getenv("MONGO_INDEX_CHECK", "true").lower() == "true"
+
+# (name, collection, find filter or aggregation pipeline, sort) of the queries run on every request or sync
+HOT_QUERIES = [
+    (
+        "conversation messages",
+        "messages",
+        {"conversation.$id": ObjectId()},
+        [("query_created_at", -1), ("_id", -1)],
+    ),
+    (
+        "recent conversations",
+        "conversations",
+        {},
+        [("created_at", -1), ("_id", -1)],
+    ),
+    (
+        "synced folders",
+        "sync_status",
+        [
+            {"$match": {"status": "COMPLETE"}},
+            {"$sort": {"last_synced_at": -1}},
+            {"$group": {"_id": "$folder_path", "latest_sync": {"$first": "$$ROOT"}}},
+        ],
+        None,
+    ),
+    (
+        "latest folder sync",
+        "sync_status",
+        {"folder_path": "", "home_dir": "", "status": "COMPLETE"},
+        [("last_synced_at", -1)],
+    ),
+    ("folder manifest", "file_manifest", {"folder_path": "", "home_dir": ""}, None),
+]
 
 
 async def init_mongodb_beanie():
@@ -25,29 +68,100 @@ async def init_mongodb_beanie():
     client = AsyncIOMotorClient(MONGO_URI)
     db = client[DB_NAME]
     await init_beanie(
-        database=db, document_models=[User, Conversation, Message, SyncStatusBeanie]
+        database=db,
+        document_models=[
+            User,
+            Conversation,
+            Message,
+            SyncStatusBeanie,
+            FileManifestBeanie,
+        ],
     )
+    if MONGO_INDEX_CHECK:
+        await check_mongodb_indexes(db)
     return client, db
 
 
+def _plan_problems(explain, winning: bool = False) -> set[str]:
+    """
+    Return the stages of the winning plans of the explain output that an index should avoid:
+    a collection scan, or an in-memory (blocking) sort, whatever the query engine and nesting.
+    """
+    problems = set()
+    if isinstance(explain, dict):
+        if winning and explain.get("stage") in ("COLLSCAN", "SORT"):
+            problems.add(explain["stage"])
+        # $sort stage left in the pipeline of an aggregation, i.e. not served by an index
+        stages = explain.get("stages")
+        if isinstance(stages, list) and any(
+            isinstance(stage, dict) and "$sort" in stage for stage in stages
+        ):
+            problems.add("SORT")
+        for key, value in explain.items():
+            problems |= _plan_problems(value, winning or key == "winningPlan")
+    elif isinstance(explain, list):
+        for value in explain:
+            problems |= _plan_problems(value, winning)
+    return problems
+
+
+async def check_mongodb_indexes(db):
+    """
+    Explain the hot queries and raise if one of them is planned as a collection scan or an in-memory sort,
+    i.e. an index declared in the models is missing or doesn't match the query anymore.
+    """
+    unindexed = []
+    for name, collection, query, sort in HOT_QUERIES:
+        if isinstance(query, list):
+            explain = await db.command(
+                "aggregate", collection, pipeline=query, explain=True
+            )
+        else:
+            cursor = db[collection].find(query).limit(1)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = await cursor.explain()
+        problems = _plan_problems(explain)
+        if problems:
+            unindexed.append(f"{name} ({collection}: {', '.join(sorted(problems))})")
+    if unindexed:
+        raise RuntimeError(
+            f"MongoDB queries without a matching index: {', '.join(unindexed)}. "
+            "Declare the index in the model settings, or set MONGO_INDEX_CHECK=false."
+        )
+    print(f"MongoDB indexes of {len(HOT_QUERIES)} hot queries checked.")
+
+
 def init_mongodb_bunnet():
     print(f"init_mongodb_bunnet: {MONGO_URI=}")
     client = MongoClient(MONGO_URI)
     db = client[DB_NAME]
-    init_bunnet(database=db, document_models=[SyncStatusBunnet])
+    init_bunnet(database=db, document_models=[SyncStatusBunnet, FileManifestBunnet])
     return client, db
 
 
 def init_qdrant():
-    print(f"{QDRANT_URI=}")
-    client = QdrantClient(url=QDRANT_URI)
-    if client.collection_exists(QDRANT_COLLECTION_NAME):
-        print(f"Qdrant collection {QDRANT_COLLECTION_NAME} already registered.")
-    else:
-        client.create_collection(
-            collection_name=QDRANT_COLLECTION_NAME,
-            # NOTE: vector size 385 to match the embedding model "sentence-transformers/all-MiniLM-L6-v2"
-            vectors_config=VectorParams(size=384, distance=Distance.COSINE),
-        )
-        print(f"Registered new Qdrant collection {QDRANT_COLLECTION_NAME}.")
+    from haystack_integrations.document_stores.qdrant.document_store import \
+        QdrantStoreError
+
+    print(f"Qdrant: {QDRANT_URI_HOST}:{QDRANT_URI_PORT}")
+    # quantization of the document store collection, then folder and source file filters
+    try:
+        apply_vector_storage_config()
+    except QdrantStoreError as e:
+        collection = get_qdrant_document_store().index
+        if get_qdrant_client().count(collection, exact=True).count:
+            # retrieval would fail on every question, don't start
+            raise RuntimeError(
+                f"Qdrant collection {collection} does not match {RETRIEVAL_MODE=}: {e} "
+                "Set RETRIEVAL_MODE back to the mode the documents were synced with, "
+                f"or drop the collection (curl -X DELETE {QDRANT_URI_HOST}:{QDRANT_URI_PORT}/collections/{collection}) and sync again."
+            ) from e
+        # no documents to lose, set the collection up for the retrieval mode
+        print(f"Recreating empty Qdrant collection {collection} for {RETRIEVAL_MODE=}.")
+        reset_qdrant_document_store()
+        apply_vector_storage_config()
+    print(f"Qdrant vectors: {QDRANT_QUANTIZATION=}, {QDRANT_VECTORS_ON_DISK=}.")
+    create_payload_indexes()
+    print(f"Qdrant payload indexes on {PAYLOAD_INDEX_FIELDS} ready.")
     return
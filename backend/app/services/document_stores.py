@@ -2,11 +2,17 @@
 Haystack document stores
 """
 
+import logging
 import os
+import threading
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
-from haystack.document_stores.in_memory import InMemoryDocumentStore
-from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+
+if TYPE_CHECKING:
+    from haystack.document_stores.in_memory import InMemoryDocumentStore
+    from haystack_integrations.document_stores.qdrant import \
+        QdrantDocumentStore
 
 if os.getenv("APP_ENV", "development").lower() == "development":
     print(
@@ -14,32 +20,283 @@ if os.getenv("APP_ENV", "development").lower() == "development":
     )
     load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 DOCUMENT_STORE_NAME = os.getenv("DOCUMENT_STORE_NAME", "qdrant")
 QDRANT_URI_HOST = os.getenv("QDRANT_URI_HOST", "http://host.docker.internal")
 QDRANT_URI_PORT = int(os.getenv("QDRANT_URI_PORT", 6333))
+QDRANT_WRITE_BATCH_SIZE = int(os.getenv("QDRANT_WRITE_BATCH_SIZE", 256))
+# "dense" retrieval on embeddings only, or "hybrid" also indexing BM25 sparse vectors, results fused with RRF
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").lower()
+HYBRID_RETRIEVAL = RETRIEVAL_MODE == "hybrid"
+# candidates of each of the dense and sparse searches fused by hybrid retrieval, per result
+HYBRID_PREFETCH_FACTOR = int(os.getenv("HYBRID_PREFETCH_FACTOR", 4))
+# candidates fetched per result when searching across all folders, a file synced in several folders has a copy of its chunks in each
+UNSCOPED_FETCH_FACTOR = int(os.getenv("UNSCOPED_FETCH_FACTOR", 2))
+# "scalar" (int8) or "binary" quantized vectors kept in RAM for search, "none" for plain float32 vectors
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+# keep the original float32 vectors on disk (only the quantized ones in RAM)
+QDRANT_VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "false").lower() == "true"
+# re-rank quantized search candidates with the original vectors
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+# fetch top_k * oversampling quantized candidates to rescore
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", 2.0))
+
+
+def get_quantization_config(quantization: str = QDRANT_QUANTIZATION):
+    """Return the Qdrant quantization config of the mode, None for no quantization."""
+    from qdrant_client.models import (BinaryQuantization,
+                                      BinaryQuantizationConfig,
+                                      ScalarQuantization,
+                                      ScalarQuantizationConfig, ScalarType)
+
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    if quantization != "none":
+        raise ValueError(f"Unknown {quantization=}, expected none, scalar or binary")
+    return None
+
+
+def get_search_params(
+    quantization: str = QDRANT_QUANTIZATION,
+    rescore: bool = QDRANT_RESCORE,
+    oversampling: float = QDRANT_OVERSAMPLING,
+):
+    """Return the Qdrant search params of queries on quantized vectors, None for no quantization."""
+    from qdrant_client.models import QuantizationSearchParams, SearchParams
+
+    if quantization == "none":
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(
+            rescore=rescore, oversampling=oversampling if rescore else None
+        )
+    )
+
 
 ###
-# Global document store instances ready to use
+# Global document store instances, created (and their integrations imported) on first use
 ###
-IN_MEMORY_DOCUMENT_STORE = InMemoryDocumentStore()
+_IN_MEMORY_DOCUMENT_STORE = None
+_QDRANT_DOCUMENT_STORE = None
+_DOCUMENT_STORE_LOCK = threading.Lock()
+
+
+def get_in_memory_document_store() -> "InMemoryDocumentStore":
+    global _IN_MEMORY_DOCUMENT_STORE
+    with _DOCUMENT_STORE_LOCK:
+        if _IN_MEMORY_DOCUMENT_STORE is None:
+            from haystack.document_stores.in_memory import \
+                InMemoryDocumentStore
 
-QDRANT_DOCUMENT_STORE = QdrantDocumentStore(
-    url=QDRANT_URI_HOST,
-    port=QDRANT_URI_PORT,
-    index="doc_collection",  # collection name
-    embedding_dim=384,  # based on the embedding model, sentence-transformers/all-MiniLM-L6-v2 has 384 vector size
-    recreate_index=False,  # make sure it's false to persist data
-    return_embedding=True,
-    wait_result_from_api=True,
-)
+            _IN_MEMORY_DOCUMENT_STORE = InMemoryDocumentStore()
+    return _IN_MEMORY_DOCUMENT_STORE
+
+
+def get_qdrant_document_store() -> "QdrantDocumentStore":
+    global _QDRANT_DOCUMENT_STORE
+    with _DOCUMENT_STORE_LOCK:
+        if _QDRANT_DOCUMENT_STORE is None:
+            from haystack_integrations.document_stores.qdrant import \
+                QdrantDocumentStore
+
+            _QDRANT_DOCUMENT_STORE = QdrantDocumentStore(
+                url=QDRANT_URI_HOST,
+                port=QDRANT_URI_PORT,
+                index="doc_collection",  # collection name
+                embedding_dim=384,  # based on the embedding model, sentence-transformers/all-MiniLM-L6-v2 has 384 vector size
+                recreate_index=False,  # make sure it's false to persist data
+                # queries only need content and meta, not the vectors
+                return_embedding=False,
+                on_disk=QDRANT_VECTORS_ON_DISK,
+                # named dense and sparse vectors, Qdrant weights sparse vectors with the IDF of the collection
+                use_sparse_embeddings=HYBRID_RETRIEVAL,
+                sparse_idf=HYBRID_RETRIEVAL,
+                quantization_config=get_quantization_config(),
+                wait_result_from_api=True,
+                write_batch_size=QDRANT_WRITE_BATCH_SIZE,  # points per upsert request when bulk writing chunks
+            )
+    return _QDRANT_DOCUMENT_STORE
 
 
 ###
 # Default selection based on config
 ###
-DEFAULT_DOCUMENT_STORE = (
-    QDRANT_DOCUMENT_STORE
-    if DOCUMENT_STORE_NAME == "qdrant"
-    else IN_MEMORY_DOCUMENT_STORE
-)
+def get_default_document_store():
+    if DOCUMENT_STORE_NAME == "qdrant":
+        return get_qdrant_document_store()
+    return get_in_memory_document_store()
+
+
+###
+# Payload indexes, and bulk updates/deletes that run inside Qdrant without loading the documents first
+###
+PAYLOAD_INDEX_FIELDS = ["meta.folder", "meta.source_file"]
+DELETE_BATCH_SIZE = 1000  # source files per filtered request
+
+
+_QDRANT_CLIENT = None
+
+
+def get_qdrant_client():
+    """Return the Qdrant client shared by the bulk operations and the retrievers."""
+    global _QDRANT_CLIENT
+    with _DOCUMENT_STORE_LOCK:
+        if _QDRANT_CLIENT is None:
+            from qdrant_client import QdrantClient
+
+            _QDRANT_CLIENT = QdrantClient(url=QDRANT_URI_HOST, port=QDRANT_URI_PORT)
+    return _QDRANT_CLIENT
+
+
+def set_up_qdrant_collection():
+    """
+    Create the collection of the document store if missing, it's otherwise created on first use of the store.
+    Raises QdrantStoreError if the collection doesn't match the store (e.g. RETRIEVAL_MODE changed).
+    """
+    get_qdrant_document_store().count_documents()
+
+
+def _source_files_filter(source_files: list[str]):
+    from qdrant_client.models import FieldCondition, Filter, MatchAny
+
+    return Filter(
+        must=[FieldCondition(key="meta.source_file", match=MatchAny(any=source_files))]
+    )
+
+
+def create_payload_indexes():
+    """Create keyword payload indexes used by filtered retrieval, re-sync and deletes."""
+    from qdrant_client.models import PayloadSchemaType
+
+    set_up_qdrant_collection()
+    client = get_qdrant_client()
+    for field_name in PAYLOAD_INDEX_FIELDS:
+        client.create_payload_index(
+            collection_name=get_qdrant_document_store().index,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+
+
+def apply_vector_storage_config():
+    """
+    Apply the configured quantization and on disk storage of vectors to the existing collection.
+    Qdrant re-quantizes the vectors in the background, no re-indexing needed.
+    """
+    from haystack_integrations.document_stores.qdrant.converters import \
+        DENSE_VECTORS_NAME
+    from qdrant_client.models import Disabled, VectorParamsDiff
+
+    set_up_qdrant_collection()
+    client = get_qdrant_client()
+    collection_name = get_qdrant_document_store().index
+    config = client.get_collection(collection_name).config
+    quantization_config = get_quantization_config()
+    current_mode = "none"
+    if config.quantization_config is not None:
+        current_mode = (
+            "scalar"
+            if getattr(config.quantization_config, "scalar", None)
+            else "binary"
+        )
+    # the dense vector is named when the collection also has sparse vectors
+    vector_name = DENSE_VECTORS_NAME if HYBRID_RETRIEVAL else ""
+    vectors = config.params.vectors
+    on_disk = bool((vectors[vector_name] if vector_name else vectors).on_disk)
+    if current_mode == QDRANT_QUANTIZATION and on_disk == QDRANT_VECTORS_ON_DISK:
+        return
+    logger.info(
+        f"Updating vectors of {collection_name}: quantization {current_mode} -> {QDRANT_QUANTIZATION}, "
+        f"on disk {on_disk} -> {QDRANT_VECTORS_ON_DISK}"
+    )
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={vector_name: VectorParamsDiff(on_disk=QDRANT_VECTORS_ON_DISK)},
+        quantization_config=quantization_config or Disabled.DISABLED,
+    )
+
+
+def delete_documents_of_folder(folder: str, legacy_source_files: list[str] = ()):
+    """
+    Delete the chunks of a synced folder with a filter on the folder key.
+    Chunks of `legacy_source_files` indexed before the key existed are deleted by source file,
+    chunks of the same files indexed for other synced folders carry their own key and are kept.
+    """
+    from qdrant_client.models import (FieldCondition, Filter, FilterSelector,
+                                      IsEmptyCondition, MatchValue,
+                                      PayloadField)
+
+    client = get_qdrant_client()
+    collection_name = get_qdrant_document_store().index
+    client.delete(
+        collection_name=collection_name,
+        points_selector=FilterSelector(
+            filter=Filter(
+                must=[FieldCondition(key="meta.folder", match=MatchValue(value=folder))]
+            )
+        ),
+        wait=True,
+    )
+    for i in range(0, len(legacy_source_files), DELETE_BATCH_SIZE):
+        points_filter = _source_files_filter(
+            legacy_source_files[i : i + DELETE_BATCH_SIZE]
+        )
+        points_filter.must.append(
+            IsEmptyCondition(is_empty=PayloadField(key="meta.folder"))
+        )
+        client.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=points_filter),
+            wait=True,
+        )
+
+
+def set_folder_of_source_files(folder: str, source_files: list[str]):
+    """
+    Set the folder key on chunks of the given source files indexed before it existed.
+    Chunks that already carry a folder key are left as they are.
+    """
+    from qdrant_client.models import IsEmptyCondition, PayloadField
+
+    client = get_qdrant_client()
+    for i in range(0, len(source_files), DELETE_BATCH_SIZE):
+        points_filter = _source_files_filter(source_files[i : i + DELETE_BATCH_SIZE])
+        points_filter.must.append(
+            IsEmptyCondition(is_empty=PayloadField(key="meta.folder"))
+        )
+        client.set_payload(
+            collection_name=get_qdrant_document_store().index,
+            payload={"folder": folder},
+            points=points_filter,
+            key="meta",
+            wait=True,
+        )
+
+
+def reset_qdrant_document_store():
+    """
+    Drop and recreate the collection of the document store, removing all documents.
+    Also the way to switch RETRIEVAL_MODE, which needs a collection with or without sparse vectors.
+    """
+    store = get_qdrant_document_store()
+    # dropped first, a collection of the other retrieval mode can't be set up by the store
+    client = get_qdrant_client()
+    if client.collection_exists(store.index):
+        client.delete_collection(store.index)
+    store.recreate_collection(
+        store.index,
+        store.get_distance(store.similarity),
+        store.embedding_dim,
+        store.on_disk,
+        store.use_sparse_embeddings,
+        store.sparse_idf,
+    )
+    create_payload_indexes()
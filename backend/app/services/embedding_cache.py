@@ -0,0 +1,218 @@
+"""
+Content-addressed embedding cache in Redis, shared by all Celery worker processes,
+so duplicate chunks (license headers, templates, copied files) cost one lookup instead of a forward pass.
+And an in-process LRU cache of query embeddings, so repeated or retried questions skip the text embedder.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import redis
+from haystack import component
+from haystack.dataclasses import Document
+
+logger = logging.getLogger(__name__)
+
+
+# max number of cached embeddings per model, least recently used ones are evicted; 0 disables the cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 50_000))
+EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL") or os.getenv(
+    "REDIS_URL"
+)
+# max number of cached query embeddings in the API process; 0 disables the cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings keyed by (model name, normalized text hash).
+    Vectors are stored as float32 bytes; a sorted set of last access times drives the eviction.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        redis_url: str | None = EMBEDDING_CACHE_REDIS_URL,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        prefix: str = "embedding_cache",
+    ):
+        self.model = model
+        self.max_entries = max_entries
+        self._key_prefix = f"{prefix}:{model}"
+        self._lru_key = f"{self._key_prefix}:lru"
+        self._redis = redis.Redis.from_url(redis_url)
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self._key_prefix}:{digest}"
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """Return cached embeddings in the order of texts, None for misses."""
+        if not texts:
+            return []
+        keys = [self._key(text) for text in texts]
+        try:
+            values = self._redis.mget(keys)
+            hit_keys = [key for key, value in zip(keys, values) if value is not None]
+            if hit_keys:
+                now = time.time()
+                self._redis.zadd(self._lru_key, {key: now for key in hit_keys})
+        except redis.RedisError as e:
+            logger.warning(f"Embedding cache unavailable: {e}")
+            return [None] * len(texts)
+        return [
+            array("f", value).tolist() if value is not None else None
+            for value in values
+        ]
+
+    def set_many(self, texts: list[str], embeddings: list[list[float]]):
+        """Store embeddings and evict least recently used ones above the size bound."""
+        if not texts:
+            return
+        now = time.time()
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for text, embedding in zip(texts, embeddings):
+                key = self._key(text)
+                pipe.set(key, array("f", embedding).tobytes())
+                pipe.zadd(self._lru_key, {key: now})
+            pipe.zcard(self._lru_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = self._redis.zpopmin(self._lru_key, size - self.max_entries)
+                if evicted:
+                    self._redis.delete(*[key for key, _ in evicted])
+        except redis.RedisError as e:
+            logger.warning(f"Embedding cache unavailable: {e}")
+
+
+@component
+class CachedDocumentEmbedder:
+    """
+    Wrap a document embedder to only embed chunks that are not in the embedding cache.
+    Drop-in replacement of the wrapped embedder in the preprocessing pipeline.
+    """
+
+    def __init__(self, document_embedder, cache: EmbeddingCache):
+        self.document_embedder = document_embedder
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def warm_up(self):
+        self.document_embedder.warm_up()
+
+    @component.output_types(documents=list[Document])
+    def run(self, documents: list[Document]):
+        texts = [doc.content or "" for doc in documents]
+        cached = self.cache.get_many(texts)
+
+        misses = [doc for doc, embedding in zip(documents, cached) if embedding is None]
+        if misses:
+            # identical chunks within the batch are embedded once
+            unique_misses = {}
+            for doc in misses:
+                text = normalize_text(doc.content or "")
+                unique_misses.setdefault(text, []).append(doc)
+            embedded = self.document_embedder.run(
+                documents=[docs[0] for docs in unique_misses.values()]
+            )["documents"]
+            # the embedder may return new documents, set the embedding on the input ones
+            for doc, docs in zip(embedded, unique_misses.values()):
+                for duplicate in docs:
+                    duplicate.embedding = doc.embedding
+            self.cache.set_many(
+                [doc.content or "" for doc in embedded],
+                [doc.embedding for doc in embedded],
+            )
+        for doc, embedding in zip(documents, cached):
+            if embedding is not None:
+                doc.embedding = embedding
+
+        self.hits += len(documents) - len(misses)
+        self.misses += len(misses)
+        logger.info(
+            f"Embedding cache: {len(documents) - len(misses)} hits, {len(misses)} misses"
+        )
+        return {"documents": documents}
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded in-process LRU cache of query embeddings keyed by (model name, normalized text).
+    Shared by the pipelines of all LLM settings, and safe to use from the pipeline executor threads.
+    """
+
+    def __init__(self, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        key = (model, normalize_text(text))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def set(self, model: str, text: str, embedding: list[float]):
+        key = (model, normalize_text(text))
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache()
+
+
+@component
+class CachedTextEmbedder:
+    """
+    Wrap a text embedder to reuse embeddings of questions asked before.
+    Drop-in replacement of the wrapped embedder in the RAG pipeline.
+    """
+
+    def __init__(
+        self, text_embedder, cache: QueryEmbeddingCache = QUERY_EMBEDDING_CACHE
+    ):
+        self.text_embedder = text_embedder
+        self.cache = cache
+
+    def warm_up(self):
+        self.text_embedder.warm_up()
+
+    @component.output_types(embedding=list[float])
+    def run(self, text: str):
+        model = self.text_embedder.model
+        embedding = self.cache.get(model, text)
+        if embedding is None:
+            embedding = self.text_embedder.run(text=text)["embedding"]
+            self.cache.set(model, text, embedding)
+        logger.debug(f"Query embedding cache: {self.cache.stats()}")
+        return {"embedding": embedding}
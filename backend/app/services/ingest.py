@@ -0,0 +1,297 @@
+"""
+Index files of a synced folder into the document store.
+Chunks from many files are collected into fixed-size embedding batches and written in bulk,
+while results are still attributed to each file for the processed/skipped counters and the manifest.
+"""
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from billiard.exceptions import WorkerLostError
+from haystack import Pipeline
+from haystack.dataclasses import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from app.models.status_models import FileManifestBunnet
+from app.services.document_stores import set_folder_of_source_files
+from app.services.manifest import (check_file_changed, load_folder_manifest,
+                                   mark_folder_indexed, save_manifest_entry)
+from app.services.parsing import SYNC_PARSE_WORKERS, parse_file
+
+logger = logging.getLogger(__name__)
+
+
+# "batched" embeds chunks across files, "per_file" embeds and writes each file on its own
+SYNC_INGEST_MODE = os.getenv("SYNC_INGEST_MODE", "batched").lower()
+SYNC_EMBED_BATCH_SIZE = int(os.getenv("SYNC_EMBED_BATCH_SIZE", 256))
+
+
+class FolderIndexer:
+    """
+    Convert, embed and write files of one synced folder, skipping files unchanged since the last sync.
+    Call `index_file` (or `index_files`) for the files, then `finish` to flush the last partial batch.
+    """
+
+    def __init__(
+        self,
+        folder_path: str,
+        home_dir: str,
+        conversion_pipeline: Pipeline,
+        document_embedder,
+        document_store,
+        manifest: dict[str, FileManifestBunnet] | None = None,
+        batch_size: int = SYNC_EMBED_BATCH_SIZE,
+        ingest_mode: str = SYNC_INGEST_MODE,
+        parse_executor: Executor | None = None,
+        parse_window: int = max(SYNC_PARSE_WORKERS, 1) * 2,
+    ):
+        self.folder_path = folder_path
+        self.home_dir = home_dir
+        self.conversion_pipeline = conversion_pipeline
+        self.document_embedder = document_embedder
+        self.document_store = document_store
+        self.manifest = (
+            manifest
+            if manifest is not None
+            else load_folder_manifest(folder_path, home_dir)
+        )
+        self.batch_size = batch_size
+        self.ingest_mode = ingest_mode
+        self.parse_executor = parse_executor
+        self.parse_window = parse_window
+
+        self.processed_files = 0
+        self.skipped_files = 0
+        self.unchanged_files = 0
+        self.source_files: list[str] = []
+        self.seen_files: set[str] = set()
+
+        # chunks waiting to be embedded, and the files they belong to
+        self._buffer: list[tuple[str, Document]] = []
+        self._pending_files: dict[str, dict] = {}
+        # unchanged files whose chunks were indexed before they carried the folder key
+        self._unmigrated_entries: list[FileManifestBunnet] = []
+
+    def index_file(self, file_path: Path):
+        job = self._prepare(file_path)
+        if job is None:
+            return
+        try:
+            documents = parse_file(
+                file_path,
+                job["source_file"],
+                self.conversion_pipeline,
+                folder=self.folder_path,
+            )
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {e}")
+            self.skipped_files += 1
+            return
+        self._enqueue(job, documents)
+
+    def index_files(self, file_paths: Iterable[Path]) -> Iterator[Path]:
+        """
+        Index the files, yielding each file path once it's handled so the caller can report progress.
+        With a parse executor, up to `parse_window` files are parsed ahead in the pool while the chunks
+        of earlier files are embedded in this process.
+        """
+        if self.parse_executor is None:
+            for file_path in file_paths:
+                self.index_file(file_path)
+                yield file_path
+            return
+
+        in_flight = deque()
+        for file_path in file_paths:
+            job = self._prepare(file_path)
+            future = self._submit_parse(job) if job else None
+            in_flight.append((file_path, job, future))
+            while len(in_flight) > self.parse_window:
+                yield self._collect_parse(*in_flight.popleft())
+        while in_flight:
+            yield self._collect_parse(*in_flight.popleft())
+
+    def finish(self):
+        """Embed and write the remaining chunks."""
+        while self._buffer:
+            self._flush(self.batch_size)
+        if self._unmigrated_entries:
+            try:
+                set_folder_of_source_files(
+                    self.folder_path,
+                    [entry.source_file for entry in self._unmigrated_entries],
+                )
+                mark_folder_indexed(self._unmigrated_entries)
+            except Exception as e:
+                logger.error(f"Error setting folder of unchanged files: {e}")
+            self._unmigrated_entries = []
+
+    def _prepare(self, file_path: Path) -> dict | None:
+        """
+        Check the file against the manifest.
+        Return its pending state if it needs to be parsed, None if it's already handled (unchanged or failed).
+        """
+        source_file = str(file_path.resolve())
+        self.seen_files.add(source_file)
+        try:
+            stat = file_path.stat()
+            entry = self.manifest.get(source_file)
+            changed, content_hash = check_file_changed(file_path, stat, entry)
+            if not changed:
+                # same content, only refresh size and mtime so next sync won't hash it again
+                if entry.size != stat.st_size or entry.mtime != stat.st_mtime:
+                    save_manifest_entry(
+                        self.folder_path,
+                        self.home_dir,
+                        source_file,
+                        stat,
+                        content_hash,
+                        entry.chunk_ids,
+                        entry=entry,
+                        folder_indexed=entry.folder_indexed,
+                    )
+                self.processed_files += 1
+                self.unchanged_files += 1
+                self.source_files.append(source_file)
+                if not entry.folder_indexed:
+                    self._unmigrated_entries.append(entry)
+                logger.info(f"Skipped unchanged {file_path}")
+                return None
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {e}")
+            self.skipped_files += 1
+            return None
+        return {
+            "file_path": file_path,
+            "source_file": source_file,
+            "stat": stat,
+            "content_hash": content_hash,
+            "entry": entry,
+        }
+
+    def _submit_parse(self, job: dict) -> Future | None:
+        try:
+            return self.parse_executor.submit(
+                parse_file,
+                job["file_path"],
+                job["source_file"],
+                folder=self.folder_path,
+            )
+        except Exception as e:
+            # e.g. the pool was shut down
+            logger.warning(f"Parse pool unavailable, parsing in-process: {e}")
+            self.parse_executor = None
+            return None
+
+    def _collect_parse(
+        self, file_path: Path, job: dict | None, future: Future | None
+    ) -> Path:
+        if job is None:
+            return file_path
+        try:
+            if future is None:
+                documents = parse_file(
+                    file_path,
+                    job["source_file"],
+                    self.conversion_pipeline,
+                    folder=self.folder_path,
+                )
+            else:
+                try:
+                    documents = future.result()
+                except (BrokenProcessPool, WorkerLostError) as e:
+                    logger.warning(f"Parse pool broken, parsing in-process: {e}")
+                    self.parse_executor = None
+                    documents = parse_file(
+                        file_path,
+                        job["source_file"],
+                        self.conversion_pipeline,
+                        folder=self.folder_path,
+                    )
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {e}")
+            self.skipped_files += 1
+            return file_path
+        self._enqueue(job, documents)
+        return file_path
+
+    def _enqueue(self, job: dict, documents: list[Document]):
+        source_file = job["source_file"]
+        if not documents:
+            self.skipped_files += 1
+            return
+        # remove chunks of the previous version before indexing the new one
+        entry = job["entry"]
+        if entry and entry.chunk_ids:
+            try:
+                self.document_store.delete_documents(document_ids=entry.chunk_ids)
+            except Exception as e:
+                logger.error(f"Error removing old chunks of {source_file}: {e}")
+                self.skipped_files += 1
+                return
+
+        job["remaining"] = len(documents)
+        job["chunk_ids"] = [doc.id for doc in documents]
+        self._pending_files[source_file] = job
+        self._buffer.extend((source_file, doc) for doc in documents)
+
+        if self.ingest_mode == "per_file":
+            self._flush(len(self._buffer))
+        while len(self._buffer) >= self.batch_size:
+            self._flush(self.batch_size)
+
+    def _flush(self, size: int):
+        batch, self._buffer = self._buffer[:size], self._buffer[size:]
+        if not batch:
+            return
+        documents = [doc for _, doc in batch]
+        try:
+            documents = self.document_embedder.run(documents=documents)["documents"]
+            self.document_store.write_documents(
+                documents, policy=DuplicatePolicy.OVERWRITE
+            )
+        except Exception as e:
+            logger.error(f"Error indexing batch of {len(batch)} chunks: {e}")
+            for source_file in {source_file for source_file, _ in batch}:
+                self._fail_file(source_file)
+            return
+
+        for source_file, _ in batch:
+            pending = self._pending_files.get(source_file)
+            if pending is None:
+                continue
+            pending["remaining"] -= 1
+            if pending["remaining"] == 0:
+                self._complete_file(source_file)
+
+    def _complete_file(self, source_file: str):
+        pending = self._pending_files.pop(source_file)
+        save_manifest_entry(
+            self.folder_path,
+            self.home_dir,
+            source_file,
+            pending["stat"],
+            pending["content_hash"],
+            pending["chunk_ids"],
+            entry=pending["entry"],
+        )
+        self.processed_files += 1
+        self.source_files.append(source_file)
+        logger.info(f"Indexed {len(pending['chunk_ids'])} chunks of {source_file}")
+
+    def _fail_file(self, source_file: str):
+        pending = self._pending_files.pop(source_file, None)
+        if pending is None:
+            return
+        # drop the rest of its chunks, and the ones already written in earlier batches
+        self._buffer = [item for item in self._buffer if item[0] != source_file]
+        try:
+            self.document_store.delete_documents(document_ids=pending["chunk_ids"])
+        except Exception as e:
+            logger.error(f"Error removing partial chunks of {source_file}: {e}")
+        self.skipped_files += 1
@@ -0,0 +1,164 @@
+"""
+Per-file sync manifest, so a re-sync only processes new or modified files
+and removes the chunks of files deleted from the folder.
+"""
+
+import hashlib
+import logging
+import os
+import re
+from datetime import UTC, datetime
+from pathlib import Path
+
+from bunnet.operators import In
+
+from app.models.status_models import FileManifestBunnet
+
+logger = logging.getLogger(__name__)
+
+
+HASH_BLOCK_SIZE = 1024 * 1024  # read files 1MB at a time when hashing
+
+
+def hash_file(file_path) -> str:
+    """Return the sha256 hex digest of the file content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_folder_manifest(
+    folder_path: str, home_dir: str, source_files: list[str] | None = None
+) -> dict[str, FileManifestBunnet]:
+    """
+    Return manifest entries of the synced folder, keyed by source file.
+    Only entries of the given source files are loaded if provided (e.g. for a shard of the folder).
+    """
+    query = FileManifestBunnet.find(
+        FileManifestBunnet.folder_path == folder_path,
+        FileManifestBunnet.home_dir == home_dir,
+    )
+    if source_files is not None:
+        query = query.find(In(FileManifestBunnet.source_file, source_files))
+    return {entry.source_file: entry for entry in query.to_list()}
+
+
+def check_file_changed(
+    file_path, stat: os.stat_result, entry: FileManifestBunnet | None
+) -> tuple[bool, str]:
+    """
+    Return (changed, content_hash) of the file compared to its manifest entry.
+    The file is only hashed when size or mtime differ from the manifest, so untouched files cost one stat call.
+    """
+    if entry and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+        return False, entry.content_hash
+    content_hash = hash_file(file_path)
+    if entry and entry.content_hash == content_hash:
+        return False, content_hash
+    return True, content_hash
+
+
+def save_manifest_entry(
+    folder_path: str,
+    home_dir: str,
+    source_file: str,
+    stat: os.stat_result,
+    content_hash: str,
+    chunk_ids: list[str],
+    entry: FileManifestBunnet | None = None,
+    folder_indexed: bool = True,
+) -> FileManifestBunnet:
+    """Insert or update the manifest entry of a synced file."""
+    if entry is None:
+        entry = FileManifestBunnet(
+            folder_path=folder_path,
+            home_dir=home_dir,
+            source_file=source_file,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            content_hash=content_hash,
+        )
+    entry.size = stat.st_size
+    entry.mtime = stat.st_mtime
+    entry.content_hash = content_hash
+    entry.chunk_ids = chunk_ids
+    entry.folder_indexed = folder_indexed
+    entry.last_synced_at = datetime.now(tz=UTC)
+    entry.save()
+    return entry
+
+
+def mark_folder_indexed(entries: list[FileManifestBunnet]):
+    """Record that the chunks of the files carry the folder key, so they are not backfilled again."""
+    if not entries:
+        return
+    FileManifestBunnet.find(
+        In(FileManifestBunnet.id, [entry.id for entry in entries])
+    ).update({"$set": {"folder_indexed": True}}).run()
+    for entry in entries:
+        entry.folder_indexed = True
+
+
+def is_under(path: str, paths) -> bool:
+    """Whether the path is one of the paths, or under one of them."""
+    return any(
+        path == other.rstrip(os.sep) or path.startswith(other.rstrip(os.sep) + os.sep)
+        for other in paths
+    )
+
+
+def remove_deleted_files(
+    manifest: dict[str, FileManifestBunnet],
+    seen_files: set[str],
+    document_store,
+    unscanned: set[str] = frozenset(),
+) -> list[str]:
+    """
+    Delete chunks and manifest entries of files that are no longer in the folder.
+    Files under the `unscanned` paths of the folder scan are kept, the scan couldn't tell if they are still there.
+    Return the removed source files.
+    """
+    unscanned = [str(Path(path).resolve()) for path in unscanned]
+    removed = []
+    kept = 0
+    for source_file, entry in manifest.items():
+        if source_file in seen_files:
+            continue
+        if is_under(source_file, unscanned):
+            kept += 1
+            continue
+        if entry.chunk_ids:
+            document_store.delete_documents(document_ids=entry.chunk_ids)
+        entry.delete()
+        removed.append(source_file)
+        logger.info(
+            f"Removed {len(entry.chunk_ids)} chunks of deleted file {source_file}"
+        )
+    if kept:
+        logger.warning(f"Kept {kept} files not seen under unreadable paths {unscanned}")
+    return removed
+
+
+def remove_source_files(
+    folder_path: str, home_dir: str, paths: list[str], document_store
+) -> list[str]:
+    """
+    Delete chunks and manifest entries of the given files, or of all files under the given directories.
+    Return the removed source files.
+    """
+    if not paths:
+        return []
+    conditions = [{"source_file": {"$in": paths}}]
+    conditions.extend(
+        {"source_file": {"$regex": f"^{re.escape(path.rstrip(os.sep) + os.sep)}"}}
+        for path in paths
+    )
+    entries = FileManifestBunnet.find(
+        FileManifestBunnet.folder_path == folder_path,
+        FileManifestBunnet.home_dir == home_dir,
+        {"$or": conditions},
+    ).to_list()
+    removed = {entry.source_file: entry for entry in entries}
+    return remove_deleted_files(removed, set(), document_store)
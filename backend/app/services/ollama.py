@@ -0,0 +1,40 @@
+"""
+Ollama chat generator, imported only when a pipeline uses Ollama.
+"""
+
+import copy
+from typing import Any, Callable
+
+from haystack import component
+from haystack.dataclasses import ChatMessage, StreamingChunk
+from haystack_integrations.components.generators.ollama import \
+    OllamaChatGenerator
+
+
+@component
+class StreamingOllamaChatGenerator(OllamaChatGenerator):
+    """
+    OllamaChatGenerator that also takes the streaming callback per run, like the Gemini and HuggingFace generators,
+    so one pipeline can stream answers of concurrent requests to different clients.
+    """
+
+    @component.output_types(replies=list[ChatMessage])
+    def run(
+        self,
+        messages: list[ChatMessage],
+        generation_kwargs: dict[str, Any] | None = None,
+        tools: list | None = None,
+        streaming_callback: Callable[[StreamingChunk], None] | None = None,
+    ):
+        generator = self
+        if streaming_callback is not None:
+            # a copy per run, sharing the client, so concurrent runs don't swap callbacks;
+            # the integration refuses tools or response_format along with streaming
+            generator = copy.copy(self)
+            generator.streaming_callback = streaming_callback
+        return OllamaChatGenerator.run(
+            generator,
+            messages=messages,
+            generation_kwargs=generation_kwargs,
+            tools=tools,
+        )
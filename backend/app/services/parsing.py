@@ -0,0 +1,112 @@
+"""
+Parse (convert, clean and split) files in a process pool, so CPU bound parsing such as PDF scales with cores
+while the embedding model is only loaded once, in the Celery worker process that embeds the chunks.
+"""
+
+import logging
+import os
+from concurrent.futures import Executor, Future
+from functools import partial
+
+import billiard
+from billiard.einfo import ExceptionWithTraceback
+from haystack import Pipeline
+from haystack.dataclasses import Document
+
+from app.services.pipelines import build_preprocessing_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+# number of parser processes per Celery worker process; 0 parses in the worker process itself
+SYNC_PARSE_WORKERS = int(os.getenv("SYNC_PARSE_WORKERS", 0))
+
+# conversion pipeline of a parser process, built by the pool initializer
+_PARSE_PIPELINE = None
+
+
+def _init_parse_worker():
+    global _PARSE_PIPELINE
+    _PARSE_PIPELINE = build_preprocessing_pipeline(
+        document_store=None, add_metadata=True
+    )
+
+
+def parse_file(
+    file_path,
+    source_file: str,
+    pipeline: Pipeline | None = None,
+    folder: str | None = None,
+) -> list[Document]:
+    """
+    Return the chunks of the file, without embedding.
+    Uses the pipeline of the parser process when no pipeline is given.
+    """
+    pipeline = pipeline or _PARSE_PIPELINE
+    if pipeline is None:
+        raise RuntimeError("Parse pipeline not initialized!")
+    output = pipeline.run(
+        {
+            "file_type_router": {
+                "sources": [file_path],
+            },
+            "add_source_meta": {"source_file": source_file, "folder": folder},
+        }
+    )
+    # output for a converted file: {'document_splitter': {'documents': [...]}} ('sparse_embedder' for hybrid retrieval)
+    # output for a skipped file: {'file_type_router': {'unclassified': [PosixPath('/host/home/Desktop/Screenshot.png')]}}
+    chunks = output.get("sparse_embedder") or output.get("document_splitter") or {}
+    return chunks.get("documents", [])
+
+
+def _set_exception(future: Future, einfo):
+    # billiard reports failures as ExceptionInfo, wrapping the exception raised in the parser process
+    exception = einfo.exception
+    if isinstance(exception, ExceptionWithTraceback):
+        exception = exception.exc
+    future.set_exception(exception)
+
+
+class ParsePool(Executor):
+    """
+    `concurrent.futures` interface over a billiard process pool.
+    Celery prefork pool processes are daemonic, and the standard library refuses to start children
+    from daemonic processes, billiard (Celery's fork of multiprocessing) does not.
+    """
+
+    def __init__(self, max_workers: int):
+        # "spawn" so parser processes don't inherit the embedding model or database clients of the worker
+        self._pool = billiard.get_context("spawn").Pool(
+            max_workers, initializer=_init_parse_worker
+        )
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._pool.apply_async(
+            fn,
+            args,
+            kwargs,
+            callback=future.set_result,
+            error_callback=partial(_set_exception, future),
+        )
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        if cancel_futures:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        if wait:
+            self._pool.join()
+
+
+def build_parse_executor(max_workers: int = SYNC_PARSE_WORKERS) -> Executor | None:
+    """Return a process pool for `parse_file`, or None to parse in-process."""
+    if max_workers <= 0:
+        return None
+    try:
+        return ParsePool(max_workers)
+    except Exception as e:
+        logger.warning(f"Cannot create parse pool, parsing in-process: {e}")
+        return None
@@ -2,57 +2,112 @@
 Haystack pipelines
 """
 
+import hashlib
 import logging
 import os
+import threading
 from typing import Any
 
 from haystack import Pipeline, component
 from haystack.components.builders import AnswerBuilder, ChatPromptBuilder
-from haystack.components.converters import (MarkdownToDocument,
-                                            PyPDFToDocument,
-                                            TextFileToDocument)
-from haystack.components.embedders import (
-    SentenceTransformersDocumentEmbedder, SentenceTransformersTextEmbedder)
-from haystack.components.generators.chat import HuggingFaceAPIChatGenerator
-from haystack.components.joiners import DocumentJoiner
-from haystack.components.preprocessors import DocumentCleaner, DocumentSplitter
-from haystack.components.retrievers.in_memory import InMemoryEmbeddingRetriever
-from haystack.components.routers import FileTypeRouter
-from haystack.components.writers import DocumentWriter
 from haystack.dataclasses import ChatMessage, Document
 from haystack.document_stores.types import DocumentStore, DuplicatePolicy
 from haystack.utils import Secret
-from haystack.utils.hf import HFGenerationAPIType
-from haystack_integrations.components.connectors.langfuse import \
-    LangfuseConnector
-from haystack_integrations.components.generators.google_ai import \
-    GoogleAIGeminiChatGenerator
-from haystack_integrations.components.generators.ollama import \
-    OllamaChatGenerator
-from haystack_integrations.components.retrievers.qdrant import \
-    QdrantEmbeddingRetriever
-
-from app.services.document_stores import (IN_MEMORY_DOCUMENT_STORE,
-                                          QDRANT_DOCUMENT_STORE)
+
+from app.services.context import ContextPacker, context_token_budget
+from app.services.document_stores import (HYBRID_RETRIEVAL,
+                                          get_in_memory_document_store,
+                                          get_qdrant_document_store)
+from app.services.embedding_cache import (QUERY_EMBEDDING_CACHE_SIZE,
+                                          CachedDocumentEmbedder,
+                                          CachedTextEmbedder, EmbeddingCache)
+from app.services.reranker import (RERANK_CANDIDATES, RERANKER_MODEL,
+                                   RETRIEVER_TOP_K, CrossEncoderRanker)
+from app.services.sparse import (BM25SparseDocumentEmbedder,
+                                 BM25SparseTextEmbedder)
 
 logger = logging.getLogger(__name__)
 
 
 # matching document & text embedders must use the same model
 embedder_model = "sentence-transformers/all-MiniLM-L6-v2"
+# directory of locally saved embedding models (see scripts/download_models.py), loaded instead of the hub copy
+EMBEDDER_MODEL_DIR = os.getenv("EMBEDDER_MODEL_DIR")
+
+
+def resolve_embedder_model(model: str = embedder_model) -> str:
+    """
+    Return the path of the model saved in EMBEDDER_MODEL_DIR if there is one, else the hub model name.
+    Loading from a local path never downloads weights at runtime.
+    """
+    if EMBEDDER_MODEL_DIR:
+        local_path = os.path.join(EMBEDDER_MODEL_DIR, model)
+        if os.path.isdir(local_path):
+            return local_path
+        logger.warning(f"{model} not found in {EMBEDDER_MODEL_DIR=}, using the hub")
+    return model
 
 
 @component
 class AddSourceMetadata:
     @component.output_types(documents=list[Document])
-    def run(self, documents: list[Document], source_file: str):
+    def run(
+        self, documents: list[Document], source_file: str, folder: str | None = None
+    ):
         for doc in documents:
             doc.meta["source_file"] = source_file
+            if folder:
+                # synced folder key, for folder scoped retrieval
+                doc.meta["folder"] = folder
         return {"documents": documents}
 
 
+def _tracer(name: str):
+    # Langfuse (and its API client) is only imported once a pipeline is built
+    from haystack_integrations.components.connectors.langfuse import \
+        LangfuseConnector
+
+    return LangfuseConnector(name=name)
+
+
+def build_chat_generator(
+    llm_provider: str, llm_model: str, llm_api_token: str | None = None
+):
+    """
+    Return the chat generator of the LLM provider, importing only that provider's integration.
+    All of them take a streaming callback per run.
+    """
+    if llm_provider == "ollama":
+        from app.services.ollama import StreamingOllamaChatGenerator
+
+        return StreamingOllamaChatGenerator(
+            url=os.getenv("OLLAMA_LLM_BASE_URL"), model=llm_model
+        )
+    if llm_provider == "huggingFace":
+        from haystack.components.generators.chat import \
+            HuggingFaceAPIChatGenerator
+        from haystack.utils.hf import HFGenerationAPIType
+
+        return HuggingFaceAPIChatGenerator(
+            api_type=HFGenerationAPIType.SERVERLESS_INFERENCE_API,  # free version LLM
+            api_params={"model": llm_model},
+            # token=Secret.from_env_var("HF_API_TOKEN"),
+            token=Secret.from_token(llm_api_token),
+        )
+    # https://ai.google.dev/gemini-api/docs/models
+    # https://ai.google.dev/gemini-api/docs/rate-limits
+    from haystack_integrations.components.generators.google_ai import \
+        GoogleAIGeminiChatGenerator
+
+    return GoogleAIGeminiChatGenerator(
+        # api_key=Secret.from_env_var("GOOGLE_API_KEY"),
+        api_key=Secret.from_token(llm_api_token),
+        model=llm_model,
+    )
+
+
 def build_preprocessing_pipeline(
-    document_store: DocumentStore,
+    document_store: DocumentStore | None,
     file_types: list[str] = [
         "text/plain",
         "text/html",
@@ -61,19 +116,33 @@ def build_preprocessing_pipeline(
     ],
     document_embedder: Any | None = None,
     add_metadata: bool = False,
+    embedding_cache: EmbeddingCache | None = None,
+    sparse_embeddings: bool = HYBRID_RETRIEVAL,
 ) -> Pipeline:
     """
     Return an indexing pipeline that loads the document store.
+    Without a document store (and embedder) the pipeline stops at the splitter (or sparse embedder)
+    and outputs the chunks, so the caller can embed and write them in batches across files.
+    With an embedding cache, only chunks not embedded before (by any worker) go through the embedder.
+    With sparse embeddings, chunks also get BM25 sparse vectors for hybrid retrieval.
     """
+    # converters (and pypdf) are only needed where files are indexed, not in the API process
+    from haystack.components.converters import (MarkdownToDocument,
+                                                PyPDFToDocument,
+                                                TextFileToDocument)
+    from haystack.components.joiners import DocumentJoiner
+    from haystack.components.preprocessors import (DocumentCleaner,
+                                                   DocumentSplitter)
+    from haystack.components.routers import FileTypeRouter
+    from haystack.components.writers import DocumentWriter
+
     logger.info(
         f'langfuse env vars: {os.getenv("LANGFUSE_HOST")=}, {os.getenv("LANGFUSE_PUBLIC_KEY")=}, {os.getenv("LANGFUSE_SECRET_KEY")=}'
     )
 
     preprocessing_pipeline = Pipeline()
 
-    preprocessing_pipeline.add_component(
-        "tracer", LangfuseConnector(name="Pre-processing pipeline")
-    )
+    preprocessing_pipeline.add_component("tracer", _tracer("Pre-processing pipeline"))
 
     text_file_converter = TextFileToDocument()
     markdown_converter = MarkdownToDocument()
@@ -106,17 +175,22 @@ def build_preprocessing_pipeline(
     preprocessing_pipeline.add_component(
         instance=document_splitter, name="document_splitter"
     )
+    if document_embedder and embedding_cache:
+        document_embedder = CachedDocumentEmbedder(
+            document_embedder=document_embedder, cache=embedding_cache
+        )
     if document_embedder:
         preprocessing_pipeline.add_component(
             instance=document_embedder, name="document_embedder"
         )
-    # set duplicate policy to be "overwrite"
-    document_writer = DocumentWriter(
-        document_store=document_store, policy=DuplicatePolicy.OVERWRITE
-    )
-    preprocessing_pipeline.add_component(
-        instance=document_writer, name="document_writer"
-    )
+    if document_store:
+        # set duplicate policy to be "overwrite"
+        document_writer = DocumentWriter(
+            document_store=document_store, policy=DuplicatePolicy.OVERWRITE
+        )
+        preprocessing_pipeline.add_component(
+            instance=document_writer, name="document_writer"
+        )
 
     preprocessing_pipeline.connect(
         "file_type_router.text/plain", "text_file_converter.sources"
@@ -140,11 +214,20 @@ def build_preprocessing_pipeline(
     else:
         preprocessing_pipeline.connect("document_cleaner", "document_splitter")
 
+    chunks_output = "document_splitter"
+    if sparse_embeddings:
+        preprocessing_pipeline.add_component(
+            "sparse_embedder", BM25SparseDocumentEmbedder()
+        )
+        preprocessing_pipeline.connect("document_splitter", "sparse_embedder")
+        chunks_output = "sparse_embedder"
+
     if document_embedder:
-        preprocessing_pipeline.connect("document_splitter", "document_embedder")
-        preprocessing_pipeline.connect("document_embedder", "document_writer")
-    else:
-        preprocessing_pipeline.connect("document_splitter", "document_writer")
+        preprocessing_pipeline.connect(chunks_output, "document_embedder")
+        if document_store:
+            preprocessing_pipeline.connect("document_embedder", "document_writer")
+    elif document_store:
+        preprocessing_pipeline.connect(chunks_output, "document_writer")
 
     return preprocessing_pipeline
 
@@ -155,17 +238,33 @@ def _build_rag_pipeline(
     llm_provider: str,
     llm_model: str,
     llm_api_token: str | None = None,
+    sparse_text_embedder=None,
+    ranker=None,
 ):
     """
     Return a RAG pipeline.
+    With a sparse text embedder, the retriever also gets the sparse embedding of the question (hybrid retrieval).
+    With a ranker, retrieved documents are re-ranked and cut before they go in the prompt.
+    Conversation memories are passed to the context packer, not to the prompt builder.
     """
     basic_rag_pipeline = Pipeline()
 
-    basic_rag_pipeline.add_component("tracer", LangfuseConnector(name="RAG pipeline"))
+    basic_rag_pipeline.add_component("tracer", _tracer("RAG pipeline"))
 
     # Add components to your pipeline
+    if QUERY_EMBEDDING_CACHE_SIZE > 0:
+        # repeated and retried questions skip the embedding model
+        text_embedder = CachedTextEmbedder(text_embedder=text_embedder)
     basic_rag_pipeline.add_component("text_embedder", text_embedder)
+    if sparse_text_embedder:
+        basic_rag_pipeline.add_component("sparse_text_embedder", sparse_text_embedder)
     basic_rag_pipeline.add_component("retriever", retriever)
+    if ranker:
+        basic_rag_pipeline.add_component("ranker", ranker)
+    # merge overlapping chunks, and fit documents and memories in the context budget of the model
+    basic_rag_pipeline.add_component(
+        "context_packer", ContextPacker(token_budget=context_token_budget(llm_model))
+    )
 
     user_message_template = [
         ChatMessage.from_user(
@@ -200,26 +299,7 @@ Answer:
     )
     basic_rag_pipeline.add_component("prompt_builder", prompt_builder)
 
-    # toggle between generators
-    if llm_provider == "ollama":
-        generator = OllamaChatGenerator(
-            url=os.getenv("OLLAMA_LLM_BASE_URL"), model=llm_model
-        )
-    elif llm_provider == "huggingFace":
-        generator = HuggingFaceAPIChatGenerator(
-            api_type=HFGenerationAPIType.SERVERLESS_INFERENCE_API,  # free version LLM
-            api_params={"model": llm_model},
-            # token=Secret.from_env_var("HF_API_TOKEN"),
-            token=Secret.from_token(llm_api_token),
-        )
-    else:
-        # https://ai.google.dev/gemini-api/docs/models
-        # https://ai.google.dev/gemini-api/docs/rate-limits
-        generator = GoogleAIGeminiChatGenerator(
-            # api_key=Secret.from_env_var("GOOGLE_API_KEY"),
-            api_key=Secret.from_token(llm_api_token),
-            model=llm_model,
-        )
+    generator = build_chat_generator(llm_provider, llm_model, llm_api_token)
     basic_rag_pipeline.add_component("generator", generator)
 
     answer_builder = AnswerBuilder()
@@ -227,12 +307,23 @@ Answer:
 
     # Connect the components to each other
     basic_rag_pipeline.connect("text_embedder.embedding", "retriever.query_embedding")
-    basic_rag_pipeline.connect("retriever.documents", "prompt_builder.documents")
+    if sparse_text_embedder:
+        basic_rag_pipeline.connect(
+            "sparse_text_embedder.sparse_embedding", "retriever.query_sparse_embedding"
+        )
+    # documents of the prompt, re-ranked if there is a ranker
+    documents_output = "retriever.documents"
+    if ranker:
+        basic_rag_pipeline.connect("retriever.documents", "ranker.documents")
+        documents_output = "ranker.documents"
+    basic_rag_pipeline.connect(documents_output, "context_packer.documents")
+    basic_rag_pipeline.connect("context_packer.documents", "prompt_builder.documents")
+    basic_rag_pipeline.connect("context_packer.memories", "prompt_builder.memories")
     basic_rag_pipeline.connect("prompt_builder.prompt", "generator.messages")
     basic_rag_pipeline.connect("generator.replies", "answer_builder.replies")
-    # Pass retrieved documents to answer_builder
+    # Pass the documents of the prompt to answer_builder
     # (NOT generator because HuggingFaceAPIChatGenerator does not take documents as input)
-    basic_rag_pipeline.connect("retriever.documents", "answer_builder.documents")
+    basic_rag_pipeline.connect("context_packer.documents", "answer_builder.documents")
 
     return basic_rag_pipeline
 
@@ -240,9 +331,13 @@ Answer:
 def build_rag_pipeline_in_memory(
     llm_provider: str, llm_model: str, llm_api_token: str | None = None
 ):
+    from haystack.components.embedders import SentenceTransformersTextEmbedder
+    from haystack.components.retrievers.in_memory import \
+        InMemoryEmbeddingRetriever
+
     return _build_rag_pipeline(
-        retriever=InMemoryEmbeddingRetriever(IN_MEMORY_DOCUMENT_STORE),
-        text_embedder=SentenceTransformersTextEmbedder(model=embedder_model),
+        retriever=InMemoryEmbeddingRetriever(get_in_memory_document_store()),
+        text_embedder=SentenceTransformersTextEmbedder(model=resolve_embedder_model()),
         llm_provider=llm_provider,
         llm_model=llm_model,
         llm_api_token=llm_api_token,
@@ -252,11 +347,20 @@ def build_rag_pipeline_in_memory(
 def build_rag_pipeline_in_qdrant(
     llm_provider: str, llm_model: str, llm_api_token: str | None = None
 ):
+    from haystack.components.embedders import SentenceTransformersTextEmbedder
+
+    from app.services.retrievers import QdrantRetriever
+
+    # a wider candidate set when the re-ranker picks the chunks of the prompt
+    ranker = CrossEncoderRanker() if RERANKER_MODEL else None
     return _build_rag_pipeline(
-        retriever=QdrantEmbeddingRetriever(
-            document_store=QDRANT_DOCUMENT_STORE, top_k=5
+        retriever=QdrantRetriever(
+            document_store=get_qdrant_document_store(),
+            top_k=RERANK_CANDIDATES if ranker else RETRIEVER_TOP_K,
         ),
-        text_embedder=SentenceTransformersTextEmbedder(model=embedder_model),
+        sparse_text_embedder=BM25SparseTextEmbedder() if HYBRID_RETRIEVAL else None,
+        ranker=ranker,
+        text_embedder=SentenceTransformersTextEmbedder(model=resolve_embedder_model()),
         llm_provider=llm_provider,
         llm_model=llm_model,
         llm_api_token=llm_api_token,
@@ -271,9 +375,7 @@ def build_summary_pipeline(
     """
     summary_pipeline = Pipeline()
 
-    summary_pipeline.add_component(
-        "tracer", LangfuseConnector(name="Chat summary pipeline")
-    )
+    summary_pipeline.add_component("tracer", _tracer("Chat summary pipeline"))
 
     # Add components to your pipeline
     user_message_template = [
@@ -295,23 +397,7 @@ def build_summary_pipeline(
     )
     summary_pipeline.add_component("prompt_builder", prompt_builder)
 
-    # toggle between generators
-    if llm_provider == "ollama":
-        generator = OllamaChatGenerator(
-            url=os.getenv("OLLAMA_LLM_BASE_URL"), model=llm_model
-        )
-    elif llm_provider == "huggingFace":
-        generator = HuggingFaceAPIChatGenerator(
-            api_type=HFGenerationAPIType.SERVERLESS_INFERENCE_API,  # free version LLM
-            api_params={"model": llm_model},
-            token=Secret.from_token(llm_api_token),
-        )
-    else:
-        # https://ai.google.dev/gemini-api/docs/models
-        # https://ai.google.dev/gemini-api/docs/rate-limits
-        generator = GoogleAIGeminiChatGenerator(
-            api_key=Secret.from_token(llm_api_token), model=llm_model
-        )
+    generator = build_chat_generator(llm_provider, llm_model, llm_api_token)
     summary_pipeline.add_component("generator", generator)
 
     answer_builder = AnswerBuilder()
@@ -324,11 +410,124 @@ def build_summary_pipeline(
     return summary_pipeline
 
 
-# matching document & text embedders must use the same model
-embedder_model = "sentence-transformers/all-MiniLM-L6-v2"
+def build_memory_pipeline(
+    llm_provider: str, llm_model: str, llm_api_token: str | None = None
+):
+    """
+    Return a pipeline to fold older conversation turns into the rolling summary of the conversation.
+    """
+    memory_pipeline = Pipeline()
+
+    memory_pipeline.add_component("tracer", _tracer("Chat memory pipeline"))
+
+    user_message_template = [
+        ChatMessage.from_user(
+            """
+Update the summary of a conversation with its next turns.
+Keep the facts, names, files and decisions needed to follow up on the conversation. Answer with the summary only, in at most 150 words.
+
+{% if summary %}
+Summary so far:
+{{ summary }}
+{% endif %}
+
+Next turns:
+{% for message in memories %}
+{{ message.role.capitalize() }}: {{ message.text }}
+{% endfor %}
+            """
+        )
+    ]
+    prompt_builder = ChatPromptBuilder(
+        template=user_message_template,
+        variables=["summary", "memories"],
+        required_variables=["memories"],
+    )
+    memory_pipeline.add_component("prompt_builder", prompt_builder)
+
+    generator = build_chat_generator(llm_provider, llm_model, llm_api_token)
+    memory_pipeline.add_component("generator", generator)
+
+    answer_builder = AnswerBuilder()
+    memory_pipeline.add_component("answer_builder", answer_builder)
 
-# preprocessing (no metadata)
-IN_MEMORY_PREPROCESSING_PIPELINE = build_preprocessing_pipeline(
-    document_store=IN_MEMORY_DOCUMENT_STORE,
-    document_embedder=SentenceTransformersDocumentEmbedder(model=embedder_model),
-)
+    memory_pipeline.connect("prompt_builder.prompt", "generator.messages")
+    memory_pipeline.connect("generator.replies", "answer_builder.replies")
+
+    return memory_pipeline
+
+
+# warmed RAG, summary and memory pipelines, keyed by (kind, llm_provider, llm_model, api token fingerprint)
+_PIPELINE_REGISTRY: dict[tuple, Pipeline] = {}
+_PIPELINE_REGISTRY_LOCK = threading.Lock()
+
+
+def _token_fingerprint(llm_api_token: str | None) -> str | None:
+    # the registry (and its logs) never hold the token itself
+    if not llm_api_token:
+        return None
+    return hashlib.sha256(llm_api_token.encode("utf-8")).hexdigest()[:12]
+
+
+def _get_pipeline(
+    kind: str,
+    build,
+    llm_provider: str,
+    llm_model: str,
+    llm_api_token: str | None = None,
+) -> Pipeline:
+    key = (kind, llm_provider, llm_model, _token_fingerprint(llm_api_token))
+    with _PIPELINE_REGISTRY_LOCK:
+        pipeline = _PIPELINE_REGISTRY.get(key)
+        if pipeline is None:
+            pipeline = build(
+                llm_provider=llm_provider,
+                llm_model=llm_model,
+                llm_api_token=llm_api_token,
+            )
+            # loads the text embedder model; embedders of the same model share it across pipelines
+            pipeline.warm_up()
+            _PIPELINE_REGISTRY[key] = pipeline
+            logger.info(f"Built {kind} pipeline for {key}")
+    return pipeline
+
+
+def get_rag_pipeline(
+    llm_provider: str, llm_model: str, llm_api_token: str | None = None
+) -> Pipeline:
+    """
+    Return the warmed RAG pipeline in Qdrant for the LLM settings, built once and reused by all requests.
+    Blocks while building, so call it off the event loop.
+    """
+    return _get_pipeline(
+        "rag", build_rag_pipeline_in_qdrant, llm_provider, llm_model, llm_api_token
+    )
+
+
+def get_summary_pipeline(
+    llm_provider: str, llm_model: str, llm_api_token: str | None = None
+) -> Pipeline:
+    """Same as `get_rag_pipeline`, for the conversation summary pipeline."""
+    return _get_pipeline(
+        "summary", build_summary_pipeline, llm_provider, llm_model, llm_api_token
+    )
+
+
+def get_memory_pipeline(
+    llm_provider: str, llm_model: str, llm_api_token: str | None = None
+) -> Pipeline:
+    """Same as `get_rag_pipeline`, for the conversation memory pipeline."""
+    return _get_pipeline(
+        "memory", build_memory_pipeline, llm_provider, llm_model, llm_api_token
+    )
+
+
+def prune_pipelines(
+    llm_provider: str, llm_model: str, llm_api_token: str | None = None
+):
+    """Drop cached pipelines of other LLM settings than the given (current) ones."""
+    current = (llm_provider, llm_model, _token_fingerprint(llm_api_token))
+    with _PIPELINE_REGISTRY_LOCK:
+        for key in list(_PIPELINE_REGISTRY):
+            if key[1:] != current:
+                del _PIPELINE_REGISTRY[key]
@@ -0,0 +1,103 @@
+"""
+Optional cross-encoder re-ranking of retrieved chunks: the retriever fetches a wider candidate set,
+a small cross-encoder scores (question, chunk) pairs on CPU in one batch, and only the best chunks go in the prompt.
+Re-ranking is capped in time, past the cap the retriever order is kept.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from haystack import component
+from haystack.dataclasses import Document
+
+logger = logging.getLogger(__name__)
+
+
+# cross-encoder model, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"; empty disables re-ranking
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+# chunks retrieved for re-ranking, and chunks kept for the prompt
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", 3))
+# max time to wait for the scores before falling back to the retriever order
+RERANK_TIMEOUT_MS = int(os.getenv("RERANK_TIMEOUT_MS", 300))
+# chunks kept in the retriever order when scoring is skipped, as many as retrieved without re-ranker
+RETRIEVER_TOP_K = 5
+
+
+@component
+class CrossEncoderRanker:
+    """
+    Re-rank documents with a cross-encoder and keep the top k, or keep the first fallback_top_k of the input order
+    when scoring (including its wait behind other scorings) takes longer than the timeout,
+    or while a timed out scoring is still running.
+    """
+
+    def __init__(
+        self,
+        model: str = RERANKER_MODEL,
+        top_k: int = RERANK_TOP_K,
+        timeout_ms: int = RERANK_TIMEOUT_MS,
+        fallback_top_k: int = RETRIEVER_TOP_K,
+    ):
+        self.model = model
+        self.top_k = top_k
+        self.timeout_ms = timeout_ms
+        self.fallback_top_k = fallback_top_k
+        self.timeouts = 0
+        self._cross_encoder = None
+        # one scoring at a time, concurrent questions queue within their timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        # a scoring past its timeout that couldn't be cancelled, new scorings would only queue behind it
+        self._overdue: Future | None = None
+
+    def warm_up(self):
+        if self._cross_encoder is None:
+            from sentence_transformers import CrossEncoder
+
+            from app.services.pipelines import resolve_embedder_model
+
+            self._cross_encoder = CrossEncoder(
+                resolve_embedder_model(self.model), device="cpu"
+            )
+
+    def _score(self, query: str, documents: list[Document]) -> list[float]:
+        pairs = [(query, doc.content or "") for doc in documents]
+        return self._cross_encoder.predict(pairs, batch_size=len(pairs)).tolist()
+
+    @component.output_types(documents=list[Document])
+    def run(self, query: str, documents: list[Document], top_k: int | None = None):
+        top_k = top_k or self.top_k
+        if len(documents) <= 1:
+            return {"documents": documents[:top_k]}
+        overdue = self._overdue
+        if overdue is not None and not overdue.done():
+            logger.warning("Re-ranker busy, keeping the retriever order")
+            return {"documents": documents[: self.fallback_top_k]}
+
+        start = time.perf_counter()
+        future = self._executor.submit(self._score, query, documents)
+        try:
+            scores = future.result(timeout=self.timeout_ms / 1000)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            # still queued: dropped, running: refuse scorings until it's done
+            if not future.cancel():
+                self._overdue = future
+            logger.warning(
+                f"Re-ranking {len(documents)} chunks took over {self.timeout_ms}ms, keeping the retriever order"
+            )
+            return {"documents": documents[: self.fallback_top_k]}
+        except Exception as e:
+            logger.error(f"Re-ranking failed, keeping the retriever order: {e}")
+            return {"documents": documents[: self.fallback_top_k]}
+
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)
+        for doc, score in ranked:
+            doc.score = score
+        logger.info(
+            f"Re-ranked {len(documents)} chunks in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return {"documents": [doc for doc, _ in ranked[:top_k]]}
@@ -0,0 +1,128 @@
+"""
+Retrievers of the RAG pipelines
+"""
+
+from typing import Any
+
+from haystack import component
+from haystack.dataclasses import Document, SparseEmbedding
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack_integrations.document_stores.qdrant.converters import (
+    DENSE_VECTORS_NAME, SPARSE_VECTORS_NAME,
+    convert_qdrant_point_to_haystack_document)
+from haystack_integrations.document_stores.qdrant.filters import \
+    convert_filters_to_qdrant
+
+from app.services.document_stores import (HYBRID_PREFETCH_FACTOR,
+                                          UNSCOPED_FETCH_FACTOR,
+                                          get_qdrant_client, get_search_params)
+
+
+def dedupe_chunks(documents: list[Document]) -> list[Document]:
+    """
+    Keep the first of the chunks with the same source file and split, given in relevance order.
+    Chunk ids hash the folder key, so a file synced in overlapping folders has one copy of each chunk per folder.
+    """
+    seen = set()
+    unique = []
+    for doc in documents:
+        split_id = doc.meta.get("split_id")
+        key = (
+            (doc.meta.get("source_file"), split_id) if split_id is not None else doc.id
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(doc)
+    return unique
+
+
+@component
+class QdrantRetriever:
+    """
+    Qdrant retriever passing search params to the query, so candidates found on quantized vectors
+    are rescored with the original vectors. Never returns embeddings.
+    Given the sparse embedding of the question too, dense and sparse candidates are fused with RRF in Qdrant.
+    Searching across all folders, more candidates are fetched and copies of a chunk from overlapping folders dropped.
+    """
+
+    def __init__(
+        self,
+        document_store: QdrantDocumentStore,
+        top_k: int = 10,
+        search_params=None,
+        prefetch_factor: int = HYBRID_PREFETCH_FACTOR,
+        unscoped_fetch_factor: int = UNSCOPED_FETCH_FACTOR,
+        client=None,
+    ):
+        self.document_store = document_store
+        # Qdrant client of the document store collection, the shared one by default
+        self.client = client
+        self.top_k = top_k
+        self.search_params = search_params or get_search_params()
+        self.prefetch_factor = prefetch_factor
+        self.unscoped_fetch_factor = unscoped_fetch_factor
+
+    @component.output_types(documents=list[Document])
+    def run(
+        self,
+        query_embedding: list[float],
+        query_sparse_embedding: SparseEmbedding | None = None,
+        filters: dict[str, Any] | None = None,
+        top_k: int | None = None,
+    ):
+        from qdrant_client.models import (Fusion, FusionQuery, Prefetch,
+                                          SparseVector)
+
+        store = self.document_store
+        client = self.client or get_qdrant_client()
+        top_k = top_k or self.top_k
+        # a folder filter only matches one copy of each chunk
+        limit = top_k if filters else top_k * self.unscoped_fetch_factor
+        query_filter = convert_filters_to_qdrant(filters)
+        dense_vectors_name = DENSE_VECTORS_NAME if store.use_sparse_embeddings else None
+        if query_sparse_embedding is None or not query_sparse_embedding.indices:
+            points = client.query_points(
+                collection_name=store.index,
+                query=query_embedding,
+                using=dense_vectors_name,
+                query_filter=query_filter,
+                limit=limit,
+                with_vectors=False,
+                search_params=self.search_params,
+            ).points
+        else:
+            prefetch_limit = limit * self.prefetch_factor
+            points = client.query_points(
+                collection_name=store.index,
+                prefetch=[
+                    Prefetch(
+                        query=query_embedding,
+                        using=dense_vectors_name,
+                        filter=query_filter,
+                        limit=prefetch_limit,
+                        params=self.search_params,
+                    ),
+                    Prefetch(
+                        query=SparseVector(
+                            indices=query_sparse_embedding.indices,
+                            values=query_sparse_embedding.values,
+                        ),
+                        using=SPARSE_VECTORS_NAME,
+                        filter=query_filter,
+                        limit=prefetch_limit,
+                    ),
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+                limit=limit,
+                with_vectors=False,
+            ).points
+        documents = [
+            convert_qdrant_point_to_haystack_document(
+                point, use_sparse_embeddings=store.use_sparse_embeddings
+            )
+            for point in points
+        ]
+        if not filters:
+            documents = dedupe_chunks(documents)[:top_k]
+        return {"documents": documents}
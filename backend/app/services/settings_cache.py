@@ -0,0 +1,78 @@
+"""
+In-process cache of the user settings, read by every question, summary and app status check.
+Writes bump a settings version in Redis, so every API replica drops its copy at the next lookup:
+a lookup costs one Redis GET instead of several MongoDB round-trips.
+"""
+
+import logging
+import os
+
+import redis
+import redis.asyncio
+
+from app.models.chat_models import User
+
+logger = logging.getLogger(__name__)
+
+
+SETTINGS_VERSION_REDIS_URL = os.getenv("REDIS_URL")
+SETTINGS_VERSION_KEY = "user_settings_version"
+
+_REDIS = None
+
+
+def _redis() -> redis.asyncio.Redis:
+    global _REDIS
+    if _REDIS is None:
+        _REDIS = redis.asyncio.Redis.from_url(SETTINGS_VERSION_REDIS_URL)
+    return _REDIS
+
+
+async def get_settings_version() -> int | None:
+    """Return the version of the user settings, or None if it's unknown, in which case settings are not cached."""
+    try:
+        return int(await _redis().get(SETTINGS_VERSION_KEY) or 0)
+    except redis.RedisError as e:
+        logger.warning(f"Settings version unavailable: {e}")
+        return None
+
+
+async def bump_settings_version() -> int | None:
+    """Invalidate the settings cached by every API replica, return the new version."""
+    try:
+        return await _redis().incr(SETTINGS_VERSION_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Cannot bump settings version: {e}")
+        return None
+
+
+class SettingsCache:
+    """The user settings, valid as long as the settings version is the one they were loaded at."""
+
+    def __init__(self):
+        self._settings: User | None = None
+        self._version: int | None = None
+
+    async def get(self) -> tuple[User | None, int | None]:
+        """
+        Return (a copy of the cached settings or None if stale, current version).
+        Settings loaded on a miss are stored with this version, so a write in between makes them stale.
+        """
+        version = await get_settings_version()
+        if version is None or version != self._version or self._settings is None:
+            return None, version
+        return self._settings.model_copy(deep=True), version
+
+    def store(self, settings: User, version: int | None):
+        if version is None:
+            return
+        self._settings = settings.model_copy(deep=True)
+        self._version = version
+
+    async def update(self, settings: User):
+        """Write-through after saving the settings: other replicas reload them, this one keeps them."""
+        self._settings, self._version = None, None
+        self.store(settings, await bump_settings_version())
+
+
+SETTINGS_CACHE = SettingsCache()
@@ -0,0 +1,77 @@
+"""
+BM25 sparse vectors for hybrid retrieval, so exact identifiers, file names and error codes match
+even when the dense embedding misses them.
+Documents get BM25 term frequency weights and queries a weight of 1 per term; Qdrant multiplies them
+with the IDF of each term in the collection (sparse vectors with the IDF modifier).
+"""
+
+import os
+import re
+import zlib
+from collections import Counter
+
+from haystack import component
+from haystack.dataclasses import Document, SparseEmbedding
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+# average chunk length in words, the document splitter cuts 150 word chunks
+BM25_AVG_DOC_LENGTH = float(os.getenv("BM25_AVG_DOC_LENGTH", 150))
+
+# words, and identifiers joined by . - / _ such as file names, paths and error codes
+TOKEN_PATTERN = re.compile(r"\w+(?:[./\-]\w+)*")
+TOKEN_PART_PATTERN = re.compile(r"[./\-_]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Return lowercase terms of the text, compound identifiers are kept whole and also split in parts."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = [part for part in TOKEN_PART_PATTERN.split(token) if part]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def _term_index(term: str) -> int:
+    # stable across processes, unlike hash()
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def sparse_document_embedding(text: str) -> SparseEmbedding:
+    terms = Counter(tokenize(text))
+    length_norm = 1 - BM25_B + BM25_B * sum(terms.values()) / BM25_AVG_DOC_LENGTH
+    weights = {}
+    for term, tf in terms.items():
+        index = _term_index(term)
+        weights[index] = weights.get(index, 0.0) + tf * (BM25_K1 + 1) / (
+            tf + BM25_K1 * length_norm
+        )
+    return SparseEmbedding(indices=list(weights), values=list(weights.values()))
+
+
+def sparse_query_embedding(text: str) -> SparseEmbedding:
+    indices = sorted({_term_index(term) for term in tokenize(text)})
+    return SparseEmbedding(indices=indices, values=[1.0] * len(indices))
+
+
+@component
+class BM25SparseDocumentEmbedder:
+    """Set the BM25 sparse embedding of chunks, next to their dense embedding."""
+
+    @component.output_types(documents=list[Document])
+    def run(self, documents: list[Document]):
+        for doc in documents:
+            doc.sparse_embedding = sparse_document_embedding(doc.content or "")
+        return {"documents": documents}
+
+
+@component
+class BM25SparseTextEmbedder:
+    """Return the BM25 sparse embedding of the question."""
+
+    @component.output_types(sparse_embedding=SparseEmbedding)
+    def run(self, text: str):
+        return {"sparse_embedding": sparse_query_embedding(text)}
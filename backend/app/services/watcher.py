@@ -0,0 +1,284 @@
+"""
+Watch a synced folder for file changes, to re-index only the touched files within seconds.
+Uses Linux inotify (through ctypes, the celery worker runs in a Linux container) and falls back
+to polling snapshots of the folder where inotify is not available.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Iterator
+
+import redis
+
+from app.api.utils import SYNC_IGNORE_PATTERNS, iter_files_from_folder
+from app.services.manifest import is_under
+
+logger = logging.getLogger(__name__)
+
+
+# wait until no event arrived for this long before handing a batch of changes over
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 2))
+# but never hold changes longer than this while events keep coming
+WATCH_MAX_DELAY_SECONDS = float(os.getenv("WATCH_MAX_DELAY_SECONDS", 10))
+# snapshot interval of the polling fallback
+WATCH_POLL_INTERVAL_SECONDS = float(os.getenv("WATCH_POLL_INTERVAL_SECONDS", 30))
+
+# watch tasks refresh a heartbeat in Redis at this interval, a watch without a fresh heartbeat is gone
+# (e.g. its worker restarted or the task was lost) and the folder can be watched again
+WATCH_HEARTBEAT_SECONDS = float(os.getenv("WATCH_HEARTBEAT_SECONDS", 30))
+WATCH_HEARTBEAT_TTL = int(WATCH_HEARTBEAT_SECONDS * 3)
+WATCH_HEARTBEAT_REDIS_URL = os.getenv("REDIS_URL")
+
+# inotify constants, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+_REDIS = None
+
+
+def _redis() -> redis.Redis:
+    global _REDIS
+    if _REDIS is None:
+        _REDIS = redis.Redis.from_url(WATCH_HEARTBEAT_REDIS_URL)
+    return _REDIS
+
+
+def _heartbeat_key(task_id: str) -> str:
+    return f"watch_heartbeat:{task_id}"
+
+
+def touch_watch_heartbeat(task_id: str):
+    try:
+        _redis().set(_heartbeat_key(task_id), 1, ex=WATCH_HEARTBEAT_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Cannot refresh heartbeat of watch task {task_id}: {e}")
+
+
+def is_watch_alive(task_id: str) -> bool:
+    """Whether the watch task refreshed its heartbeat recently, assumed alive if Redis is unavailable."""
+    try:
+        return bool(_redis().exists(_heartbeat_key(task_id)))
+    except redis.RedisError as e:
+        logger.warning(f"Cannot check heartbeat of watch task {task_id}: {e}")
+        return True
+
+
+def keep_watch_alive(task_id: str) -> threading.Event:
+    """Refresh the heartbeat of the watch task in a background thread, until the returned event is set."""
+    stop = threading.Event()
+
+    def beat():
+        while True:
+            touch_watch_heartbeat(task_id)
+            if stop.wait(WATCH_HEARTBEAT_SECONDS):
+                return
+
+    threading.Thread(
+        target=beat, name=f"watch-heartbeat-{task_id}", daemon=True
+    ).start()
+    return stop
+
+
+class FolderChanges:
+    """A debounced batch of changes under the watched folder."""
+
+    def __init__(self):
+        # created or modified files, or created directories
+        self.changed: set[Path] = set()
+        # deleted or moved away files and directories
+        self.deleted: set[Path] = set()
+        # events were lost, the whole folder must be compared to the manifest
+        self.rescan = False
+
+    def __bool__(self):
+        return bool(self.changed or self.deleted or self.rescan)
+
+    def add_changed(self, path: Path):
+        self.deleted.discard(path)
+        self.changed.add(path)
+
+    def add_deleted(self, path: Path):
+        self.changed.discard(path)
+        self.deleted.add(path)
+
+
+def _is_ignored(name: str, ignore_patterns: list[str]) -> bool:
+    return any(fnmatch(name, pattern) for pattern in ignore_patterns)
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: dict[int, Path] = {}
+
+    def add_watch(self, directory: Path):
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch {directory}: {os.strerror(errno)}")
+        self.dirs[wd] = directory
+
+    def add_watch_recursive(self, directory: Path, ignore_patterns: list[str]):
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                self.add_watch(current)
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and not _is_ignored(
+                            entry.name, ignore_patterns
+                        ):
+                            stack.append(Path(entry.path))
+            except FileNotFoundError:
+                continue
+
+    def read_events(self, timeout: float) -> Iterator[tuple[Path | None, int]]:
+        """Yield (path, mask) of events available within the timeout."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            directory = self.dirs.get(wd)
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            if directory is None:
+                yield None, mask
+                continue
+            yield (directory / os.fsdecode(name) if name else directory), mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _watch_inotify(root: Path, ignore_patterns: list[str]) -> Iterator[FolderChanges]:
+    inotify = _Inotify()
+    try:
+        inotify.add_watch_recursive(root, ignore_patterns)
+        logger.info(
+            f"Watching {len(inotify.dirs)} directories under {root} with inotify"
+        )
+        changes = FolderChanges()
+        first_event_at = last_event_at = None
+        while True:
+            for path, mask in inotify.read_events(timeout=WATCH_DEBOUNCE_SECONDS):
+                last_event_at = time.monotonic()
+                first_event_at = first_event_at or last_event_at
+                if mask & IN_Q_OVERFLOW:
+                    changes.rescan = True
+                    continue
+                if path is None or _is_ignored(path.name, ignore_patterns):
+                    continue
+                if mask & (IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF):
+                    changes.add_deleted(path)
+                elif mask & IN_ISDIR:
+                    # created or moved in directory: watch it and index what's already in it
+                    inotify.add_watch_recursive(path, ignore_patterns)
+                    changes.add_changed(path)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    changes.add_changed(path)
+
+            now = time.monotonic()
+            if changes and (
+                now - last_event_at >= WATCH_DEBOUNCE_SECONDS
+                or now - first_event_at >= WATCH_MAX_DELAY_SECONDS
+            ):
+                yield changes
+                changes = FolderChanges()
+                first_event_at = last_event_at = None
+    finally:
+        inotify.close()
+
+
+def _snapshot(
+    folder_path: str, actual_home_dir: str
+) -> tuple[dict[Path, tuple[int, float]], set[str]]:
+    """Return (size and mtime of the files, paths that couldn't be read) of the folder."""
+    snapshot = {}
+    unscanned = set()
+    for file_path in iter_files_from_folder(
+        folder_path, actual_home_dir, unscanned=unscanned
+    ):
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            continue
+        snapshot[file_path] = (stat.st_size, stat.st_mtime)
+    return snapshot, unscanned
+
+
+def _watch_polling(folder_path: str, actual_home_dir: str) -> Iterator[FolderChanges]:
+    logger.info(
+        f"Watching {folder_path} by polling every {WATCH_POLL_INTERVAL_SECONDS}s"
+    )
+    previous, _ = _snapshot(folder_path, actual_home_dir)
+    while True:
+        time.sleep(WATCH_POLL_INTERVAL_SECONDS)
+        current, unscanned = _snapshot(folder_path, actual_home_dir)
+        changes = FolderChanges()
+        for file_path, signature in current.items():
+            if previous.get(file_path) != signature:
+                changes.add_changed(file_path)
+        for file_path in previous.keys() - current.keys():
+            if is_under(str(file_path), unscanned):
+                # unreadable this time, not deleted
+                current[file_path] = previous[file_path]
+                continue
+            changes.add_deleted(file_path)
+        previous = current
+        if changes:
+            yield changes
+
+
+def watch_folder_changes(
+    root: Path,
+    folder_path: str,
+    actual_home_dir: str,
+    ignore_patterns: list[str] = SYNC_IGNORE_PATTERNS,
+) -> Iterator[FolderChanges]:
+    """Yield debounced batches of changes under the synced folder, forever."""
+    try:
+        yield from _watch_inotify(root, ignore_patterns)
+    except (OSError, AttributeError) as e:
+        # no inotify (not Linux), or out of inotify watches
+        logger.warning(f"inotify unavailable for {root}, falling back to polling: {e}")
+        yield from _watch_polling(folder_path, actual_home_dir)
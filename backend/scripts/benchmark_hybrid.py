@@ -0,0 +1,129 @@
+"""
+Benchmark hybrid (dense + BM25 sparse, RRF) retrieval against dense retrieval on the synced documents:
+p50/p95 latency of the question embedding plus retrieval, and the hit rate of the chunk each query was taken from.
+Queries are sampled from indexed chunks, as identifier queries (file names, codes) and sentence queries.
+The collection must have been synced with RETRIEVAL_MODE=hybrid.
+
+    RETRIEVAL_MODE=hybrid poetry run python scripts/benchmark_hybrid.py [--queries 200] [--top-k 5]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from haystack.components.embedders import SentenceTransformersTextEmbedder
+from haystack_integrations.components.retrievers.qdrant import \
+    QdrantEmbeddingRetriever
+
+from app.services.document_stores import (HYBRID_RETRIEVAL, get_qdrant_client,
+                                          get_qdrant_document_store)
+from app.services.pipelines import resolve_embedder_model
+from app.services.retrievers import QdrantRetriever
+from app.services.sparse import TOKEN_PATTERN, BM25SparseTextEmbedder
+
+
+def sample_queries(count: int) -> list[tuple[str, str, str]]:
+    """Return (kind, query, chunk id) sampled from the indexed chunks."""
+    store = get_qdrant_document_store()
+    points, _ = get_qdrant_client().scroll(
+        store.index, limit=count * 5, with_payload=True, with_vectors=False
+    )
+    random.seed(0)
+    random.shuffle(points)
+    queries = []
+    for point in points:
+        content = point.payload.get("content") or ""
+        words = content.split()
+        identifiers = [
+            token
+            for token in TOKEN_PATTERN.findall(content)
+            if any(c.isdigit() for c in token) or any(c in "._-/" for c in token)
+        ]
+        if identifiers:
+            queries.append(
+                ("identifier", max(identifiers, key=len), point.payload["id"])
+            )
+        if len(words) >= 12:
+            start = random.randrange(len(words) - 11)
+            queries.append(
+                ("sentence", " ".join(words[start : start + 12]), point.payload["id"])
+            )
+        if len(queries) >= count:
+            break
+    return queries
+
+
+def run_retriever(name: str, retrieve, queries, top_k: int) -> dict:
+    latencies = []
+    hits = {"identifier": [], "sentence": []}
+    for kind, query, chunk_id in queries:
+        start = time.perf_counter()
+        documents = retrieve(query, top_k)
+        latencies.append(time.perf_counter() - start)
+        hits[kind].append(chunk_id in {doc.id for doc in documents})
+    quantiles = statistics.quantiles(latencies, n=20)
+    return {
+        "retriever": name,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": quantiles[-1] * 1000,
+        **{
+            f"{kind}_hit_rate": statistics.mean(values) if values else float("nan")
+            for kind, values in hits.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    if not HYBRID_RETRIEVAL:
+        parser.error("set RETRIEVAL_MODE=hybrid, sparse vectors are needed")
+
+    store = get_qdrant_document_store()
+    text_embedder = SentenceTransformersTextEmbedder(model=resolve_embedder_model())
+    text_embedder.warm_up()
+    sparse_text_embedder = BM25SparseTextEmbedder()
+    baseline = QdrantEmbeddingRetriever(document_store=store)
+    retriever = QdrantRetriever(document_store=store)
+
+    def embed(query):
+        return text_embedder.run(text=query)["embedding"]
+
+    retrievers = {
+        "QdrantEmbeddingRetriever": lambda query, top_k: baseline.run(
+            query_embedding=embed(query), top_k=top_k
+        )["documents"],
+        "QdrantRetriever dense": lambda query, top_k: retriever.run(
+            query_embedding=embed(query), top_k=top_k
+        )["documents"],
+        "QdrantRetriever hybrid": lambda query, top_k: retriever.run(
+            query_embedding=embed(query),
+            query_sparse_embedding=sparse_text_embedder.run(text=query)[
+                "sparse_embedding"
+            ],
+            top_k=top_k,
+        )["documents"],
+    }
+
+    queries = sample_queries(args.queries)
+    # warm up connections and caches before measuring
+    for retrieve in retrievers.values():
+        retrieve(queries[0][1], args.top_k)
+
+    print(f"{len(queries)} queries sampled from {store.index}, hit rate @{args.top_k}")
+    print(
+        f"{'retriever':<28}{'p50 ms':>9}{'p95 ms':>9}{'identifier':>12}{'sentence':>10}"
+    )
+    for name, retrieve in retrievers.items():
+        result = run_retriever(name, retrieve, queries, args.top_k)
+        print(
+            f"{name:<28}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+            f"{result['identifier_hit_rate']:>12.3f}{result['sentence_hit_rate']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark Qdrant vector storage modes: vector memory, p95 query latency and recall@k against exact search.
+Each mode gets a temporary collection on the Qdrant server, filled with the same vectors.
+Vectors are copied from the document store collection if it has enough points, else generated.
+
+    poetry run python scripts/benchmark_quantization.py [--points 100000] [--queries 200] [--top-k 5]
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+
+import numpy as np
+from haystack_integrations.document_stores.qdrant.converters import \
+    DENSE_VECTORS_NAME
+from qdrant_client import QdrantClient
+from qdrant_client.models import (Distance, PointStruct, SearchParams,
+                                  VectorParams)
+
+from app.services.document_stores import (QDRANT_OVERSAMPLING, QDRANT_URI_HOST,
+                                          QDRANT_URI_PORT,
+                                          get_qdrant_document_store,
+                                          get_quantization_config,
+                                          get_search_params)
+
+# (quantization, original vectors on disk)
+MODES = [
+    ("none", False),
+    ("none", True),
+    ("scalar", False),
+    ("scalar", True),
+    ("binary", False),
+    ("binary", True),
+]
+UPLOAD_BATCH_SIZE = 1000
+
+
+def load_vectors(client: QdrantClient, count: int, dim: int) -> np.ndarray:
+    """Return normalized vectors of the document store collection, or clustered random ones."""
+    collection_name = get_qdrant_document_store().index
+    vectors = []
+    if client.collection_exists(collection_name):
+        offset = None
+        while len(vectors) < count:
+            points, offset = client.scroll(
+                collection_name,
+                limit=min(UPLOAD_BATCH_SIZE, count - len(vectors)),
+                offset=offset,
+                with_vectors=True,
+                with_payload=False,
+            )
+            # named dense vector of collections with sparse vectors (hybrid retrieval)
+            vectors.extend(
+                (
+                    point.vector[DENSE_VECTORS_NAME]
+                    if isinstance(point.vector, dict)
+                    else point.vector
+                )
+                for point in points
+            )
+            if offset is None:
+                break
+    if len(vectors) >= count:
+        print(f"Using {count} vectors of {collection_name}.")
+        data = np.asarray(vectors[:count], dtype=np.float32)
+    else:
+        print(f"Using {count} generated vectors.")
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(count // 1000, 1), dim))
+        data = centers[rng.integers(len(centers), size=count)] + rng.normal(
+            scale=0.5, size=(count, dim)
+        )
+        data = data.astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def vector_memory_bytes(quantization: str, on_disk: bool, count: int, dim: int) -> int:
+    """Estimated RAM of the vectors, not counting the HNSW graph and payloads."""
+    if quantization == "scalar":
+        return count * dim
+    if quantization == "binary":
+        return count * dim // 8
+    return 0 if on_disk else count * dim * 4
+
+
+def benchmark_mode(
+    client: QdrantClient,
+    quantization: str,
+    on_disk: bool,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    exact_ids: list[set[int]],
+    top_k: int,
+    rescore: bool,
+) -> dict:
+    collection_name = f"benchmark_{quantization}_{uuid.uuid4().hex[:8]}"
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(
+            size=vectors.shape[1], distance=Distance.COSINE, on_disk=on_disk
+        ),
+        quantization_config=get_quantization_config(quantization),
+    )
+    try:
+        for i in range(0, len(vectors), UPLOAD_BATCH_SIZE):
+            client.upsert(
+                collection_name,
+                points=[
+                    PointStruct(id=i + j, vector=vector.tolist())
+                    for j, vector in enumerate(vectors[i : i + UPLOAD_BATCH_SIZE])
+                ],
+                wait=True,
+            )
+        # wait for indexing and quantization to finish before measuring
+        while client.get_collection(collection_name).status != "green":
+            time.sleep(1)
+
+        search_params = (
+            get_search_params(quantization, rescore=rescore) or SearchParams()
+        )
+        latencies, recalls = [], []
+        for query, expected in zip(queries, exact_ids):
+            start = time.perf_counter()
+            points = client.query_points(
+                collection_name,
+                query=query.tolist(),
+                limit=top_k,
+                search_params=search_params,
+                with_payload=False,
+            ).points
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len({point.id for point in points} & expected) / top_k)
+    finally:
+        client.delete_collection(collection_name)
+
+    return {
+        "mode": f"{quantization}{' + originals on disk' if on_disk else ''}",
+        "memory_mb": vector_memory_bytes(quantization, on_disk, *vectors.shape) / 2**20,
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1] * 1000,
+        "recall": statistics.mean(recalls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--no-rescore", action="store_true", help="search quantized vectors only"
+    )
+    args = parser.parse_args()
+
+    client = QdrantClient(url=QDRANT_URI_HOST, port=QDRANT_URI_PORT, timeout=60)
+    dim = get_qdrant_document_store().embedding_dim
+    data = load_vectors(client, args.points + args.queries, dim)
+    vectors, queries = data[: args.points], data[args.points :]
+    # ground truth: exact cosine top k of each held out query
+    exact_ids = [
+        set(np.argsort(-vectors @ query)[: args.top_k].tolist()) for query in queries
+    ]
+
+    rescore = not args.no_rescore
+    print(
+        f"{args.points} points, {args.queries} queries, recall@{args.top_k}, "
+        f"rescore {rescore} (oversampling {QDRANT_OVERSAMPLING})"
+    )
+    print(f"{'mode':<32}{'vector RAM MB':>14}{'p95 ms':>10}{'recall':>9}")
+    for quantization, on_disk in MODES:
+        result = benchmark_mode(
+            client,
+            quantization,
+            on_disk,
+            vectors,
+            queries,
+            exact_ids,
+            args.top_k,
+            rescore,
+        )
+        print(
+            f"{result['mode']:<32}{result['memory_mb']:>14.1f}"
+            f"{result['p95_ms']:>10.2f}{result['recall']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Save the embedding model (and the re-ranker model if configured) into EMBEDDER_MODEL_DIR,
+so API and Celery workers load them from disk and never download weights at runtime.
+
+    EMBEDDER_MODEL_DIR=/models poetry run python scripts/download_models.py
+"""
+
+import os
+
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+from app.services.pipelines import EMBEDDER_MODEL_DIR, embedder_model
+from app.services.reranker import RERANKER_MODEL
+
+
+def download_models():
+    if not EMBEDDER_MODEL_DIR:
+        print("EMBEDDER_MODEL_DIR is not set, nothing to do.")
+        return
+    models = [(embedder_model, SentenceTransformer)]
+    if RERANKER_MODEL:
+        models.append((RERANKER_MODEL, CrossEncoder))
+    for model, model_class in models:
+        local_path = os.path.join(EMBEDDER_MODEL_DIR, model)
+        if os.path.isdir(local_path):
+            print(f"{model} already saved in {local_path}.")
+            continue
+        model_class(model).save(local_path)
+        print(f"Saved {model} to {local_path}.")
+
+
+if __name__ == "__main__":
+    download_models()
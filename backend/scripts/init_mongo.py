@@ -4,6 +4,20 @@ from datetime import UTC, datetime
 from app.models.chat_models import User
 from app.services.database import init_mongodb_beanie
 
+# (collection, name) of indexes the models used to declare, replaced by wider ones
+SUPERSEDED_INDEXES = [
+    ("conversations", "created_at_-1"),
+    ("messages", "conversation.$id_1_query_created_at_1"),
+]
+
+
+async def drop_superseded_indexes(db):
+    """Drop the indexes replaced in the models by name, other indexes (e.g. created by hand) are kept."""
+    for collection, index_name in SUPERSEDED_INDEXES:
+        if index_name in await db[collection].index_information():
+            await db[collection].drop_index(index_name)
+            print(f"Dropped superseded index {index_name} of {collection}.")
+
 
 # Function to initialize database
 async def init_db():
@@ -21,6 +35,8 @@ async def init_db():
             print("First User record inserted!")
         else:
             print("Collection 'users' already exists. Skipping initialization.")
+
+        await drop_superseded_indexes(db)
     except Exception as e:
         print(f"Error initializing MongoDB: {e}")
     finally:
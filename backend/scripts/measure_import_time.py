@@ -0,0 +1,35 @@
+"""
+Measure the cold import time of the API and Celery modules, each in a fresh interpreter.
+
+    poetry run python scripts/measure_import_time.py [runs]
+"""
+
+import statistics
+import subprocess
+import sys
+
+MODULES = ["app.api.main", "app.services.celery"]
+
+
+def measure(module: str, runs: int) -> list[float]:
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t)"
+    )
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for module in MODULES:
+        timings = measure(module, runs)
+        print(
+            f"{module}: min {min(timings):.2f}s, median {statistics.median(timings):.2f}s over {runs} runs"
+        )
@@ -0,0 +1,106 @@
+import pytest
+import redis
+
+from app.services import answer_cache
+from app.services.answer_cache import (AnswerCache, bump_corpus_version,
+                                       get_corpus_version)
+
+
+class FakeRedis:
+    """The hash commands of the corpus versions."""
+
+    def __init__(self):
+        self.hash = {}
+        self.available = True
+
+    def _check(self):
+        if not self.available:
+            raise redis.ConnectionError("redis down")
+
+    def hmget(self, key, *fields):
+        self._check()
+        return [self.hash.get(field) for field in fields]
+
+    def hincrby(self, key, field, amount):
+        self.hash[field] = self.hash.get(field, 0) + amount
+
+    def pipeline(self, transaction=True):
+        self._check()
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(answer_cache, "_redis", lambda: client)
+    return client
+
+
+def test_syncing_a_folder_invalidates_it_and_all_folders_only(fake_redis):
+    notes, photos, everything = (
+        get_corpus_version("~/notes"),
+        get_corpus_version("~/photos"),
+        get_corpus_version(),
+    )
+
+    bump_corpus_version(["~/notes"])
+
+    assert get_corpus_version("~/notes") != notes
+    assert get_corpus_version() != everything
+    assert get_corpus_version("~/photos") == photos
+
+
+def test_deleting_all_documents_invalidates_every_folder(fake_redis):
+    notes, everything = get_corpus_version("~/notes"), get_corpus_version()
+
+    bump_corpus_version()
+
+    assert get_corpus_version("~/notes") != notes
+    assert get_corpus_version() != everything
+
+
+def test_unknown_version_without_redis(fake_redis):
+    fake_redis.available = False
+
+    assert get_corpus_version("~/notes") is None
+    # a failed bump is logged, the sync goes on
+    bump_corpus_version(["~/notes"])
+
+
+SCOPE = ("gemini", "gemini-2.0-flash", "~/notes")
+
+
+def test_similar_question_of_the_same_scope_and_version_hits():
+    cache = AnswerCache(max_entries=10, similarity=0.95)
+    cache.store(SCOPE, "0:1", [1.0, 0.0], {"answer": "42"})
+
+    assert cache.lookup(SCOPE, "0:1", [0.99, 0.05]) == {"answer": "42"}
+    assert cache.lookup(SCOPE, "0:1", [0.0, 1.0]) is None
+    assert cache.lookup(("gemini", "other", "~/notes"), "0:1", [1.0, 0.0]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_answers_of_an_older_corpus_version_are_not_reused():
+    cache = AnswerCache(max_entries=10, similarity=0.95)
+    cache.store(SCOPE, "0:1", [1.0, 0.0], {"answer": "42"})
+
+    assert cache.lookup(SCOPE, "0:2", [1.0, 0.0]) is None
+
+    cache.store(SCOPE, "0:2", [0.0, 1.0], {"answer": "43"})
+    # replaced, not kept next to the new version's answers
+    assert cache.stats()["size"] == 1
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = AnswerCache(max_entries=2, similarity=0.95)
+    cache.store(SCOPE, "0:1", [1.0, 0.0], {"answer": "a"})
+    cache.store(SCOPE, "0:1", [0.0, 1.0], {"answer": "b"})
+    cache.lookup(SCOPE, "0:1", [1.0, 0.0])
+
+    cache.store(SCOPE, "0:1", [1.0, 1.0], {"answer": "c"})
+
+    assert cache.lookup(SCOPE, "0:1", [1.0, 0.0]) == {"answer": "a"}
+    assert cache.lookup(SCOPE, "0:1", [0.0, 1.0]) is None
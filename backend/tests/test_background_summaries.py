@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+from app.api import utils
+
+
+def test_summaries_run_in_their_own_executor(monkeypatch):
+    executors = []
+    events = []
+
+    async def extract_conversation_summary(conversation_id, executor=None):
+        executors.append(executor)
+        return {"conversation_id": conversation_id, "summary": "Trip to Rome"}
+
+    async def publish(event):
+        events.append(event)
+
+    monkeypatch.setattr(
+        utils, "extract_conversation_summary", extract_conversation_summary
+    )
+    monkeypatch.setattr(utils, "_publish_summary_event", publish)
+
+    asyncio.run(utils._generate_conversation_summary("c1"))
+
+    assert executors == [utils.SUMMARY_EXECUTOR]
+    assert events == [
+        {"status": "summary", "conversation_id": "c1", "summary": "Trip to Rome"}
+    ]
+
+
+def test_failed_summary_publishes_an_error(monkeypatch):
+    events = []
+
+    async def extract_conversation_summary(conversation_id, executor=None):
+        raise RuntimeError("LLM down")
+
+    async def publish(event):
+        events.append(event)
+
+    monkeypatch.setattr(
+        utils, "extract_conversation_summary", extract_conversation_summary
+    )
+    monkeypatch.setattr(utils, "_publish_summary_event", publish)
+
+    asyncio.run(utils._generate_conversation_summary("c1"))
+
+    assert [(event["status"], event["conversation_id"]) for event in events] == [
+        ("summary_error", "c1")
+    ]
+
+
+def test_one_summary_per_conversation_at_a_time(monkeypatch):
+    calls = []
+
+    async def generate(conversation_id):
+        calls.append(conversation_id)
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(utils, "_generate_conversation_summary", generate)
+
+    async def main():
+        for conversation_id in ["c1", "c1", "c2"]:
+            utils.schedule_conversation_summary(conversation_id)
+        await asyncio.gather(*utils._BACKGROUND_TASKS)
+        # done, so it can be scheduled again
+        utils.schedule_conversation_summary("c1")
+        await asyncio.gather(*utils._BACKGROUND_TASKS)
+
+    asyncio.run(main())
+
+    assert calls == ["c1", "c2", "c1"]
+
+
+def test_pipelines_run_in_the_given_executor():
+    class FakePipeline:
+        def run(self, data):
+            return {"thread": threading.current_thread().name, **data}
+
+    result = asyncio.run(
+        utils.run_pipeline(
+            FakePipeline(), data={"query": "q"}, executor=utils.SUMMARY_EXECUTOR
+        )
+    )
+
+    assert result["thread"].startswith("summary")
+    assert result["query"] == "q"
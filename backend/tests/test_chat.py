@@ -0,0 +1,157 @@
+import asyncio
+import copy
+import threading
+import time
+
+from haystack import Document
+from haystack.dataclasses import GeneratedAnswer, StreamingChunk
+
+from app.api.utils import AnswerStreamer, answer_question, run_pipeline
+
+
+class FakeRagPipeline:
+    """Answers after a blocking wait, like an LLM call, and records its input."""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.data = None
+
+    def run(self, data):
+        self.data = data
+        time.sleep(self.delay)
+        document = Document(
+            content="The answer is 42.",
+            meta={"file_path": "a.md", "source_id": "source"},
+            score=0.9,
+        )
+        answer = GeneratedAnswer(
+            data="42",
+            query=data["answer_builder"]["query"],
+            documents=[document],
+            meta={"model": "fake-model", "finish_reason": "stop"},
+        )
+        return {"answer_builder": {"answers": [answer]}}
+
+
+def test_pipeline_runs_off_the_event_loop():
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        await run_pipeline(
+            FakeRagPipeline(delay=0.2), data={"answer_builder": {"query": "question"}}
+        )
+        ticker.cancel()
+        return ticks
+
+    # the loop kept serving other tasks while the pipeline waited
+    assert asyncio.run(main()) >= 5
+
+
+def test_answer_question_returns_the_answer_and_its_documents():
+    pipeline = FakeRagPipeline()
+
+    answer = asyncio.run(
+        answer_question(pipeline, "What is the answer?", "~/notes", memories=[])
+    )
+
+    assert pipeline.data["retriever"]["filters"] == {
+        "field": "meta.folder",
+        "operator": "==",
+        "value": "~/notes",
+    }
+    assert pipeline.data["prompt_builder"] == {"query": "What is the answer?"}
+    assert answer["answer"] == "42"
+    assert answer["documents"] == [
+        {
+            "id": answer["documents"][0]["id"],
+            "score": 0.9,
+            "file_path": "a.md",
+            "source_id": "source",
+        }
+    ]
+    assert (answer["model"], answer["finish_reason"]) == ("fake-model", "stop")
+    assert not answer["cached"]
+
+
+def test_streamer_forwards_chunks_from_the_pipeline_thread():
+    async def main():
+        streamer = AnswerStreamer(asyncio.get_running_loop())
+
+        def generate():
+            for token in ["The ", "", "answer"]:
+                streamer(StreamingChunk(content=token, meta={"model": "fake-model"}))
+            streamer.close()
+
+        threading.Thread(target=generate).start()
+        tokens = []
+
+        async def send(token):
+            tokens.append(token)
+
+        await streamer.stream_to(send)
+        return tokens, streamer
+
+    tokens, streamer = asyncio.run(main())
+
+    # empty chunks are not sent
+    assert tokens == ["The ", "answer"]
+    assert streamer.reply_meta() == {"model": "fake-model", "finish_reason": None}
+
+
+def test_streamer_survives_the_deep_copy_of_pipeline_inputs():
+    async def main():
+        streamer = AnswerStreamer(asyncio.get_running_loop())
+        return streamer, copy.deepcopy({"streaming_callback": streamer})
+
+    streamer, data = asyncio.run(main())
+
+    assert data["streaming_callback"] is streamer
+
+
+def test_finish_reason_nested_in_gemini_chunks():
+    async def main():
+        streamer = AnswerStreamer(asyncio.get_running_loop())
+        streamer(
+            StreamingChunk(
+                content="",
+                meta={"model": "gemini", "candidates": [{"finish_reason": "STOP"}]},
+            )
+        )
+        return streamer.reply_meta()
+
+    assert asyncio.run(main()) == {"model": "gemini", "finish_reason": "STOP"}
+
+
+def test_answer_is_streamed_by_the_generator():
+    class StreamingPipeline(FakeRagPipeline):
+        def run(self, data):
+            data["generator"]["streaming_callback"](
+                StreamingChunk(content="42", meta={"model": "streamed-model"})
+            )
+            return super().run(data)
+
+    async def main():
+        streamer = AnswerStreamer(asyncio.get_running_loop())
+        answer = await answer_question(
+            StreamingPipeline(), "What is the answer?", None, [], streamer
+        )
+        streamer.close()
+        tokens = []
+
+        async def send(token):
+            tokens.append(token)
+
+        await streamer.stream_to(send)
+        return answer, tokens
+
+    answer, tokens = asyncio.run(main())
+
+    assert tokens == ["42"]
+    assert answer["answer"] == "42"
@@ -0,0 +1,96 @@
+from haystack.dataclasses import ChatMessage, Document
+
+from app.services.context import ContextPacker, merge_adjacent_chunks
+
+
+def chunk(text: str, start: int, source: str = "a.md", score: float = 0.0):
+    return Document(
+        content=text,
+        meta={"source_file": source, "split_idx_start": start},
+        score=score,
+    )
+
+
+def test_overlapping_chunks_are_merged_without_repeated_text():
+    text = "The quick brown fox jumps over the lazy dog"
+    documents = [chunk(text[10:30], 10, score=0.9), chunk(text[0:15], 0, score=0.5)]
+
+    merged = merge_adjacent_chunks(documents)
+
+    assert [doc.content for doc in merged] == [text[0:30]]
+    assert merged[0].score == 0.9
+
+
+def test_touching_chunks_are_merged_and_gaps_are_not():
+    documents = [chunk("abc", 0), chunk("def", 3), chunk("xyz", 10)]
+
+    merged = merge_adjacent_chunks(documents)
+
+    assert [doc.content for doc in merged] == ["abcdef", "xyz"]
+
+
+def test_merged_documents_keep_relevance_order():
+    documents = [
+        chunk("other", 0, source="b.md"),
+        chunk("abc", 0),
+        chunk("def", 3),
+    ]
+
+    merged = merge_adjacent_chunks(documents)
+
+    assert [doc.content for doc in merged] == ["other", "abcdef"]
+
+
+def test_chunks_without_offsets_are_kept_as_they_are():
+    documents = [Document(content="no offsets", meta={"source_file": "a.md"})]
+
+    assert [doc.content for doc in merge_adjacent_chunks(documents)] == ["no offsets"]
+
+
+def test_most_recent_memories_are_kept_within_their_share():
+    packer = ContextPacker(token_budget=100, memory_share=0.5)
+    memories = [ChatMessage.from_user(f"{i}" * 80) for i in range(4)]
+
+    packed = packer.run(documents=[], memories=memories)["memories"]
+
+    assert [message.text for message in packed] == ["2" * 80, "3" * 80]
+
+
+def test_documents_fill_the_budget_in_relevance_order():
+    packer = ContextPacker(token_budget=50, memory_share=0.2)
+    documents = [
+        Document(content="a" * 80, meta={"source_file": "a.md"}),
+        Document(content="b" * 80, meta={"source_file": "b.md"}),
+        Document(content="c" * 80, meta={"source_file": "c.md"}),
+    ]
+
+    packed = packer.run(documents=documents, memories=[])["documents"]
+
+    assert [doc.content[0] for doc in packed] == ["a", "b"]
+
+
+def test_most_relevant_document_over_budget_is_truncated():
+    packer = ContextPacker(token_budget=10, memory_share=0.0)
+
+    packed = packer.run(documents=[Document(content="a" * 100)], memories=[])
+
+    assert packed["documents"][0].content == "a" * 40
+
+
+def test_summary_is_packed_ahead_of_recent_turns():
+    packer = ContextPacker(token_budget=100, memory_share=0.5)
+    summary = ChatMessage.from_system("Summary of the earlier conversation: s")
+    turns = [ChatMessage.from_user(f"{i}" * 60) for i in range(4)]
+
+    packed = packer.run(documents=[], memories=[summary, *turns])["memories"]
+
+    assert [message.text for message in packed] == [summary.text, "2" * 60, "3" * 60]
+
+
+def test_summary_over_the_memory_share_keeps_its_beginning():
+    packer = ContextPacker(token_budget=100, memory_share=0.1)
+    summary = ChatMessage.from_system("s" * 100)
+
+    packed = packer.run(documents=[], memories=[summary, ChatMessage.from_user("hi")])
+
+    assert [message.text for message in packed["memories"]] == ["s" * 40]
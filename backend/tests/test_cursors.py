@@ -0,0 +1,38 @@
+from datetime import UTC, datetime
+
+import pytest
+from beanie import PydanticObjectId
+
+from app.api.utils import encode_cursor, keyset_before
+
+
+def test_cursor_round_trips_to_a_keyset_filter():
+    doc_id = PydanticObjectId()
+    created_at = datetime(2025, 3, 1, 12, 30, 15, 123000, tzinfo=UTC)
+
+    query = keyset_before("created_at", encode_cursor(created_at, doc_id))
+
+    assert query == {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": doc_id}},
+        ]
+    }
+
+
+def test_naive_dates_are_utc_and_truncated_to_milliseconds():
+    doc_id = PydanticObjectId()
+    # as read back from MongoDB
+    created_at = datetime(2025, 3, 1, 12, 30, 15, 123456)
+
+    query = keyset_before("query_created_at", encode_cursor(created_at, doc_id))
+
+    assert query["$or"][0]["query_created_at"]["$lt"] == datetime(
+        2025, 3, 1, 12, 30, 15, 123000, tzinfo=UTC
+    )
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "MTIzOm5vdGFuaWQ="])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        keyset_before("created_at", cursor)
@@ -0,0 +1,73 @@
+import pytest
+from haystack import Document
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+
+from app.services import document_stores
+from app.services.database import init_qdrant
+from app.services.document_stores import delete_documents_of_folder
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = QdrantDocumentStore(
+        location=":memory:", index="doc_collection", embedding_dim=4
+    )
+    store.count_documents()  # creates the collection and the client
+    monkeypatch.setattr(document_stores, "_QDRANT_DOCUMENT_STORE", store)
+    monkeypatch.setattr(document_stores, "_QDRANT_CLIENT", store._client)
+    return store
+
+
+def _chunk(source_file: str, folder: str | None = None) -> Document:
+    meta = {"source_file": source_file}
+    if folder:
+        meta["folder"] = folder
+    return Document(
+        content=f"{source_file} in {folder}", meta=meta, embedding=[0.1] * 4
+    )
+
+
+def _remaining(store):
+    return sorted(
+        (doc.meta["source_file"], doc.meta.get("folder"))
+        for doc in store.filter_documents()
+    )
+
+
+def test_deletes_chunks_of_the_folder_only(store):
+    store.write_documents(
+        [
+            _chunk("/home/me/notes/a.md", "~/notes"),
+            _chunk("/home/me/notes/a.md", "~"),
+            _chunk("/home/me/b.md", "~"),
+        ]
+    )
+
+    delete_documents_of_folder("~/notes")
+
+    assert _remaining(store) == [("/home/me/b.md", "~"), ("/home/me/notes/a.md", "~")]
+
+
+def test_legacy_chunks_are_deleted_by_source_file(store):
+    store.write_documents(
+        [
+            _chunk("/home/me/notes/a.md"),
+            _chunk("/home/me/notes/b.md"),
+            _chunk("/home/me/notes/a.md", "~"),
+        ]
+    )
+
+    delete_documents_of_folder("~/notes", ["/home/me/notes/a.md"])
+
+    assert _remaining(store) == [
+        ("/home/me/notes/a.md", "~"),
+        ("/home/me/notes/b.md", None),
+    ]
+
+
+def test_init_qdrant_only_sets_up_the_document_store_collection(store):
+    init_qdrant()
+
+    assert [
+        collection.name for collection in store._client.get_collections().collections
+    ] == ["doc_collection"]
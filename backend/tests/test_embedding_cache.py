@@ -0,0 +1,72 @@
+from haystack.dataclasses import Document
+
+from app.services.embedding_cache import CachedDocumentEmbedder, normalize_text
+
+
+class DictCache:
+    """EmbeddingCache without Redis."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get_many(self, texts):
+        return [self.entries.get(normalize_text(text)) for text in texts]
+
+    def set_many(self, texts, embeddings):
+        for text, embedding in zip(texts, embeddings):
+            self.entries[normalize_text(text)] = embedding
+
+
+class CopyingEmbedder:
+    """Returns new documents, like embedders that don't set the embedding in place."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def run(self, documents):
+        self.embedded.extend(doc.content for doc in documents)
+        return {
+            "documents": [
+                Document(content=doc.content, embedding=[float(len(doc.content))])
+                for doc in documents
+            ]
+        }
+
+
+def test_only_misses_are_embedded():
+    cache = DictCache()
+    cache.set_many(["cached"], [[1.0]])
+    embedder = CopyingEmbedder()
+    documents = [Document(content="cached"), Document(content="new text")]
+
+    result = CachedDocumentEmbedder(embedder, cache).run(documents=documents)
+
+    assert embedder.embedded == ["new text"]
+    assert [doc.embedding for doc in result["documents"]] == [[1.0], [8.0]]
+    assert cache.get_many(["new text"]) == [[8.0]]
+
+
+def test_duplicates_in_batch_are_embedded_once():
+    embedder = CopyingEmbedder()
+    documents = [
+        Document(content="same  text"),
+        Document(content="same text"),
+        Document(content="other"),
+    ]
+
+    result = CachedDocumentEmbedder(embedder, DictCache()).run(documents=documents)
+
+    assert embedder.embedded == ["same  text", "other"]
+    # set on every input document, including the one sent to the embedder
+    assert [doc.embedding for doc in result["documents"]] == [[10.0], [10.0], [5.0]]
+    assert result["documents"] == documents
+
+
+def test_hits_and_misses_are_counted():
+    cache = DictCache()
+    cache.set_many(["a"], [[1.0]])
+    cached_embedder = CachedDocumentEmbedder(CopyingEmbedder(), cache)
+
+    cached_embedder.run(documents=[Document(content="a"), Document(content="b")])
+
+    assert (cached_embedder.hits, cached_embedder.misses) == (1, 1)
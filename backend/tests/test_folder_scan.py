@@ -0,0 +1,93 @@
+import os
+
+from app.api.utils import iter_files_under
+
+
+def make_files(root, *paths):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text("text")
+
+
+def scanned(root, **kwargs) -> set[str]:
+    return {
+        str(path.relative_to(root))
+        for path in iter_files_under(root, max_file_size=0, **kwargs)
+    }
+
+
+def test_supported_files_are_yielded_and_ignored_ones_are_not(tmp_path):
+    make_files(
+        tmp_path, "a.txt", "notes/b.md", "image.png", "node_modules/c.txt", ".git/d.md"
+    )
+
+    assert scanned(tmp_path, ignore_patterns=["node_modules", ".*"]) == {
+        "a.txt",
+        os.path.join("notes", "b.md"),
+    }
+
+
+def test_unreadable_directory_is_reported_and_the_rest_is_scanned(
+    tmp_path, monkeypatch
+):
+    make_files(tmp_path, "a.txt", "locked/b.txt", "open/c.txt")
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if str(path).endswith("locked"):
+            raise PermissionError("permission denied")
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", failing_scandir)
+    unscanned = set()
+
+    files = scanned(tmp_path, unscanned=unscanned)
+
+    assert files == {"a.txt", os.path.join("open", "c.txt")}
+    assert unscanned == {str(tmp_path / "locked")}
+
+
+def test_file_that_cannot_be_stat_is_reported(tmp_path, monkeypatch):
+    make_files(tmp_path, "a.txt", "b.txt")
+
+    class Entry:
+        """DirEntry failing to stat b.txt."""
+
+        def __init__(self, entry):
+            self._entry = entry
+            self.name = entry.name
+            self.path = entry.path
+
+        def is_dir(self, follow_symlinks=True):
+            return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+        def is_file(self):
+            return self._entry.is_file()
+
+        def stat(self):
+            if self.name == "b.txt":
+                raise PermissionError("permission denied")
+            return self._entry.stat()
+
+    scandir = os.scandir
+
+    class Entries:
+        def __init__(self, path):
+            self._entries = scandir(path)
+
+        def __enter__(self):
+            return (Entry(entry) for entry in self._entries)
+
+        def __exit__(self, *exc):
+            self._entries.close()
+
+    monkeypatch.setattr(os, "scandir", Entries)
+    unscanned = set()
+
+    files = {
+        path.name
+        for path in iter_files_under(tmp_path, max_file_size=1024, unscanned=unscanned)
+    }
+
+    assert files == {"a.txt"}
+    assert unscanned == {str(tmp_path / "b.txt")}
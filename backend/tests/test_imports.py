@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+
+def _loaded_packages(module: str, packages: list[str]) -> list[str]:
+    """Import the module in a fresh interpreter, return which of the packages it loaded."""
+    code = (
+        f"import sys, {module}; "
+        f"print('loaded:' + ','.join(sorted({{m.split('.')[0] for m in sys.modules}} & set({packages!r}))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    # the modules print their own startup lines too
+    loaded = output.split("loaded:")[-1].strip()
+    return [package for package in loaded.split(",") if package]
+
+
+def test_api_import_does_not_load_haystack():
+    # loaded when the pipelines are warmed up at startup, not on import
+    assert (
+        _loaded_packages(
+            "app.api.main", ["haystack", "haystack_integrations", "numpy", "torch"]
+        )
+        == []
+    )
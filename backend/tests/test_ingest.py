@@ -0,0 +1,232 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from billiard.einfo import ExceptionInfo, ExceptionWithTraceback
+from haystack import Document
+
+from app.services import ingest
+from app.services.ingest import FolderIndexer
+from app.services.parsing import _set_exception, build_parse_executor
+
+
+def fake_parse_file(file_path, source_file, pipeline=None, folder=None):
+    """One chunk per line of the file."""
+    text = file_path.read_text()
+    if text == "unparsable":
+        raise ValueError("cannot convert")
+    return [
+        Document(content=line, meta={"source_file": source_file, "folder": folder})
+        for line in text.splitlines()
+    ]
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.batches = []
+
+    def run(self, documents):
+        self.batches.append([doc.content for doc in documents])
+        if any(doc.content == "boom" for doc in documents):
+            raise RuntimeError("embedding failed")
+        for doc in documents:
+            doc.embedding = [0.1, 0.2]
+        return {"documents": documents}
+
+
+class FakeDocumentStore:
+    def __init__(self):
+        self.documents = {}
+
+    def write_documents(self, documents, policy=None):
+        self.documents.update((doc.id, doc) for doc in documents)
+
+    def delete_documents(self, document_ids):
+        for document_id in document_ids:
+            self.documents.pop(document_id, None)
+
+
+@pytest.fixture
+def saved_entries(monkeypatch):
+    """Manifest entries saved by the indexer, source file -> chunk ids."""
+    saved = {}
+
+    def save_manifest_entry(
+        folder_path, home_dir, source_file, stat, content_hash, chunk_ids, **kwargs
+    ):
+        saved[source_file] = chunk_ids
+
+    monkeypatch.setattr(ingest, "parse_file", fake_parse_file)
+    monkeypatch.setattr(ingest, "save_manifest_entry", save_manifest_entry)
+    return saved
+
+
+def make_files(tmp_path, **contents):
+    paths = []
+    for name, text in contents.items():
+        path = tmp_path / f"{name}.txt"
+        path.write_text(text)
+        paths.append(path)
+    return paths
+
+
+def make_indexer(tmp_path, **kwargs) -> FolderIndexer:
+    return FolderIndexer(
+        folder_path=str(tmp_path),
+        home_dir="/home",
+        conversion_pipeline=object(),
+        document_embedder=FakeEmbedder(),
+        document_store=FakeDocumentStore(),
+        manifest={},
+        **kwargs,
+    )
+
+
+def test_chunks_of_many_files_are_embedded_in_full_batches(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1\na2\na3", b="b1\nb2", c="c1\nc2\nc3")
+    indexer = make_indexer(tmp_path, batch_size=4)
+
+    assert list(indexer.index_files(files)) == files
+    indexer.finish()
+
+    assert indexer.document_embedder.batches == [
+        ["a1", "a2", "a3", "b1"],
+        ["b2", "c1", "c2", "c3"],
+    ]
+    assert indexer.processed_files == 3
+    assert indexer.skipped_files == 0
+    assert len(indexer.document_store.documents) == 8
+    # each file is attributed its own chunks, whatever batches they were embedded in
+    assert {
+        source_file: [
+            indexer.document_store.documents[chunk_id].content for chunk_id in chunk_ids
+        ]
+        for source_file, chunk_ids in saved_entries.items()
+    } == {
+        str(files[0]): ["a1", "a2", "a3"],
+        str(files[1]): ["b1", "b2"],
+        str(files[2]): ["c1", "c2", "c3"],
+    }
+
+
+def test_last_partial_batch_is_written_on_finish(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1\na2\na3")
+    indexer = make_indexer(tmp_path, batch_size=2)
+
+    list(indexer.index_files(files))
+    assert saved_entries == {}
+    indexer.finish()
+
+    assert indexer.document_embedder.batches == [["a1", "a2"], ["a3"]]
+    assert list(saved_entries) == [str(files[0])]
+
+
+def test_failed_batch_only_fails_the_files_in_it(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1\na2", b="b1\nb2\nboom", c="c1", d="d1\nd2")
+    indexer = make_indexer(tmp_path, batch_size=2)
+
+    list(indexer.index_files(files))
+    indexer.finish()
+
+    # [a1 a2] [b1 b2] [boom c1] [d1 d2]
+    assert indexer.document_embedder.batches[2] == ["boom", "c1"]
+    assert list(saved_entries) == [str(files[0]), str(files[3])]
+    assert indexer.processed_files == 2
+    assert indexer.skipped_files == 2
+    # chunks of b written by the batch before are removed, not left half indexed
+    assert sorted(doc.content for doc in indexer.document_store.documents.values()) == [
+        "a1",
+        "a2",
+        "d1",
+        "d2",
+    ]
+
+
+def test_unparsable_file_is_skipped(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1", b="unparsable", c="c1")
+    indexer = make_indexer(tmp_path, batch_size=2)
+
+    list(indexer.index_files(files))
+    indexer.finish()
+
+    assert indexer.document_embedder.batches == [["a1", "c1"]]
+    assert list(saved_entries) == [str(files[0]), str(files[2])]
+    assert indexer.skipped_files == 1
+
+
+def test_per_file_mode_embeds_each_file_on_its_own(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1\na2", b="b1")
+    indexer = make_indexer(tmp_path, batch_size=256, ingest_mode="per_file")
+
+    list(indexer.index_files(files))
+
+    assert indexer.document_embedder.batches == [["a1", "a2"], ["b1"]]
+    assert len(saved_entries) == 2
+
+
+class InlineExecutor:
+    """Runs submitted parses right away, like a parse pool that is always done."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self.submitted.append(args[0])
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def test_parse_pool_files_are_yielded_in_order(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1", b="unparsable", c="c1\nc2", d="d1")
+    executor = InlineExecutor()
+    indexer = make_indexer(
+        tmp_path, batch_size=2, parse_executor=executor, parse_window=2
+    )
+
+    assert list(indexer.index_files(files)) == files
+    indexer.finish()
+
+    assert executor.submitted == files
+    assert indexer.processed_files == 3
+    assert indexer.skipped_files == 1
+    assert list(saved_entries) == [str(files[0]), str(files[2]), str(files[3])]
+
+
+class BrokenExecutor:
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        future.set_exception(BrokenProcessPool("a parser process died"))
+        return future
+
+
+def test_broken_parse_pool_falls_back_to_parsing_in_process(tmp_path, saved_entries):
+    files = make_files(tmp_path, a="a1", b="b1")
+    indexer = make_indexer(tmp_path, parse_executor=BrokenExecutor())
+
+    list(indexer.index_files(files))
+    indexer.finish()
+
+    assert indexer.parse_executor is None
+    assert indexer.processed_files == 2
+    assert len(saved_entries) == 2
+
+
+def test_parse_errors_of_the_pool_are_unwrapped():
+    try:
+        raise ValueError("cannot convert")
+    except ValueError as e:
+        einfo = ExceptionInfo()
+        einfo.exception = ExceptionWithTraceback(e, "traceback of the parser process")
+    future = Future()
+
+    _set_exception(future, einfo)
+
+    assert isinstance(future.exception(), ValueError)
+
+
+def test_no_parse_pool_without_workers():
+    assert build_parse_executor(0) is None
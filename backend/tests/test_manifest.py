@@ -0,0 +1,176 @@
+import os
+import re
+
+from app.models.status_models import FileManifestBunnet
+from app.services import manifest as manifest_module
+from app.services.manifest import (check_file_changed, hash_file, is_under,
+                                   remove_deleted_files, remove_source_files)
+
+
+def manifest_entry(path, **fields) -> FileManifestBunnet:
+    stat = os.stat(path)
+    values = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "content_hash": hash_file(path),
+    }
+    values.update(fields)
+    # not saved, no database needed
+    return FileManifestBunnet.model_construct(**values)
+
+
+def test_new_file_is_changed(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+
+    changed, content_hash = check_file_changed(path, os.stat(path), None)
+
+    assert changed
+    assert content_hash == hash_file(path)
+
+
+def test_same_size_and_mtime_skip_hashing(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    entry = manifest_entry(path, content_hash="hash of the manifest")
+
+    changed, content_hash = check_file_changed(path, os.stat(path), entry)
+
+    assert not changed
+    assert content_hash == "hash of the manifest"
+
+
+def test_touched_file_with_same_content_is_unchanged(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    entry = manifest_entry(path, mtime=0.0)
+
+    changed, content_hash = check_file_changed(path, os.stat(path), entry)
+
+    assert not changed
+    assert content_hash == entry.content_hash
+
+
+def test_modified_content_is_changed(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    entry = manifest_entry(path)
+    path.write_text("hello world")
+
+    changed, content_hash = check_file_changed(path, os.stat(path), entry)
+
+    assert changed
+    assert content_hash != entry.content_hash
+    assert content_hash == hash_file(path)
+
+
+class FakeEntry:
+    """Manifest entry that records its deletion instead of deleting a database record."""
+
+    def __init__(self, chunk_ids):
+        self.chunk_ids = chunk_ids
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+class FakeDocumentStore:
+    def __init__(self):
+        self.deleted_ids = []
+
+    def delete_documents(self, document_ids):
+        self.deleted_ids.extend(document_ids)
+
+
+def test_files_not_seen_are_removed_except_under_unscanned_paths(tmp_path):
+    root = str(tmp_path.resolve())
+    manifest = {
+        f"{root}/kept.txt": FakeEntry(["1"]),
+        f"{root}/deleted.txt": FakeEntry(["2", "3"]),
+        f"{root}/locked/file.txt": FakeEntry(["4"]),
+        f"{root}/locked-not/file.txt": FakeEntry(["5"]),
+    }
+    store = FakeDocumentStore()
+
+    removed = remove_deleted_files(
+        manifest, {f"{root}/kept.txt"}, store, unscanned={str(tmp_path / "locked")}
+    )
+
+    assert sorted(removed) == [f"{root}/deleted.txt", f"{root}/locked-not/file.txt"]
+    assert store.deleted_ids == ["2", "3", "5"]
+    assert not manifest[f"{root}/locked/file.txt"].deleted
+
+
+def test_is_under():
+    assert is_under("/home/me/notes/a.md", ["/home/me/notes"])
+    assert is_under("/home/me/notes", ["/home/me/notes/"])
+    assert not is_under("/home/me/notes-old/a.md", ["/home/me/notes"])
+
+
+class FakeManifestQuery:
+    def __init__(self, entries: list):
+        self.entries = entries
+
+    def to_list(self):
+        return self.entries
+
+
+def matches(source_file: str, condition: dict) -> bool:
+    match = condition["source_file"]
+    if "$in" in match:
+        return source_file in match["$in"]
+    return re.search(match["$regex"], source_file) is not None
+
+
+class FakeManifestModel:
+    """Evaluates the source file conditions of the manifest query on in-memory entries."""
+
+    folder_path = "folder_path"
+    home_dir = "home_dir"
+    entries: list = []
+
+    @classmethod
+    def find(cls, *conditions):
+        source_file_conditions = conditions[-1]["$or"]
+        return FakeManifestQuery(
+            [
+                entry
+                for entry in cls.entries
+                if any(
+                    matches(entry.source_file, condition)
+                    for condition in source_file_conditions
+                )
+            ]
+        )
+
+
+def test_removing_a_directory_removes_the_files_under_it(monkeypatch):
+    entries = {
+        source_file: FakeEntry([source_file])
+        for source_file in [
+            "/home/me/notes/a.md",
+            "/home/me/notes/sub/b.md",
+            "/home/me/notes-old/c.md",
+            "/home/me/notes.md",
+            "/home/me/d.md",
+        ]
+    }
+    for source_file, entry in entries.items():
+        entry.source_file = source_file
+    monkeypatch.setattr(FakeManifestModel, "entries", list(entries.values()))
+    monkeypatch.setattr(manifest_module, "FileManifestBunnet", FakeManifestModel)
+    store = FakeDocumentStore()
+
+    removed = remove_source_files(
+        "~", "/home", ["/home/me/notes", "/home/me/d.md"], store
+    )
+
+    assert sorted(removed) == [
+        "/home/me/d.md",
+        "/home/me/notes/a.md",
+        "/home/me/notes/sub/b.md",
+    ]
+    assert sorted(store.deleted_ids) == sorted(removed)
+    assert not entries["/home/me/notes-old/c.md"].deleted
+    assert not entries["/home/me/notes.md"].deleted
@@ -0,0 +1,76 @@
+import asyncio
+
+from app.services.database import _plan_problems
+from scripts.init_mongo import drop_superseded_indexes
+
+
+class FakeCollection:
+    def __init__(self, index_names: list[str]):
+        self.index_names = index_names
+
+    async def index_information(self):
+        return {name: {} for name in self.index_names}
+
+    async def drop_index(self, name: str):
+        self.index_names.remove(name)
+
+
+def test_only_superseded_indexes_are_dropped():
+    db = {
+        "conversations": FakeCollection(
+            ["_id_", "created_at_-1", "created_at_-1__id_-1", "made_by_hand_1"]
+        ),
+        "messages": FakeCollection(
+            [
+                "_id_",
+                "conversation.$id_1_query_created_at_1",
+                "conversation.$id_1_query_created_at_1__id_1",
+            ]
+        ),
+    }
+
+    asyncio.run(drop_superseded_indexes(db))
+    # nothing left to drop the next time
+    asyncio.run(drop_superseded_indexes(db))
+
+    assert db["conversations"].index_names == [
+        "_id_",
+        "created_at_-1__id_-1",
+        "made_by_hand_1",
+    ]
+    assert db["messages"].index_names == [
+        "_id_",
+        "conversation.$id_1_query_created_at_1__id_1",
+    ]
+
+
+def test_index_scan_has_no_problems():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "LIMIT", "inputStage": {"stage": "IXSCAN"}},
+            "rejectedPlans": [{"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}],
+        }
+    }
+
+    assert _plan_problems(explain) == set()
+
+
+def test_collection_scan_and_sort_of_the_winning_plan():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+        }
+    }
+
+    assert _plan_problems(explain) == {"COLLSCAN", "SORT"}
+
+
+def test_sort_stage_left_in_an_aggregation():
+    explain = {
+        "stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "IXSCAN"}}}},
+            {"$sort": {"sortKey": {"last_synced_at": -1}}},
+        ]
+    }
+
+    assert _plan_problems(explain) == {"SORT"}
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("haystack_integrations.components.generators.ollama")
+
+from haystack.dataclasses import ChatMessage
+from haystack_integrations.components.generators.ollama import \
+    OllamaChatGenerator
+
+from app.services.ollama import StreamingOllamaChatGenerator
+
+
+def test_each_run_streams_to_its_own_callback(monkeypatch):
+    callbacks = []
+
+    def run(generator, messages, generation_kwargs=None, tools=None):
+        callbacks.append(generator.streaming_callback)
+        return {"replies": [ChatMessage.from_assistant("42")]}
+
+    monkeypatch.setattr(OllamaChatGenerator, "run", run)
+    generator = StreamingOllamaChatGenerator(model="llama3.2")
+    first, second = print, repr
+
+    generator.run([ChatMessage.from_user("question")], streaming_callback=first)
+    generator.run([ChatMessage.from_user("question")], streaming_callback=second)
+    generator.run([ChatMessage.from_user("question")])
+
+    assert callbacks == [first, second, None]
+    # the shared generator is left as it was
+    assert generator.streaming_callback is None
@@ -0,0 +1,78 @@
+import pytest
+
+from app.services import pipelines
+from app.services.pipelines import (
+    _get_pipeline,
+    get_rag_pipeline,
+    get_summary_pipeline,
+    prune_pipelines,
+)
+
+
+class FakePipeline:
+    def __init__(self, llm_provider, llm_model, llm_api_token=None):
+        self.settings = (llm_provider, llm_model, llm_api_token)
+        self.warm_ups = 0
+
+    def warm_up(self):
+        self.warm_ups += 1
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Pipelines built by the registry, with an empty registry."""
+    built = []
+
+    def build(**kwargs):
+        built.append(FakePipeline(**kwargs))
+        return built[-1]
+
+    monkeypatch.setattr(pipelines, "_PIPELINE_REGISTRY", {})
+    monkeypatch.setattr(pipelines, "build_rag_pipeline_in_qdrant", build)
+    monkeypatch.setattr(pipelines, "build_summary_pipeline", build)
+    return built
+
+
+def test_pipeline_is_built_and_warmed_once_per_settings(builds):
+    first = get_rag_pipeline("gemini", "gemini-2.0-flash", "token")
+    second = get_rag_pipeline("gemini", "gemini-2.0-flash", "token")
+
+    assert first is second
+    assert builds == [first]
+    assert first.warm_ups == 1
+    assert first.settings == ("gemini", "gemini-2.0-flash", "token")
+
+
+def test_other_settings_or_kinds_get_their_own_pipeline(builds):
+    rag = get_rag_pipeline("gemini", "gemini-2.0-flash", "token")
+
+    assert get_rag_pipeline("gemini", "gemini-2.0-flash", "other token") is not rag
+    assert get_rag_pipeline("gemini", "gemini-1.5-flash", "token") is not rag
+    assert get_summary_pipeline("gemini", "gemini-2.0-flash", "token") is not rag
+    assert len(builds) == 4
+
+
+def test_registry_never_holds_the_token(builds):
+    get_rag_pipeline("gemini", "gemini-2.0-flash", "secret token")
+
+    (key,) = pipelines._PIPELINE_REGISTRY
+    assert "secret token" not in key
+    assert key[:3] == ("rag", "gemini", "gemini-2.0-flash")
+
+
+def test_no_token_has_no_fingerprint(builds):
+    _get_pipeline("rag", FakePipeline, "ollama", "llama3.2")
+
+    assert list(pipelines._PIPELINE_REGISTRY) == [("rag", "ollama", "llama3.2", None)]
+
+
+def test_prune_keeps_only_the_current_settings(builds):
+    current = get_rag_pipeline("gemini", "gemini-2.0-flash", "new token")
+    get_rag_pipeline("gemini", "gemini-2.0-flash", "old token")
+    get_summary_pipeline("ollama", "llama3.2")
+    summary = get_summary_pipeline("gemini", "gemini-2.0-flash", "new token")
+
+    prune_pipelines("gemini", "gemini-2.0-flash", "new token")
+
+    assert list(pipelines._PIPELINE_REGISTRY.values()) == [current, summary]
+    assert get_rag_pipeline("gemini", "gemini-2.0-flash", "new token") is current
@@ -0,0 +1,47 @@
+from app.services.embedding_cache import (CachedTextEmbedder,
+                                          QueryEmbeddingCache)
+
+
+class CountingTextEmbedder:
+    model = "model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, text):
+        self.calls += 1
+        return {"embedding": [float(len(text))]}
+
+
+def test_lookup_normalizes_whitespace_and_is_per_model():
+    cache = QueryEmbeddingCache(max_entries=10)
+    cache.set("model", "what is  this?", [1.0])
+
+    assert cache.get("model", " what is this? ") == [1.0]
+    assert cache.get("other model", "what is this?") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.set("model", "a", [1.0])
+    cache.set("model", "b", [2.0])
+    cache.get("model", "a")
+    cache.set("model", "c", [3.0])
+
+    assert cache.get("model", "b") is None
+    assert cache.get("model", "a") == [1.0]
+    assert cache.get("model", "c") == [3.0]
+    assert cache.stats()["size"] == 2
+
+
+def test_repeated_question_is_embedded_once():
+    text_embedder = CountingTextEmbedder()
+    cached_embedder = CachedTextEmbedder(text_embedder, QueryEmbeddingCache())
+
+    first = cached_embedder.run(text="question")["embedding"]
+    second = cached_embedder.run(text="question")["embedding"]
+
+    assert first == second == [8.0]
+    assert text_embedder.calls == 1
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import numpy as np
+from haystack.dataclasses import Document
+
+from app.services.reranker import CrossEncoderRanker
+
+
+class LengthCrossEncoder:
+    """Scores chunks by their length, after a delay."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def predict(self, pairs, batch_size):
+        time.sleep(self.delay)
+        return np.array([len(chunk) for _, chunk in pairs], dtype=float)
+
+
+def candidates() -> list[Document]:
+    return [Document(content="x" * length) for length in range(1, 11)]
+
+
+def ranker(delay: float) -> CrossEncoderRanker:
+    ranker = CrossEncoderRanker(top_k=3, timeout_ms=300, fallback_top_k=5)
+    ranker._cross_encoder = LengthCrossEncoder(delay)
+    return ranker
+
+
+def test_best_chunks_are_kept():
+    documents = ranker(0).run(query="q", documents=candidates())["documents"]
+
+    assert [len(doc.content) for doc in documents] == [10, 9, 8]
+
+
+def test_concurrent_questions_are_both_re_ranked():
+    cross_encoder_ranker = ranker(0.1)
+    results = []
+
+    def ask():
+        documents = cross_encoder_ranker.run(query="q", documents=candidates())
+        results.append([len(doc.content) for doc in documents["documents"]])
+
+    threads = [threading.Thread(target=ask) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [[10, 9, 8], [10, 9, 8]]
+    assert cross_encoder_ranker.timeouts == 0
+
+
+def test_timeout_keeps_the_retriever_top_k_until_scoring_is_done():
+    cross_encoder_ranker = ranker(0.5)
+
+    timed_out = cross_encoder_ranker.run(query="q", documents=candidates())
+    while_running = cross_encoder_ranker.run(query="q", documents=candidates())
+    time.sleep(0.5)
+    cross_encoder_ranker._cross_encoder.delay = 0
+    after = cross_encoder_ranker.run(query="q", documents=candidates())
+
+    assert cross_encoder_ranker.timeouts == 1
+    assert [len(doc.content) for doc in timed_out["documents"]] == [1, 2, 3, 4, 5]
+    assert [len(doc.content) for doc in while_running["documents"]] == [1, 2, 3, 4, 5]
+    assert [len(doc.content) for doc in after["documents"]] == [10, 9, 8]
@@ -0,0 +1,75 @@
+import pytest
+from haystack import Document
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+
+from app.services.retrievers import QdrantRetriever, dedupe_chunks
+
+
+@pytest.fixture
+def store():
+    store = QdrantDocumentStore(
+        location=":memory:", index="doc_collection", embedding_dim=2
+    )
+    store.count_documents()  # creates the collection and the client
+    return store
+
+
+def _chunk(source_file: str, split_id: int, folder: str, embedding: list[float]):
+    return Document(
+        content=f"{source_file} #{split_id}",
+        meta={"source_file": source_file, "split_id": split_id, "folder": folder},
+        embedding=embedding,
+    )
+
+
+def test_dedupe_keeps_the_first_copy_of_a_chunk():
+    first = _chunk("/home/me/notes/a.md", 0, "~/notes", [1, 0])
+    copy = _chunk("/home/me/notes/a.md", 0, "~", [1, 0])
+    other = _chunk("/home/me/notes/a.md", 1, "~", [1, 0])
+
+    assert dedupe_chunks([first, copy, other]) == [first, other]
+
+
+def test_chunks_without_split_are_told_apart_by_id():
+    docs = [Document(content="a"), Document(content="b")]
+
+    assert dedupe_chunks(docs) == docs
+
+
+def test_unscoped_search_returns_each_chunk_once(store):
+    store.write_documents(
+        [
+            _chunk("/home/me/notes/a.md", 0, "~/notes", [1, 0]),
+            _chunk("/home/me/notes/a.md", 0, "~", [1, 0]),
+            _chunk("/home/me/notes/a.md", 1, "~/notes", [0.9, 0.1]),
+            _chunk("/home/me/notes/a.md", 1, "~", [0.9, 0.1]),
+            _chunk("/home/me/b.md", 0, "~", [0, 1]),
+        ]
+    )
+    retriever = QdrantRetriever(
+        document_store=store, top_k=2, search_params=None, client=store._client
+    )
+
+    documents = retriever.run(query_embedding=[1, 0])["documents"]
+
+    assert [(doc.meta["source_file"], doc.meta["split_id"]) for doc in documents] == [
+        ("/home/me/notes/a.md", 0),
+        ("/home/me/notes/a.md", 1),
+    ]
+
+
+def test_folder_search_only_returns_chunks_of_the_folder(store):
+    store.write_documents(
+        [
+            _chunk("/home/me/notes/a.md", 0, "~/notes", [1, 0]),
+            _chunk("/home/me/notes/a.md", 0, "~", [1, 0]),
+        ]
+    )
+    retriever = QdrantRetriever(document_store=store, top_k=5, client=store._client)
+
+    documents = retriever.run(
+        query_embedding=[1, 0],
+        filters={"field": "meta.folder", "operator": "==", "value": "~/notes"},
+    )["documents"]
+
+    assert [doc.meta["folder"] for doc in documents] == ["~/notes"]
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from app.models.chat_models import User
+from app.services import settings_cache
+from app.services.settings_cache import SettingsCache
+
+
+@pytest.fixture
+def settings_version(monkeypatch):
+    """The settings version of a fake Redis, None when it's unavailable."""
+    state = {"version": 0}
+
+    async def get_settings_version():
+        return state["version"]
+
+    async def bump_settings_version():
+        if state["version"] is None:
+            return None
+        state["version"] += 1
+        return state["version"]
+
+    monkeypatch.setattr(settings_cache, "get_settings_version", get_settings_version)
+    monkeypatch.setattr(settings_cache, "bump_settings_version", bump_settings_version)
+    return state
+
+
+def user(**fields) -> User:
+    # not saved, no database needed
+    return User.model_construct(username="me", **fields)
+
+
+def test_stored_settings_are_returned_until_the_version_changes(settings_version):
+    cache = SettingsCache()
+    settings, version = asyncio.run(cache.get())
+    assert settings is None
+    cache.store(user(llm_model="model"), version)
+
+    settings, _ = asyncio.run(cache.get())
+    assert settings.llm_model == "model"
+
+    # another replica saved the settings
+    settings_version["version"] += 1
+    assert asyncio.run(cache.get())[0] is None
+
+
+def test_returned_settings_are_copies(settings_version):
+    cache = SettingsCache()
+    cache.store(user(llm_model="model"), 0)
+
+    asyncio.run(cache.get())[0].llm_model = "changed"
+
+    assert asyncio.run(cache.get())[0].llm_model == "model"
+
+
+def test_update_writes_through(settings_version):
+    cache = SettingsCache()
+    cache.store(user(llm_model="old"), 0)
+
+    asyncio.run(cache.update(user(llm_model="new")))
+
+    settings, version = asyncio.run(cache.get())
+    assert settings.llm_model == "new"
+    assert version == 1
+
+
+def test_nothing_is_cached_without_a_version(settings_version):
+    settings_version["version"] = None
+    cache = SettingsCache()
+    cache.store(user(), None)
+    asyncio.run(cache.update(user()))
+
+    assert asyncio.run(cache.get()) == (None, None)
@@ -0,0 +1,144 @@
+from bson import ObjectId
+
+from app.services import celery as sync_tasks
+from app.services.celery import _merge_shard_counts, finalize_folder_sync
+
+
+class FakeCollection:
+    """The few update operators the shard merge uses, on one sync status document."""
+
+    def __init__(self, document: dict):
+        self.document = document
+
+    def _apply(self, update: dict):
+        for field, value in update.get("$inc", {}).items():
+            self.document[field] += value
+        for field, value in update.get("$push", {}).items():
+            self.document[field].extend(value["$each"])
+        for field, value in update.get("$max", {}).items():
+            self.document[field] = max(self.document[field], value)
+        self.document.update(update.get("$set", {}))
+
+    def find_one_and_update(self, query, update, return_document=None):
+        assert query == {"_id": self.document["_id"]}
+        self._apply(update)
+        return dict(self.document)
+
+    def update_one(self, query, update):
+        assert query == {"_id": self.document["_id"]}
+        self._apply(update)
+
+
+def sync_status(**fields) -> dict:
+    document = {
+        "_id": ObjectId(),
+        "total_files": 10,
+        "processed_files": 0,
+        "skipped_files": 0,
+        "unchanged_files": 0,
+        "source_files": [],
+        "progress_percent": 0,
+    }
+    document.update(fields)
+    return document
+
+
+def test_shard_counts_are_added_up(monkeypatch):
+    collection = FakeCollection(sync_status())
+    monkeypatch.setattr(
+        sync_tasks.SyncStatusBunnet, "get_motor_collection", lambda: collection
+    )
+    sync_status_id = str(collection.document["_id"])
+
+    _merge_shard_counts(
+        sync_status_id,
+        {"processed_files": 3, "skipped_files": 1, "unchanged_files": 2},
+        ["/a", "/b", "/c"],
+    )
+    _merge_shard_counts(
+        sync_status_id,
+        {"processed_files": 2, "skipped_files": 0, "unchanged_files": 0},
+        ["/d", "/e"],
+    )
+
+    document = collection.document
+    assert (document["processed_files"], document["skipped_files"]) == (5, 1)
+    assert document["unchanged_files"] == 2
+    assert document["source_files"] == ["/a", "/b", "/c", "/d", "/e"]
+    assert document["progress_percent"] == 60
+
+
+def merge_nothing(monkeypatch, document: dict) -> dict:
+    collection = FakeCollection(document)
+    monkeypatch.setattr(
+        sync_tasks.SyncStatusBunnet, "get_motor_collection", lambda: collection
+    )
+    _merge_shard_counts(
+        str(document["_id"]),
+        {"processed_files": 0, "skipped_files": 0, "unchanged_files": 0},
+        [],
+    )
+    return collection.document
+
+
+def test_progress_stops_short_of_complete(monkeypatch):
+    document = merge_nothing(
+        monkeypatch, sync_status(processed_files=9, skipped_files=1)
+    )
+
+    # all files done, complete is only set by finalize_folder_sync
+    assert document["progress_percent"] == 99
+
+
+def test_progress_only_moves_forward(monkeypatch):
+    # a shard merging late, after others moved progress further
+    document = merge_nothing(
+        monkeypatch, sync_status(processed_files=5, progress_percent=80)
+    )
+
+    assert document["progress_percent"] == 80
+
+
+class FakeQuery:
+    def __init__(self, updates: list):
+        self.updates = updates
+
+    def update(self, update):
+        self.updates.append(update)
+        return self
+
+    def run(self):
+        pass
+
+
+class FakeSyncStatus:
+    id = "id"
+    updates = []
+
+    @classmethod
+    def find_one(cls, *args):
+        return FakeQuery(cls.updates)
+
+
+def test_finalize_completes_the_sync_and_invalidates_answers(monkeypatch):
+    bumped = []
+    monkeypatch.setattr(sync_tasks, "SyncStatusBunnet", FakeSyncStatus)
+    monkeypatch.setattr(sync_tasks, "bump_corpus_version", bumped.append)
+    FakeSyncStatus.updates = []
+
+    summary = finalize_folder_sync(
+        [
+            {"processed_files": 4, "skipped_files": 1, "unchanged_files": 2},
+            {"processed_files": 3, "skipped_files": 0, "unchanged_files": 3},
+        ],
+        "~/notes",
+        str(ObjectId()),
+    )
+
+    assert bumped == [["~/notes"]]
+    assert [update["$set"]["status"] for update in FakeSyncStatus.updates] == [
+        "COMPLETE"
+    ]
+    assert FakeSyncStatus.updates[0]["$set"]["progress_percent"] == 100
+    assert (summary["total"], summary["processed"], summary["skipped"]) == (8, 7, 1)
+    assert summary["shards"] == 2
@@ -0,0 +1,48 @@
+from app.services.sparse import (_term_index, sparse_document_embedding,
+                                 sparse_query_embedding, tokenize)
+
+
+def test_tokenize_keeps_identifiers_whole_and_in_parts():
+    assert tokenize("Error E-42 in config.yaml") == [
+        "error",
+        "e-42",
+        "e",
+        "42",
+        "in",
+        "config.yaml",
+        "config",
+        "yaml",
+    ]
+
+
+def test_tokenize_splits_snake_case_paths():
+    assert tokenize("src/my_module.py") == [
+        "src/my_module.py",
+        "src",
+        "my",
+        "module",
+        "py",
+    ]
+
+
+def test_query_terms_weigh_one_each():
+    embedding = sparse_query_embedding("hello hello world")
+
+    assert embedding.indices == sorted([_term_index("hello"), _term_index("world")])
+    assert embedding.values == [1.0, 1.0]
+
+
+def test_document_weights_saturate_with_term_frequency():
+    embedding = sparse_document_embedding("rare common common common")
+    weights = dict(zip(embedding.indices, embedding.values))
+
+    rare, common = weights[_term_index("rare")], weights[_term_index("common")]
+    assert rare < common < 3 * rare
+
+
+def test_longer_documents_weigh_terms_less():
+    short = sparse_document_embedding("needle")
+    long = sparse_document_embedding("needle " + "hay " * 300)
+
+    index = _term_index("needle")
+    assert dict(zip(long.indices, long.values))[index] < short.values[0]
@@ -0,0 +1,98 @@
+import threading
+import time
+from pathlib import Path
+
+from app.services import watcher
+from app.services.watcher import FolderChanges, _watch_inotify, _watch_polling
+
+
+def test_last_change_of_a_path_wins():
+    changes = FolderChanges()
+    changes.add_changed(Path("/notes/a.md"))
+    changes.add_deleted(Path("/notes/a.md"))
+    changes.add_deleted(Path("/notes/b.md"))
+    changes.add_changed(Path("/notes/b.md"))
+
+    assert changes.changed == {Path("/notes/b.md")}
+    assert changes.deleted == {Path("/notes/a.md")}
+
+
+def test_empty_changes_are_falsy_unless_a_rescan_is_needed():
+    changes = FolderChanges()
+    assert not changes
+
+    changes.rescan = True
+    assert changes
+
+
+def test_polling_diffs_snapshots(monkeypatch):
+    snapshots = iter(
+        [
+            ({Path("/n/a.md"): (1, 1.0), Path("/n/b.md"): (1, 1.0)}, set()),
+            # a modified, b deleted, c created
+            ({Path("/n/a.md"): (2, 2.0), Path("/n/c.md"): (1, 1.0)}, set()),
+            # nothing changed, nothing yielded
+            ({Path("/n/a.md"): (2, 2.0), Path("/n/c.md"): (1, 1.0)}, set()),
+            ({Path("/n/a.md"): (2, 2.0)}, set()),
+        ]
+    )
+    monkeypatch.setattr(watcher, "_snapshot", lambda *args: next(snapshots))
+    monkeypatch.setattr(watcher.time, "sleep", lambda seconds: None)
+    changes = _watch_polling("~/n", "/home")
+
+    first = next(changes)
+    assert first.changed == {Path("/n/a.md"), Path("/n/c.md")}
+    assert first.deleted == {Path("/n/b.md")}
+    second = next(changes)
+    assert not second.changed
+    assert second.deleted == {Path("/n/c.md")}
+
+
+def test_polling_keeps_files_of_unreadable_directories(monkeypatch):
+    snapshots = iter(
+        [
+            ({Path("/n/a.md"): (1, 1.0), Path("/n/locked/b.md"): (1, 1.0)}, set()),
+            ({Path("/n/a.md"): (2, 2.0)}, {"/n/locked"}),
+            # readable again, and unchanged
+            ({Path("/n/a.md"): (2, 2.0), Path("/n/locked/b.md"): (1, 1.0)}, set()),
+            ({Path("/n/locked/b.md"): (1, 1.0)}, set()),
+        ]
+    )
+    monkeypatch.setattr(watcher, "_snapshot", lambda *args: next(snapshots))
+    monkeypatch.setattr(watcher.time, "sleep", lambda seconds: None)
+    changes = _watch_polling("~/n", "/home")
+
+    first = next(changes)
+    assert first.changed == {Path("/n/a.md")}
+    assert not first.deleted
+    # b.md is not reported as created again once readable
+    second = next(changes)
+    assert not second.changed
+    assert second.deleted == {Path("/n/a.md")}
+
+
+def test_inotify_changes_are_debounced_into_one_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "WATCH_DEBOUNCE_SECONDS", 0.3)
+    monkeypatch.setattr(watcher, "WATCH_MAX_DELAY_SECONDS", 10)
+    (tmp_path / "old.md").write_text("old")
+    changes = _watch_inotify(tmp_path, ignore_patterns=["*.tmp"])
+
+    def edit_files():
+        # let the watches be added first
+        time.sleep(0.2)
+        (tmp_path / "a.md").write_text("a")
+        (tmp_path / "scratch.tmp").write_text("ignored")
+        time.sleep(0.1)
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "old.md").unlink()
+
+    editor = threading.Thread(target=edit_files)
+    editor.start()
+    try:
+        batch = next(changes)
+    finally:
+        editor.join()
+        changes.close()
+
+    assert batch.changed == {tmp_path / "a.md", tmp_path / "sub"}
+    assert batch.deleted == {tmp_path / "old.md"}
@@ -0,0 +1,63 @@
+import pytest
+
+from app.services import celery as sync_tasks
+from app.services import pipelines
+from app.services.celery import preload_embedder_model
+from app.services.pipelines import embedder_model, resolve_embedder_model
+
+
+class FakeEmbedder:
+    warmed = []
+
+    def __init__(self, model):
+        self.model = model
+
+    def warm_up(self):
+        FakeEmbedder.warmed.append(self.model)
+
+
+@pytest.fixture
+def warmed(monkeypatch):
+    """Models warmed up by the worker preload, and the number of gc freezes."""
+    FakeEmbedder.warmed = []
+    freezes = []
+    monkeypatch.setattr(
+        sync_tasks, "SentenceTransformersDocumentEmbedder", FakeEmbedder
+    )
+    monkeypatch.setattr(sync_tasks.gc, "freeze", lambda: freezes.append(True))
+    return FakeEmbedder.warmed, freezes
+
+
+def test_model_is_not_preloaded_when_disabled(monkeypatch, warmed):
+    monkeypatch.setattr(sync_tasks, "CELERY_PRELOAD_MODEL", False)
+
+    preload_embedder_model()
+
+    assert warmed == ([], [])
+
+
+def test_model_is_preloaded_before_forking(monkeypatch, warmed):
+    monkeypatch.setattr(sync_tasks, "CELERY_PRELOAD_MODEL", True)
+
+    preload_embedder_model()
+
+    assert warmed == ([embedder_model], [True])
+
+
+def test_model_saved_in_the_model_dir_is_loaded_from_there(monkeypatch, tmp_path):
+    (tmp_path / embedder_model).mkdir(parents=True)
+    monkeypatch.setattr(pipelines, "EMBEDDER_MODEL_DIR", str(tmp_path))
+
+    assert resolve_embedder_model() == str(tmp_path / embedder_model)
+
+
+def test_model_missing_from_the_model_dir_falls_back_to_the_hub(monkeypatch, tmp_path):
+    monkeypatch.setattr(pipelines, "EMBEDDER_MODEL_DIR", str(tmp_path))
+
+    assert resolve_embedder_model() == embedder_model
+
+
+def test_hub_model_without_a_model_dir(monkeypatch):
+    monkeypatch.setattr(pipelines, "EMBEDDER_MODEL_DIR", None)
+
+    assert resolve_embedder_model() == embedder_model
@@ -82,6 +82,11 @@ export function AppChatView() {
                         </ChatBubbleMessage>
                     </ChatBubble>)
             }
+            { chatStore.olderMessagesCursor && (
+                <Button variant="outline" size="sm" className="self-center" onClick={()=>chatStore.getOlderMessages()}>
+                    Load earlier messages
+                </Button>
+            )}
             {
                 chatStore.messageList.map((msgObj, idx) => {
                     const variantStr = msgObj.from === "US" ? 'sent' : 'received'
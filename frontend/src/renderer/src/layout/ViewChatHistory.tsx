@@ -3,6 +3,7 @@ import { useEffect, useState } from 'react'
 import useChatHistoryStore from "@renderer/store/chatHistoryStore"
 import useChatStore from "@renderer/store/chatStore"
 import { Skeleton } from "@renderer/shared/components/ui/skeleton"
+import { Button } from "@renderer/shared/components/ui/button"
 import {
     Breadcrumb,
     BreadcrumbEllipsis,
@@ -29,12 +30,15 @@ export function ChatHistoryView({ closeSideView }) {
     const [timezone, setTimezone] = useState<string>(ssTimezone)
 
     useEffect(()=>{
+        // summaries still being generated are pushed over this socket
+        chatHistoryStore.connectSummarySocket()
         if(!chatHistoryStore.chatHistoryLoaded){
             chatHistoryStore.getChatHistory()
         }
         if(!settingsStore.settingsLoaded){
             settingsStore.fetchSettings()
         }
+        return () => chatHistoryStore.disconnectSummarySocket()
     }, [])
 
     useEffect(()=>{
@@ -74,7 +78,11 @@ export function ChatHistoryView({ closeSideView }) {
                 <div key={chatRec.conversation_id} className="hover:bg-slate-200 border-solid border-2 rounded-lg p-2 my-4 w-[calc(100%-32px)] flex flex-row justify-between items-start" style={{ marginTop: '12px'}}>
                     <div>
                         <div className="text-sm italic">{new Date(chatRec.created_at).toLocaleString(locale, {timeZone: timezone})}</div>
-                        <div className="text-md h-[26px] overflow-y-hidden overflow-x-clip">{chatRec.summary}</div>
+                        {chatRec.summary_pending ? (
+                            <Skeleton className="h-4 w-[calc(60%)]" style={{ marginTop: '5px'}} />
+                        ) : (
+                            <div className="text-md h-[26px] overflow-y-hidden overflow-x-clip">{chatRec.summary}</div>
+                        )}
                     </div>
                     <Breadcrumb>
                         <BreadcrumbItem>
@@ -92,6 +100,11 @@ export function ChatHistoryView({ closeSideView }) {
                     </Breadcrumb>
                 </div>
             ))}
+            {!chatHistoryStore.chatHistoryInflight && chatHistoryStore.chatHistoryNextCursor && (
+                <Button variant="outline" size="sm" onClick={()=>chatHistoryStore.getMoreChatHistory()}>
+                    Load more
+                </Button>
+            )}
         </div>
     </>
 }
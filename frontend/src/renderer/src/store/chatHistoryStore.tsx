@@ -3,6 +3,7 @@ import axios from 'axios'
 
 type ChatRecordType = {
     summary: string | null | undefined
+    summary_pending?: boolean  // generated in the background, pushed over the summary socket
     created_at: number
     conversation_id: string
 }
@@ -11,15 +12,25 @@ interface ChatHistoryStore {
     chatHistoryInflight: boolean
     chatHistoryLoaded: boolean
     chatHistory: Array<ChatRecordType>
+    chatHistoryNextCursor: string | null  // cursor of the next (older) page, null on the last page
+    summarySocket: WebSocket | null
+    summarySocketRetry: ReturnType<typeof setTimeout> | null  // reconnection of a lost socket
 
     getChatHistory: () => Promise<void>
+    getMoreChatHistory: () => Promise<void>
     deleteChatHistory: (conversationId: string) => Promise<void>
+    refreshPendingSummaries: () => Promise<void>
+    connectSummarySocket: () => void
+    disconnectSummarySocket: () => void
 }
 
 export const useChatHistoryStore = create<ChatHistoryStore>()((set, get) => ({
     chatHistoryInflight: false,
     chatHistoryLoaded: false,
     chatHistory: [],
+    chatHistoryNextCursor: null,
+    summarySocket: null,
+    summarySocketRetry: null,
 
     getChatHistory: () => {
         set({chatHistoryInflight: true})
@@ -27,13 +38,29 @@ export const useChatHistoryStore = create<ChatHistoryStore>()((set, get) => ({
         return axios.get(`${import.meta.env.VITE_APP_API_BASE_URL}/chat_history`)
             .then(response=>{
                 set({
-                    chatHistory: response.data,
+                    chatHistory: response.data.results,
+                    chatHistoryNextCursor: response.data.next_cursor,
                     chatHistoryLoaded: true,
                     chatHistoryInflight: false
                 })
             })
     },
 
+    getMoreChatHistory: () => {
+        const cursor = get().chatHistoryNextCursor
+        if(!cursor){
+            return Promise.resolve()
+        }
+        // todo: error handling
+        return axios.get(`${import.meta.env.VITE_APP_API_BASE_URL}/chat_history`, { params: { cursor } })
+            .then(response=>{
+                set({
+                    chatHistory: get().chatHistory.concat(response.data.results),
+                    chatHistoryNextCursor: response.data.next_cursor
+                })
+            })
+    },
+
     deleteChatHistory: (conversationId: string) => {
         return axios.delete(`${import.meta.env.VITE_APP_API_BASE_URL}/chat_history/${conversationId}`)
             .then(response=>{
@@ -43,6 +70,83 @@ export const useChatHistoryStore = create<ChatHistoryStore>()((set, get) => ({
                 }
                 // todo: error handling
             })
+    },
+
+    refreshPendingSummaries: () => {
+        // summaries generated while the socket was closed are not pushed again, fetch them
+        if(!get().chatHistory.some((chatRec)=>chatRec.summary_pending)){
+            return Promise.resolve()
+        }
+        // todo: error handling
+        return axios.get(`${import.meta.env.VITE_APP_API_BASE_URL}/chat_history`)
+            .then(response=>{
+                const latest = new Map<string, ChatRecordType>(
+                    response.data.results.map((chatRec: ChatRecordType)=>[chatRec.conversation_id, chatRec])
+                )
+                set({
+                    chatHistory: get().chatHistory.map((chatRec)=>(
+                        chatRec.summary_pending && latest.has(chatRec.conversation_id)
+                            ? {...chatRec, ...latest.get(chatRec.conversation_id)}
+                            : chatRec
+                    ))
+                })
+            })
+    },
+
+    connectSummarySocket: () => {
+        if(get().summarySocket){
+            return
+        }
+        const socket = new WebSocket(`${import.meta.env.VITE_APP_WS_BASE_URL}/ws/chat_history`)
+        socket.onopen = () => {
+            get().refreshPendingSummaries()
+        }
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data)
+            if(data.status === "summary"){
+                // fill in the placeholder of the conversation
+                set({
+                    chatHistory: get().chatHistory.map((chatRec)=>(
+                        chatRec.conversation_id === data.conversation_id
+                            ? {...chatRec, summary: data.summary, summary_pending: false}
+                            : chatRec
+                    ))
+                })
+            } else if(data.status === "summary_error"){
+                // not generated this time, clear the placeholder; the next history fetch tries again
+                set({
+                    chatHistory: get().chatHistory.map((chatRec)=>(
+                        chatRec.conversation_id === data.conversation_id
+                            ? {...chatRec, summary_pending: false}
+                            : chatRec
+                    ))
+                })
+            }
+        }
+        socket.onclose = () => {
+            if(get().summarySocket !== socket){
+                // closed by disconnectSummarySocket
+                return
+            }
+            // lost, e.g. the API restarted: reconnect, pending summaries are fetched once connected
+            set({
+                summarySocket: null,
+                summarySocketRetry: setTimeout(()=>{
+                    set({ summarySocketRetry: null })
+                    get().connectSummarySocket()
+                }, 3000)
+            })
+        }
+        set({ summarySocket: socket })
+    },
+
+    disconnectSummarySocket: () => {
+        const { summarySocket: socket, summarySocketRetry } = get()
+        if(summarySocketRetry){
+            clearTimeout(summarySocketRetry)
+        }
+        set({ summarySocket: null, summarySocketRetry: null })
+        socket?.close()
     }
 }))
 
@@ -8,18 +8,42 @@ type messageListType = {
     text: string
 }
 
+// question and answer of each message record, in the order of the records
+const toMessageList = (messages: Array<{query: string, response: string}>): Array<messageListType> => {
+    const messageList: Array<messageListType> = []
+    for(const msgRec of messages){
+        if(msgRec.query){
+            messageList.push({
+                from: "US",
+                text: msgRec.query
+            })
+        }
+        if(msgRec.response){
+            messageList.push({
+                from: "AI",
+                text: msgRec.response
+            })
+        }
+    }
+    return messageList
+}
+
 interface ChatStore {
     conversationId: string | null | undefined
     messageList: Array<messageListType>
+    olderMessagesCursor: string | null  // cursor of the earlier messages of the conversation, null if all loaded
     messageInflight: boolean
+    answerStreaming: boolean
 
     socket: WebSocket | null
     socketIsConnected: boolean
     socketError: boolean
 
     addMessageToList: (message: string, from: "AI" | "US") => void
+    appendToLastMessage: (token: string) => void
     startNewConversation: () => void
     getConversationMessages: (conversationId: string | null | undefined) => Promise<void>
+    getOlderMessages: () => Promise<void>
     connectSocket: () => void
     disconnectSocket: () => void
     sendMessage: (message: string) => void
@@ -28,7 +52,9 @@ interface ChatStore {
 export const useChatStore = create<ChatStore>()((set, get) => ({
     conversationId: null,
     messageList: [],
+    olderMessagesCursor: null,
     messageInflight: false,
+    answerStreaming: false,
     socket: null,
     socketIsConnected: false,
     socketError: false,
@@ -43,11 +69,20 @@ export const useChatStore = create<ChatStore>()((set, get) => ({
         set({ messageList: newMsgList })
     },
 
+    appendToLastMessage: (token: string)=>{
+        const msgList = get().messageList
+        const lastMessage = msgList[msgList.length - 1]
+        const newMsgList = msgList.slice(0, -1).concat([{...lastMessage, text: lastMessage.text + token}])
+        set({ messageList: newMsgList })
+    },
+
     startNewConversation: () => {
         set({
             conversationId: null,
             messageList: [],
-            messageInflight: false
+            olderMessagesCursor: null,
+            messageInflight: false,
+            answerStreaming: false
         })
     },
 
@@ -61,36 +96,40 @@ export const useChatStore = create<ChatStore>()((set, get) => ({
         return await axios.get(`${import.meta.env.VITE_APP_API_BASE_URL}/chat_history/${inputConversationId}`)
             .then(response=>{
                 if(response.status === 200){
-                    const convoMessageList: Array<messageListType> = []
-                    for(const msgRec of response.data.messages){
-                        if(msgRec.query){
-                            convoMessageList.push({
-                                from: "US",
-                                text: msgRec.query
-                            })
-                        }
-                        if(msgRec.response){
-                            convoMessageList.push({
-                                from: "AI",
-                                text: msgRec.response
-                            })
-                        }
-                    }
                     set({
                         conversationId: response.data.conversation_id,
-                        messageList: convoMessageList,
+                        messageList: toMessageList(response.data.messages),
+                        olderMessagesCursor: response.data.next_cursor,
                         messageInflight: false
                     })                    
                 } else {
                     set({
                         conversationId: inputConversationId,
                         messageList: [],
+                        olderMessagesCursor: null,
                         messageInflight: false
                     })
                 }
             })
     },
 
+    getOlderMessages: async () => {
+        const { conversationId, olderMessagesCursor: cursor } = get()
+        if(!conversationId || !cursor){
+            return
+        }
+        // todo: error handling
+        return await axios.get(`${import.meta.env.VITE_APP_API_BASE_URL}/chat_history/${conversationId}`, { params: { cursor } })
+            .then(response=>{
+                if(response.status === 200 && response.data.conversation_id === get().conversationId){
+                    set({
+                        messageList: toMessageList(response.data.messages).concat(get().messageList),
+                        olderMessagesCursor: response.data.next_cursor
+                    })
+                }
+            })
+    },
+
     connectSocket: () => {
         const wsUrl = `${import.meta.env.VITE_APP_WS_BASE_URL}/ws/chat`
         const socket = new WebSocket(wsUrl)
@@ -102,12 +141,32 @@ export const useChatStore = create<ChatStore>()((set, get) => ({
 
         socket.onmessage = (event) => {
             const data = JSON.parse(event.data)
-            if(data.status === "complete"){
-                set({messageInflight: false, conversationId: data.conversation_id})
-                get().addMessageToList(data.answer, "AI")
+            if(data.status === "streaming"){
+                // answer tokens as they are generated, shown in the AI message of this answer
+                if(!get().answerStreaming){
+                    set({messageInflight: false, answerStreaming: true, conversationId: data.conversation_id})
+                    get().addMessageToList(data.token, "AI")
+                }else{
+                    get().appendToLastMessage(data.token)
+                }
+            }else if(data.status === "complete"){
+                const streamed = get().answerStreaming
+                set({messageInflight: false, answerStreaming: false, conversationId: data.conversation_id})
+                if(streamed){
+                    // replace the streamed text with the final answer
+                    const msgList = get().messageList
+                    set({ messageList: msgList.slice(0, -1).concat([{from: "AI", text: data.answer}]) })
+                }else{
+                    get().addMessageToList(data.answer, "AI")
+                }
             }else if(data.status === "error"){
-                set({messageInflight: false, conversationId: data.conversation_id})
-                get().addMessageToList(data.error, "AI")
+                const streamed = get().answerStreaming
+                set({messageInflight: false, answerStreaming: false, conversationId: data.conversation_id})
+                if(streamed){
+                    get().appendToLastMessage(`\n\n${data.error}`)
+                }else{
+                    get().addMessageToList(data.error, "AI")
+                }
             }
             // note: UI implemented loading separately, don't need to display "thinking" from backend
         }